@@ -0,0 +1,294 @@
+import asyncio
+import threading
+from stream_parser import aiter_sse_json, aiter_ndjson, chat_completion_delta
+from providers import CONTEXT_REUSE, VIRTUAL
+from messages import normalize_messages, ensure_user_turn
+from usage import empty_usage
+from cancellation import CancelToken, RequestCancelled, StreamTimeout, watch_astream
+from resilience import reported_tokens
+
+_aiohttp = None
+
+def load_aiohttp():
+    global _aiohttp
+    if _aiohttp is None:
+        try:
+            import aiohttp
+            _aiohttp = aiohttp
+        except ImportError:
+            _aiohttp = False
+    return _aiohttp or None
+
+class EventLoopThread:
+    def __init__(self, name="async-streams"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        if not self.thread.is_alive():
+            self.thread.start()
+        return self
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+class AsyncModelInteractions:
+    def __init__(self, model_interactions):
+        self.model_interactions = model_interactions
+        self.config = model_interactions.config
+        self.connection_pool = model_interactions.connection_pool
+        self.sessions = {}
+        self.anthropic_client = None
+        self.openai_client = None
+        self.async_streams = {
+            "Ollama": self.get_ollama_response_stream,
+            "Anthropic": self.get_anthropic_response_stream,
+            "OpenAI": self.get_openai_response_stream,
+            "Gemini": self.get_gemini_response_stream
+        }
+
+    def _session(self, provider):
+        session = self.sessions.get(provider)
+        if session is None or session.closed:
+            settings = self.connection_pool.settings_for(provider)
+            aiohttp = load_aiohttp()
+            connector = aiohttp.TCPConnector(
+                limit=settings["async_limit"],
+                force_close=not settings["keep_alive"]
+            )
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=settings["connect_timeout"],
+                sock_read=settings["read_timeout"]
+            )
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self.sessions[provider] = session
+        return session
+
+    # The token closes the blocking stream's socket when the coroutine is cancelled or times
+    # out, so the executor thread stuck in next() is released instead of reading on.
+    async def _iterate_in_executor(self, start_stream):
+        loop = asyncio.get_running_loop()
+        cancel_token = CancelToken()
+        iterator = iter(start_stream(cancel_token))
+        done = object()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, iterator, done)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            cancel_token.cancel(RequestCancelled("Stream closed"))
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                try:
+                    await loop.run_in_executor(None, close)
+                except (ValueError, RequestCancelled):
+                    pass
+
+    async def get_chat_completions_stream(self, provider, url, headers, model, prompt, max_tokens, temperature,
+                                          on_usage=None):
+        usage = empty_usage()
+        async with self._session(provider).post(
+            url,
+            headers=headers,
+            json=self.model_interactions.chat_completions_body(model, prompt, max_tokens, temperature)
+        ) as response:
+            response.raise_for_status()
+            async for data in aiter_sse_json(response.content.iter_any()):
+                self.model_interactions.chat_completions_usage(data, usage)
+                chunk = chat_completion_delta(data)
+                if chunk:
+                    yield chunk
+        if on_usage:
+            on_usage(usage)
+
+    async def get_ollama_response_stream(self, model, prompt, max_tokens, temperature, conversation_id=None,
+                                         on_usage=None):
+        if load_aiohttp() is None:
+            async for chunk in self._iterate_in_executor(
+                    lambda token: self.model_interactions.get_ollama_response_stream(
+                        model, prompt, max_tokens, temperature, conversation_id, on_usage, token)):
+                yield chunk
+            return
+
+        usage = empty_usage()
+        response_parts = []
+        async with self._session('ollama').post(
+            self.model_interactions.ollama_url(prompt),
+            json=self.model_interactions.ollama_request_body(model, prompt, max_tokens, temperature, conversation_id)
+        ) as response:
+            response.raise_for_status()
+            async for json_line in aiter_ndjson(response.content.iter_any(),
+                                                on_error=lambda line: print(f"Error decoding JSON: {line}")):
+                chunk = self.model_interactions.ollama_chunk(json_line, usage)
+                if chunk:
+                    response_parts.append(chunk)
+                    yield chunk
+                if json_line.get('done') and isinstance(prompt, str):
+                    self.model_interactions.ollama_contexts.remember(
+                        model, conversation_id, prompt, "".join(response_parts), json_line.get('context'))
+        if on_usage:
+            on_usage(usage)
+
+    async def get_anthropic_response_stream(self, model, prompt, max_tokens, temperature, on_usage=None):
+        import anthropic
+        if not hasattr(anthropic, 'AsyncAnthropic'):
+            async for chunk in self._iterate_in_executor(
+                    lambda token: self.model_interactions.get_anthropic_response_stream(
+                        model, prompt, max_tokens, temperature, on_usage, token)):
+                yield chunk
+            return
+
+        if self.anthropic_client is None:
+            self.anthropic_client = anthropic.AsyncAnthropic(
+                api_key=self.model_interactions.require_api_key('anthropic'),
+                timeout=self.model_interactions.sdk_timeout('anthropic'))
+        response = await self.anthropic_client.messages.create(
+            **self.model_interactions.anthropic_request(model, prompt, max_tokens, temperature))
+        usage = empty_usage()
+        async for event in response:
+            text = self.model_interactions.anthropic_event(event, usage)
+            if text:
+                yield text
+        if on_usage:
+            on_usage(usage)
+
+    async def get_openai_response_stream(self, model, prompt, max_tokens, temperature, on_usage=None):
+        import openai
+        if not hasattr(openai, 'AsyncOpenAI'):
+            async for chunk in self._iterate_in_executor(
+                    lambda token: self.model_interactions.get_openai_response_stream(
+                        model, prompt, max_tokens, temperature, on_usage, token)):
+                yield chunk
+            return
+
+        if self.openai_client is None:
+            self.openai_client = openai.AsyncOpenAI(api_key=self.model_interactions.require_api_key('openai'),
+                                                    timeout=self.model_interactions.sdk_timeout('openai'))
+        response = await self.openai_client.chat.completions.create(
+            model=model,
+            messages=ensure_user_turn(normalize_messages(prompt)),
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        usage = empty_usage()
+        async for chunk in response:
+            content = self.model_interactions.openai_chunk(chunk, usage)
+            if content is not None:
+                yield content
+        if on_usage:
+            on_usage(usage)
+
+    async def get_gemini_response_stream(self, model, prompt, max_tokens, temperature, on_usage=None):
+        loop = asyncio.get_running_loop()
+        gemini_model, contents, generation_config = await loop.run_in_executor(
+            None, self.model_interactions.gemini_request, model, prompt, max_tokens, temperature)
+        if not hasattr(gemini_model, 'generate_content_async'):
+            async for chunk in self._iterate_in_executor(
+                    lambda token: self.model_interactions.get_gemini_response_stream(
+                        model, prompt, max_tokens, temperature, on_usage, token)):
+                yield chunk
+            return
+
+        response = await gemini_model.generate_content_async(
+            contents,
+            generation_config=generation_config,
+            stream=True
+        )
+        usage = empty_usage()
+        async for chunk in response:
+            text = self.model_interactions.gemini_chunk(chunk, usage)
+            if text:
+                yield text
+        if on_usage:
+            on_usage(usage)
+
+    async def get_model_response_stream(self, model, prompt, max_tokens=1000, temperature=0.7, use_cache=True,
+                                        conversation_id=None, metrics=None):
+        try:
+            adapter, model_id = self.model_interactions.registry.resolve(model)
+        except (KeyError, ValueError):
+            yield "Invalid model selected."
+            return
+
+        response_cache = self.model_interactions.response_cache
+        cache_key = None
+        if use_cache and response_cache.should_cache(temperature):
+            cache_key = response_cache.key(str(model_id), prompt, max_tokens, temperature)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                for chunk in cached:
+                    yield chunk
+                return
+
+        telemetry = self.model_interactions.telemetry
+        if metrics is None:
+            metrics = telemetry.start(str(model_id))
+        reported = {}
+        stream_options = {'on_usage': self.model_interactions.usage_recorder(str(model_id), metrics, reported)}
+        if conversation_id is not None and adapter.supports(CONTEXT_REUSE):
+            stream_options['conversation_id'] = conversation_id
+
+        def start_stream():
+            stream_function = self.async_streams.get(adapter.prefix)
+            if stream_function is not None:
+                return stream_function(model_id.name, prompt, max_tokens, temperature, **stream_options)
+            if adapter.endpoint is not None and load_aiohttp() is not None:
+                return self.get_chat_completions_stream(
+                    adapter.key, adapter.endpoint['url'], adapter.endpoint['headers'],
+                    model_id.name, prompt, max_tokens, temperature, stream_options['on_usage'])
+            return self._iterate_in_executor(
+                lambda token: adapter.stream(model_id.name, prompt, max_tokens, temperature, cancel_token=token,
+                                             **stream_options))
+
+        if adapter.supports(VIRTUAL):
+            stream = start_stream()
+        else:
+            settings = self.connection_pool.settings_for(adapter.key)
+
+            def start_watched_stream():
+                reported.clear()
+                return watch_astream(start_stream(), settings["first_token_timeout"], settings["idle_timeout"],
+                                     str(model_id))
+
+            stream = self.model_interactions.resilience.astream(
+                adapter.key, start_watched_stream, self.model_interactions.request_tokens(prompt, max_tokens),
+                lambda: reported_tokens(reported))
+
+        chunks = []
+        status = "cancelled"
+        try:
+            async for chunk in stream:
+                metrics.chunk(chunk)
+                chunks.append(chunk)
+                yield chunk
+            status = "ok"
+        except StreamTimeout:
+            status = "timeout"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            telemetry.finish(metrics, status)
+
+        if cache_key is not None:
+            response_cache.put(cache_key, str(model_id), chunks)
+
+    async def close(self):
+        sessions = list(self.sessions.values())
+        self.sessions = {}
+        for session in sessions:
+            await session.close()
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from messages import role_messages
+from models import ModelInteractions
+
+DEFAULT_BATCH_SETTINGS = {
+    "concurrency": 8,
+    "provider_limits": {"Ollama": 1},
+    "max_buffered_rows": 1000,
+    "max_tokens": 1000,
+    "temperature": 0.7
+}
+
+def read_rows(path):
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                print(f"Skipping line {line_number} of {path}: {e}", file=sys.stderr)
+                continue
+            if not isinstance(row, dict):
+                print(f"Skipping line {line_number} of {path}: expected a JSON object", file=sys.stderr)
+                continue
+            yield str(row.get("id", line_number)), row
+
+# Only rows that finished successfully count as done; failed rows are retried on the next run.
+# A last line cut short by an interrupted run does not parse and is ignored.
+def load_completed(path):
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row.get("status") == "ok":
+                completed.add(str(row["id"]))
+    return completed
+
+def open_output(path):
+    needs_newline = False
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    output = open(path, "a", encoding="utf-8")
+    if needs_newline:
+        output.write("\n")
+    return output
+
+class BatchRunner:
+    def __init__(self, model_interactions, settings=None):
+        settings = dict(DEFAULT_BATCH_SETTINGS, **(settings or {}))
+        self.model_interactions = model_interactions
+        self.concurrency = max(settings["concurrency"], 1)
+        self.provider_limits = settings["provider_limits"]
+        self.max_buffered_rows = max(settings["max_buffered_rows"], self.concurrency)
+        self.max_tokens = settings["max_tokens"]
+        self.temperature = settings["temperature"]
+
+    def limit(self, provider):
+        return max(self.provider_limits.get(provider, self.concurrency), 1)
+
+    def row_provider(self, row):
+        try:
+            adapter, _ = self.model_interactions.registry.resolve(row.get("model", ""))
+        except (KeyError, ValueError):
+            return None
+        return adapter.prefix
+
+    def build_prompt(self, row):
+        if "messages" in row:
+            return row["messages"]
+        if row.get("role"):
+            return role_messages(row["role"], row["prompt"])
+        return row["prompt"]
+
+    def run_row(self, row_id, row):
+        model = row.get("model", "")
+        result = {"id": row_id, "model": model, "status": "error", "response": "", "error": None, "metrics": None}
+        try:
+            adapter, model_id = self.model_interactions.registry.resolve(model)
+            prompt = self.build_prompt(row)
+        except (KeyError, ValueError) as e:
+            result["error"] = str(e)
+            return result
+
+        metrics = self.model_interactions.telemetry.start(str(model_id))
+        try:
+            result["response"] = "".join(self.model_interactions.get_model_response_stream(
+                str(model_id), prompt,
+                max_tokens=row.get("max_tokens", self.max_tokens),
+                temperature=row.get("temperature", self.temperature),
+                metrics=metrics))
+            result["status"] = "ok"
+        except Exception as e:
+            result["error"] = str(e)
+        result["metrics"] = metrics.result
+        return result
+
+    # Rows wait in one queue per provider and a row only goes to a worker once its provider has
+    # a free slot, so workers never sit blocked behind a limited provider while rows for other
+    # providers are waiting. Reading stops while max_buffered_rows are queued, so a huge input
+    # file is streamed, not loaded.
+    def run(self, rows, output, completed=()):
+        counts = {"ok": 0, "error": 0, "skipped": 0}
+        seen = set(completed)
+        rows = iter(rows)
+        queues = {}
+        active = {}
+        running = {}
+        buffered = 0
+        exhausted = False
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        def dispatch():
+            nonlocal buffered
+            for provider, queue in queues.items():
+                while queue and len(running) < self.concurrency and active.get(provider, 0) < self.limit(provider):
+                    row_id, row = queue.popleft()
+                    buffered -= 1
+                    active[provider] = active.get(provider, 0) + 1
+                    running[executor.submit(self.run_row, row_id, row)] = provider
+
+        try:
+            while True:
+                dispatch()
+                while not exhausted and len(running) < self.concurrency and buffered < self.max_buffered_rows:
+                    try:
+                        row_id, row = next(rows)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if row_id in seen:
+                        counts["skipped"] += 1
+                        continue
+                    seen.add(row_id)
+                    queues.setdefault(self.row_provider(row), deque()).append((row_id, row))
+                    buffered += 1
+                    dispatch()
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    active[running.pop(future)] -= 1
+                self.write_results(done, output, counts)
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return counts
+
+    def write_results(self, futures, output, counts):
+        for future in futures:
+            result = future.result()
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            counts[result["status"]] += 1
+            metrics = result["metrics"] or {}
+            ttft = metrics.get("ttft_seconds")
+            timing = f" ttft={ttft:.2f}s total={metrics['total_seconds']:.2f}s" if ttft is not None else ""
+            print(f"{result['id']} {result['model']}: {result['status']}{timing}"
+                  + (f" ({result['error']})" if result["error"] else ""), file=sys.stderr)
+
+def parse_provider_limits(values):
+    limits = {}
+    for value in values or []:
+        provider, separator, limit = value.rpartition("=")
+        if not separator or not provider:
+            raise argparse.ArgumentTypeError(f"Provider limit must look like Provider=N, got {value!r}")
+        limits[provider] = int(limit)
+    return limits
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the configured models.")
+    parser.add_argument("input", help="JSONL file with one {id, model, prompt|messages, role, max_tokens, temperature} object per line")
+    parser.add_argument("output", help="JSONL file to append results to; rows already completed there are skipped")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--provider-limit", action="append", metavar="PROVIDER=N",
+                        help="maximum concurrent requests for one provider, can be repeated")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as config_file:
+        config = json.load(config_file)
+    settings = dict(DEFAULT_BATCH_SETTINGS, **config.get("BATCH", {}))
+    settings["provider_limits"] = dict(settings["provider_limits"], **parse_provider_limits(args.provider_limit))
+    if args.concurrency:
+        settings["concurrency"] = args.concurrency
+
+    model_interactions = ModelInteractions(config)
+    runner = BatchRunner(model_interactions, settings)
+    completed = load_completed(args.output)
+    start = time.monotonic()
+    try:
+        with open_output(args.output) as output:
+            counts = runner.run(read_rows(args.input), output, completed)
+    except KeyboardInterrupt:
+        print("Interrupted; run again with the same output file to resume.", file=sys.stderr)
+        return 130
+    finally:
+        model_interactions.close()
+
+    print(f"{counts['ok']} ok, {counts['error']} failed, {counts['skipped']} already done "
+          f"in {time.monotonic() - start:.1f}s", file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+class RequestCancelled(Exception):
+    pass
+
+class StreamTimeout(TimeoutError):
+    pass
+
+# A token is handed down to whatever does the blocking I/O for one request. Cancelling it runs
+# the registered closers right away (closing the socket or SDK stream), so a reader stuck in
+# recv() wakes up instead of waiting for the next chunk. Child tokens are cancelled with their
+# parent but can also time out on their own.
+class CancelToken:
+    def __init__(self, parent=None):
+        self.event = threading.Event()
+        self.reason = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+        self.detach = lambda: None
+        if parent is not None:
+            self.detach = parent.on_cancel(lambda: self.cancel(parent.reason))
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self, reason=None):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.reason = reason if reason is not None else RequestCancelled("Request cancelled")
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error while cancelling a request: {e}")
+
+    def on_cancel(self, callback):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def wait(self, timeout):
+        return self.event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise self.reason
+
+def close_on_cancel(cancel_token, closer):
+    if cancel_token is not None and closer is not None:
+        cancel_token.on_cancel(closer)
+
+# Connecting and waiting for the response headers block inside requests or the SDK, where
+# there is no socket to close yet. start() runs on a helper thread instead, so a cancel (Stop or
+# a first-token timeout) releases the caller at once. A response that turns up after that is
+# closed unread; one that arrives first gets close registered for the rest of the request.
+def start_cancellable(cancel_token, start, close=None):
+    if cancel_token is None:
+        return start()
+    result = {}
+    lock = threading.Lock()
+    finished = threading.Event()
+
+    def run():
+        try:
+            value = start()
+        except BaseException as e:
+            value, error = None, e
+        else:
+            error = None
+        with lock:
+            if result.get("abandoned"):
+                if value is not None and close is not None:
+                    close(value)
+                return
+            result["value"], result["error"] = value, error
+        finished.set()
+
+    threading.Thread(target=run, name="request-start", daemon=True).start()
+    remove = cancel_token.on_cancel(finished.set)
+    finished.wait()
+    remove()
+    with lock:
+        if "error" not in result:
+            result["abandoned"] = True
+            cancel_token.raise_if_cancelled()
+    if result["error"] is not None:
+        raise result["error"]
+    value = result["value"]
+    if close is not None:
+        close_on_cancel(cancel_token, lambda: close(value))
+    return value
+
+# One thread checks the deadlines of every watched stream, instead of a timer per chunk.
+class StreamWatchdog:
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def watch(self, token, timeout, reason):
+        key = object()
+        self.extend(key, token, timeout, reason)
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="stream-watchdog", daemon=True)
+                self.thread.start()
+        return key
+
+    def extend(self, key, token, timeout, reason):
+        with self.lock:
+            if timeout:
+                self.entries[key] = (token, time.monotonic() + timeout, reason)
+            else:
+                self.entries.pop(key, None)
+
+    def unwatch(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self.lock:
+                expired = [key for key, (_, deadline, _) in self.entries.items() if deadline <= now]
+                entries = [self.entries.pop(key) for key in expired]
+            for token, _, reason in entries:
+                token.cancel(StreamTimeout(reason))
+
+watchdog = StreamWatchdog()
+
+def watch_stream(start_stream, parent, first_token_timeout, idle_timeout, label):
+    token = CancelToken(parent)
+    key = watchdog.watch(token, first_token_timeout, f"No response from {label} within {first_token_timeout:g}s")
+    idle_reason = f"{label} stopped sending for {idle_timeout:g}s" if idle_timeout else None
+    try:
+        stream = start_stream(token)
+        try:
+            for chunk in stream:
+                token.raise_if_cancelled()
+                watchdog.extend(key, token, idle_timeout, idle_reason)
+                yield chunk
+        except Exception as e:
+            if token.cancelled:
+                raise token.reason from e
+            raise
+        finally:
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+        token.raise_if_cancelled()
+    finally:
+        watchdog.unwatch(key)
+        token.detach()
+
+async def watch_astream(stream, first_token_timeout, idle_timeout, label):
+    iterator = stream.__aiter__()
+    timeout = first_token_timeout or None
+    reason = f"No response from {label} within {first_token_timeout:g}s"
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise StreamTimeout(reason) from None
+            yield chunk
+            timeout = idle_timeout or None
+            reason = f"{label} stopped sending for {idle_timeout:g}s"
+    finally:
+        aclose = getattr(iterator, 'aclose', None)
+        if aclose is not None:
+            await aclose()
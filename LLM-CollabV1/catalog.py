@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+DEFAULT_CATALOG_SETTINGS = {
+    "cache_path": "model_catalog_cache.json",
+    "ttl_seconds": 86400,
+    "timeout_seconds": 10
+}
+
+class ModelCatalog:
+    def __init__(self, model_interactions, settings=None):
+        self.model_interactions = model_interactions
+        self.registry = model_interactions.registry
+        settings = dict(DEFAULT_CATALOG_SETTINGS, **(settings or {}))
+        self.cache_path = settings["cache_path"]
+        self.ttl = settings["ttl_seconds"]
+        self.timeout = settings["timeout_seconds"]
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.load_cache()
+
+    def fetcher(self, provider):
+        adapter = self.registry.get(provider)
+        return lambda: self.model_interactions.resilience.call(adapter.key, adapter.fetch_models)
+
+    def load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable model catalog cache: {e}")
+            return
+        with self.lock:
+            self.entries = {provider: entry for provider, entry in entries.items() if provider in self.registry}
+
+    def save_cache(self):
+        with self.lock:
+            entries = dict(self.entries)
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w') as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not write model catalog cache: {e}")
+
+    def is_stale(self, provider):
+        entry = self.entries.get(provider)
+        return entry is None or time.time() - entry["fetched_at"] > self.ttl
+
+    def models(self, provider):
+        entry = self.entries.get(provider)
+        return list(entry["models"]) if entry else []
+
+    def combined_models(self):
+        return [f"{provider}: {model}" for provider in self.registry.providers() for model in self.models(provider)]
+
+    def refresh(self, on_provider_done=None, on_provider_error=None, force=False):
+        providers = [provider for provider in self.registry.providers() if force or self.is_stale(provider)]
+        if not providers:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="catalog")
+        futures = {executor.submit(self.fetcher(provider)): provider for provider in providers}
+        try:
+            for future in as_completed(futures, timeout=self.timeout):
+                provider = futures[future]
+                try:
+                    models = future.result()
+                except Exception as e:
+                    if on_provider_error:
+                        on_provider_error(provider, str(e))
+                    continue
+                with self.lock:
+                    self.entries[provider] = {"models": list(models), "fetched_at": time.time()}
+                if on_provider_done:
+                    on_provider_done(provider, list(models))
+        except FuturesTimeoutError:
+            for future, provider in futures.items():
+                if not future.done() and on_provider_error:
+                    on_provider_error(provider, f"timed out after {self.timeout}s")
+        finally:
+            executor.shutdown(wait=False)
+            self.save_cache()
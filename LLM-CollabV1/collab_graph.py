@@ -0,0 +1,218 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from messages import role_messages
+
+DEFAULT_GRAPH_SETTINGS = {
+    "directory": "graphs",
+    "max_parallel": 4,
+    "max_tokens": 1000,
+    "temperature": 0.7,
+    "chunk_tokens": 2000
+}
+
+def split_chunks(text, chunk_tokens):
+    limit = max(chunk_tokens, 1) * 4
+    chunks = []
+    current = []
+    size = 0
+    for paragraph in text.split("\n\n"):
+        if current and size + len(paragraph) > limit:
+            chunks.append("\n\n".join(current))
+            current = []
+            size = 0
+        while len(paragraph) > limit:
+            chunks.append(paragraph[:limit])
+            paragraph = paragraph[limit:]
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current and any(part.strip() for part in current):
+        chunks.append("\n\n".join(current))
+    return chunks
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+# One pass over the template only: placeholders that turn up inside the substituted text
+# (a "{inputs}" in the user's message, say) are not expanded again, and braces that are not
+# a known placeholder, such as JSON examples in a prompt, are left alone.
+def fill(template, values):
+    return PLACEHOLDER.sub(lambda match: values.get(match.group(1), match.group(0)), template)
+
+class GraphNode:
+    def __init__(self, definition, settings):
+        self.id = definition["id"]
+        self.model = definition["model"]
+        self.role = definition.get("role")
+        self.inputs = list(definition.get("inputs", []))
+        self.map = definition.get("map")
+        if self.map is not None:
+            default_prompt = "{item}"
+        else:
+            default_prompt = "{inputs}" if self.inputs else "{input}"
+        self.prompt = definition.get("prompt", default_prompt)
+        self.max_tokens = definition.get("max_tokens", settings["max_tokens"])
+        self.temperature = definition.get("temperature", settings["temperature"])
+        self.chunk_tokens = definition.get("chunk_tokens", settings["chunk_tokens"])
+
+    @property
+    def provider(self):
+        return self.model.partition(": ")[0]
+
+    def requires(self):
+        if self.map is not None and self.map != "input" and self.map not in self.inputs:
+            return self.inputs + [self.map]
+        return self.inputs
+
+    def title(self):
+        return f"{self.id} ({self.model})"
+
+# A collaboration as a DAG of model calls. Each node only sees the user input and the outputs
+# of the nodes listed in its "inputs"; a node with "map" runs once per chunk of its source.
+class CollaborationGraph:
+    def __init__(self, definition, settings=None):
+        self.settings = dict(DEFAULT_GRAPH_SETTINGS, **(settings or {}))
+        self.name = definition.get("name", "Graph")
+        self.nodes = [GraphNode(node, self.settings) for node in definition.get("nodes", [])]
+        if not self.nodes:
+            raise ValueError(f"Graph {self.name!r} has no nodes")
+        self.by_id = {}
+        for node in self.nodes:
+            if node.id in self.by_id or node.id in ("input", "inputs", "item", "index", "count"):
+                raise ValueError(f"Graph {self.name!r} has a duplicate or reserved node id {node.id!r}")
+            self.by_id[node.id] = node
+        for node in self.nodes:
+            for source in node.requires():
+                if source not in self.by_id:
+                    raise ValueError(f"Node {node.id!r} reads from unknown node {source!r}")
+        self.order = self.topological_order()
+        self.output = definition.get("output", self.order[-1].id)
+        if self.output not in self.by_id:
+            raise ValueError(f"Graph output {self.output!r} is not a node")
+
+    @classmethod
+    def load(cls, path, settings=None):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), settings)
+
+    def topological_order(self):
+        remaining = {node.id: set(node.requires()) for node in self.nodes}
+        order = []
+        while remaining:
+            ready = [node for node in self.nodes if node.id in remaining and not remaining[node.id]]
+            if not ready:
+                raise ValueError(f"Graph {self.name!r} has a cycle through {', '.join(sorted(remaining))}")
+            for node in ready:
+                del remaining[node.id]
+                order.append(node)
+            for sources in remaining.values():
+                sources.difference_update(node.id for node in ready)
+        return order
+
+    def providers(self):
+        return {node.provider for node in self.nodes}
+
+    def index(self, node):
+        return self.nodes.index(node)
+
+# Runs every node as soon as the nodes it reads from are done, so the wall-clock time is
+# roughly the graph's critical path. The listener gets node_chunk, node_item_finished,
+# node_finished and node_failed calls from worker threads.
+class GraphRun:
+    def __init__(self, graph, model_interactions, listener, cancel_token=None):
+        self.graph = graph
+        self.model_interactions = model_interactions
+        self.listener = listener
+        self.cancel_token = cancel_token
+        self.outputs = {}
+        self.errors = {}
+
+    def prompt(self, node, user_input, item=None, index=0, count=1):
+        values = {"input": user_input}
+        for source in node.inputs:
+            values[source] = self.outputs[source]
+        values["inputs"] = "\n\n".join(f"[{source}]\n{self.outputs[source]}" for source in node.inputs)
+        if item is not None:
+            values.update({"item": item, "index": str(index + 1), "count": str(count)})
+        text = fill(node.prompt, values)
+        return role_messages(node.role, text) if node.role else text
+
+    def call(self, node, prompt, stream_chunks):
+        metrics = self.model_interactions.telemetry.start(node.model)
+        parts = []
+        for chunk in self.model_interactions.get_model_response_stream(
+                node.model, prompt, max_tokens=node.max_tokens, temperature=node.temperature,
+                metrics=metrics, cancel_token=self.cancel_token):
+            parts.append(chunk)
+            if stream_chunks:
+                self.listener.node_chunk(node, chunk)
+        return "".join(parts), metrics.result
+
+    def run_node(self, node, user_input):
+        return self.call(node, self.prompt(node, user_input), True)
+
+    def run_item(self, node, user_input, item, index, count):
+        text, summary = self.call(node, self.prompt(node, user_input, item, index, count), False)
+        self.listener.node_item_finished(node, index, text)
+        return text, summary
+
+    def run(self, user_input):
+        pending = {node.id: set(node.requires()) for node in self.graph.nodes}
+        items = {}
+        futures = {}
+        with ThreadPoolExecutor(max_workers=max(self.graph.settings["max_parallel"], 1)) as executor:
+            def start_ready():
+                for node in self.graph.order:
+                    if node.id not in pending or pending[node.id]:
+                        continue
+                    del pending[node.id]
+                    failed = [source for source in node.requires() if source in self.errors]
+                    if failed:
+                        self.fail(node, ValueError(f"input {failed[0]!r} failed"), pending)
+                        continue
+                    if node.map is None:
+                        futures[executor.submit(self.run_node, node, user_input)] = (node, None)
+                        continue
+                    source = user_input if node.map == "input" else self.outputs[node.map]
+                    chunks = split_chunks(source, node.chunk_tokens) or [source]
+                    items[node.id] = [None] * len(chunks)
+                    for index, chunk in enumerate(chunks):
+                        futures[executor.submit(self.run_item, node, user_input, chunk, index, len(chunks))] = \
+                            (node, index)
+
+            start_ready()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, index = futures.pop(future)
+                    if node.id in self.errors:
+                        continue
+                    try:
+                        text, summary = future.result()
+                    except Exception as e:
+                        self.fail(node, e, pending)
+                        if node.map is not None:
+                            for other, (other_node, _) in list(futures.items()):
+                                if other_node is node:
+                                    other.cancel()
+                        continue
+                    if index is not None:
+                        items[node.id][index] = text
+                        if any(part is None for part in items[node.id]):
+                            continue
+                        text = "\n\n".join(items.pop(node.id))
+                    self.complete(node, text, summary, pending)
+                start_ready()
+        return self.outputs.get(self.graph.output)
+
+    def complete(self, node, text, summary, pending):
+        self.outputs[node.id] = text
+        self.listener.node_finished(node, text, summary)
+        for sources in pending.values():
+            sources.discard(node.id)
+
+    def fail(self, node, error, pending):
+        self.errors[node.id] = error
+        self.listener.node_failed(node, error)
+        for sources in pending.values():
+            sources.discard(node.id)
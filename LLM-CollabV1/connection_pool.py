@@ -0,0 +1,105 @@
+import socket
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SETTINGS = {
+    "pool_connections": 4,
+    "pool_maxsize": 10,
+    "keep_alive": True,
+    "connect_timeout": 5.0,
+    "read_timeout": 120.0,
+    "first_token_timeout": 60.0,
+    "idle_timeout": 60.0,
+    "async_limit": 100
+}
+
+# Shutting the socket down first wakes a thread blocked reading the body; response.close() on
+# its own only releases the connection once that read returns. The server sees the
+# disconnect and stops generating.
+def close_response(response):
+    connection = getattr(getattr(response, "raw", None), "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+class ConnectionPool:
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.defaults = dict(DEFAULT_POOL_SETTINGS, **settings.get("default", {}))
+        self.overrides = settings.get("providers", {})
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def settings_for(self, provider):
+        return dict(self.defaults, **self.overrides.get(provider, {}))
+
+    def timeout(self, provider):
+        settings = self.settings_for(provider)
+        return (settings["connect_timeout"], settings["read_timeout"])
+
+    def session(self, provider):
+        with self.lock:
+            session = self.sessions.get(provider)
+            if session is None:
+                session = self._create_session(provider)
+                self.sessions[provider] = session
+            return session
+
+    def _create_session(self, provider):
+        settings = self.settings_for(provider)
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=settings["pool_connections"],
+            pool_maxsize=settings["pool_maxsize"]
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["Connection"] = "keep-alive" if settings["keep_alive"] else "close"
+        return session
+
+    def get(self, provider, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout(provider))
+        return self.session(provider).get(url, **kwargs)
+
+    def post(self, provider, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout(provider))
+        return self.session(provider).post(url, **kwargs)
+
+    # A HEAD request leaves a kept-alive connection in the pool, so the next POST to the same
+    # host skips the TCP and TLS handshakes.
+    def prewarm(self, provider, url):
+        self.session(provider).head(url, timeout=self.timeout(provider)).close()
+
+    def stats(self):
+        with self.lock:
+            sessions = dict(self.sessions)
+
+        stats = {}
+        for provider, session in sessions.items():
+            requests_made = 0
+            connections_opened = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        requests_made += pool.num_requests
+                        connections_opened += pool.num_connections
+            stats[provider] = {
+                "requests": requests_made,
+                "connections_opened": connections_opened,
+                "connections_reused": max(requests_made - connections_opened, 0)
+            }
+        return stats
+
+    def close(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+        for session in sessions:
+            session.close()
@@ -0,0 +1,156 @@
+DEFAULT_CONVERSATION_SETTINGS = {
+    "max_history_tokens": 32000,
+    "window_low_watermark": 0.75,
+    "token_budgets": {"default": 8000},
+    "summarize": False,
+    "summary_model": None,
+    "summary_max_tokens": 256,
+    "structured_messages": True
+}
+
+def estimate_tokens(text):
+    return max(1, (len(text) + 3) // 4)
+
+def token_budget(model, budgets):
+    if model in budgets:
+        return budgets[model]
+    provider = model.partition(": ")[0]
+    return budgets.get(provider, budgets.get("default", DEFAULT_CONVERSATION_SETTINGS["token_budgets"]["default"]))
+
+class Message:
+    __slots__ = ("role", "content", "tokens", "name", "speaker")
+
+    def __init__(self, role, content, name=None, speaker=None):
+        self.role = role
+        self.content = content
+        self.tokens = estimate_tokens(content)
+        self.name = name
+        self.speaker = speaker
+
+class ConversationBuffer:
+    def __init__(self, max_tokens=32000, low_watermark=0.75, summarizer=None, separator="\n"):
+        self.max_tokens = max_tokens
+        self.low_watermark = low_watermark
+        self.summarizer = summarizer
+        self.separator = separator
+        self.clear()
+
+    def clear(self):
+        self.system = []
+        self.messages = []
+        # cumulative[i] is the token total of every message up to and including messages[i];
+        # offset is the absolute index of messages[0] once old messages have been evicted.
+        self.cumulative = []
+        self.offset = 0
+        self.evicted_tokens = 0
+        self.summary = None
+        self.windows = {}
+        self.render_cache = {}
+
+    def __len__(self):
+        return len(self.system) + len(self.messages)
+
+    def set_system(self, content):
+        self.system = [Message("system", content)]
+        self.render_cache.clear()
+
+    def append(self, role, content, name=None, speaker=None):
+        message = Message(role, content, name, speaker)
+        previous = self.cumulative[-1] if self.cumulative else self.evicted_tokens
+        self.messages.append(message)
+        self.cumulative.append(previous + message.tokens)
+        if self.history_tokens() > self.max_tokens:
+            self._evict()
+        return message
+
+    def history_tokens(self):
+        if not self.cumulative:
+            return 0
+        return self.cumulative[-1] - self.evicted_tokens
+
+    def _tokens_between(self, start, end):
+        before = self.cumulative[start - 1] if start > 0 else self.evicted_tokens
+        return self.cumulative[end - 1] - before
+
+    # Trim down to a low watermark rather than one message at a time, so the rendered
+    # prefix stays stable for several rounds and provider-side prefix caches keep hitting.
+    def _evict(self):
+        target = int(self.max_tokens * self.low_watermark)
+        count = 0
+        while count < len(self.messages) - 1 and self._tokens_between(count, len(self.messages)) > target:
+            count += 1
+        if count == 0:
+            return
+
+        evicted = self.messages[:count]
+        self.evicted_tokens = self.cumulative[count - 1]
+        del self.messages[:count]
+        del self.cumulative[:count]
+        self.offset += count
+        self.render_cache.clear()
+
+        if self.summarizer is not None:
+            try:
+                summary = self.summarizer(self.summary.content if self.summary else "",
+                                          [message.content for message in evicted])
+            except Exception as e:
+                print(f"Could not summarize conversation history: {e}")
+            else:
+                if summary:
+                    self.summary = Message("system", summary)
+
+    def window_start(self, budget):
+        fixed = sum(message.tokens for message in self.system)
+        if self.summary is not None:
+            fixed += self.summary.tokens
+        available = max(budget - fixed, 0)
+
+        end = len(self.messages)
+        start = max(self.windows.get(budget, self.offset) - self.offset, 0)
+        if start < end and self._tokens_between(start, end) > available:
+            target = int(available * self.low_watermark)
+            while start < end - 1 and self._tokens_between(start, end) > target:
+                start += 1
+        self.windows[budget] = start + self.offset
+        return start
+
+    def visible_messages(self, budget=None):
+        start = self.window_start(budget) if budget is not None else 0
+        messages = list(self.system)
+        if self.summary is not None:
+            messages.append(self.summary)
+        messages.extend(self.messages[start:])
+        return messages
+
+    # Turns are labelled from one speaker's point of view: its own replies are "assistant",
+    # everyone else's (other models and the user) are "user". Speakers are collaborator slots
+    # rather than model names, since both sides of a collaboration can be the same model.
+    def render_messages(self, budget=None, speaker=None):
+        rendered = []
+        for message in self.visible_messages(budget):
+            if message.role == "system":
+                role = "system"
+            elif message.role == "assistant" and speaker is not None and message.speaker == speaker:
+                role = "assistant"
+            else:
+                role = "user"
+            rendered.append({"role": role, "content": message.content})
+        return rendered
+
+    def render(self, budget=None):
+        start = self.window_start(budget) if budget is not None else 0
+        end = len(self.messages)
+        cached = self.render_cache.get(budget)
+        if cached is not None and cached[0] == start + self.offset and cached[1] <= end + self.offset:
+            text = cached[2]
+            new_parts = [message.content for message in self.messages[cached[1] - self.offset:end]]
+            if new_parts:
+                text = self.separator.join([text] + new_parts) if text else self.separator.join(new_parts)
+        else:
+            parts = [message.content for message in self.system]
+            if self.summary is not None:
+                parts.append(self.summary.content)
+            parts.extend(message.content for message in self.messages[start:end])
+            text = self.separator.join(parts)
+        self.render_cache[budget] = (start + self.offset, end + self.offset, text)
+        return text
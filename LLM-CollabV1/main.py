@@ -1,17 +1,69 @@
 import sys
 import json
+import sqlite3
 import threading
 import time
-import torch
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSplitter, QMessageBox
-from PyQt5.QtGui import QIcon, QFont, QFontDatabase
-from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal, QTimer, QSize
-from ui import ChatBox, ControlPanel, CollaborationSettingsDialog, Theme
-from models import ModelInteractions
+import itertools
+import uuid
+from startup_timing import StartupTimer
+
+startup_timer = StartupTimer()
+
+with startup_timer.measure_import("PyQt5"):
+    from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QSplitter, QLabel, QFileDialog, QInputDialog
+    from PyQt5.QtGui import QIcon, QFont, QFontDatabase
+    from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal, QTimer, QSize
+with startup_timer.measure_import("ui"):
+    from ui import ChatBox, ControlPanel, CollaborationSettingsDialog, Theme, AsyncStreamBridge, EventLoopLagMonitor, ComparisonView
+with startup_timer.measure_import("models"):
+    from models import ModelInteractions
+with startup_timer.measure_import("async_models"):
+    from async_models import AsyncModelInteractions
+with startup_timer.measure_import("catalog"):
+    from catalog import ModelCatalog
+from conversation import ConversationBuffer, DEFAULT_CONVERSATION_SETTINGS, token_budget, estimate_tokens
+from messages import role_messages
+from cancellation import RequestCancelled
+from scheduler import Scheduler, QueueFull, COLLABORATION
+from pipeline import Pipeline
+from collab_graph import CollaborationGraph, GraphRun, DEFAULT_GRAPH_SETTINGS
+from session_store import SessionStore, DEFAULT_SESSION_SETTINGS, parse_search
+from telemetry import format_prompt_usage
+
+def provider_of(model):
+    return model.partition(": ")[0]
+
+# Forwards graph progress from worker threads to the comparison panes, one pane per node.
+class GraphProgress:
+    def __init__(self, window, run, graph):
+        self.window = window
+        self.run = run
+        self.graph = graph
+
+    def node_chunk(self, node, chunk):
+        self.window.compare_chunk_signal.emit(self.run, self.graph.index(node), chunk)
+
+    def node_item_finished(self, node, index, text):
+        self.window.compare_chunk_signal.emit(self.run, self.graph.index(node), f"[{index + 1}] {text}\n\n")
+
+    def node_finished(self, node, text, summary):
+        self.window.compare_finished_signal.emit(self.run, self.graph.index(node), summary)
+
+    def node_failed(self, node, error):
+        self.window.compare_failed_signal.emit(self.run, self.graph.index(node), str(error))
 
 class MainWindow(QMainWindow):
     update_chat_signal = pyqtSignal(str, bool)
-    stream_update_signal = pyqtSignal(str)
+    stream_update_signal = pyqtSignal(str, str)
+    stream_start_signal = pyqtSignal(str, str)
+    stream_finish_signal = pyqtSignal(str)
+    models_fetched_signal = pyqtSignal(str, list)
+    models_fetch_failed_signal = pyqtSignal(str, str)
+    compare_chunk_signal = pyqtSignal(int, int, str)
+    compare_finished_signal = pyqtSignal(int, int, object)
+    compare_failed_signal = pyqtSignal(int, int, str)
+    error_signal = pyqtSignal(str)
+    usage_signal = pyqtSignal(dict)
 
     def __init__(self):
         super().__init__()
@@ -22,8 +74,32 @@ class MainWindow(QMainWindow):
             self.config = json.load(config_file)
 
         self.model_interactions = ModelInteractions(self.config)
+        self.model_catalog = ModelCatalog(self.model_interactions, self.config.get('MODEL_CATALOG'))
+        self.scheduler = Scheduler(self.config.get('SCHEDULER'))
+        self.pipeline = Pipeline(self.model_interactions, self.scheduler, self.config.get('PIPELINE'))
+        self.session_settings = dict(DEFAULT_SESSION_SETTINGS, **self.config.get('SESSIONS', {}))
+        self.session_store = None
+        if self.session_settings["enabled"]:
+            try:
+                self.session_store = SessionStore(self.session_settings)
+            except sqlite3.Error as e:
+                print(f"Could not open session store {self.session_settings['path']}: {e}")
+        startup_timer.mark("model layer ready")
+
+        self.stream_bridge = None
+        self.async_requests = {}
+        self.compare_requests = {}
+        self.async_request_ids = itertools.count(1)
+        if self.config.get('STREAMING', {}).get('backend', 'threads') == 'asyncio':
+            self.stream_bridge = AsyncStreamBridge(AsyncModelInteractions(self.model_interactions), self)
+            self.stream_bridge.chunk_received.connect(self.on_async_chunk)
+            self.stream_bridge.stream_finished.connect(self.on_async_finished)
+            self.stream_bridge.stream_failed.connect(self.on_async_failed)
+            self.stream_bridge.stream_cancelled.connect(self.on_async_cancelled)
 
         self.current_theme = Theme.DARK
+        self.graph_settings = dict(DEFAULT_GRAPH_SETTINGS, **self.config.get('COLLAB_GRAPH', {}))
+        self.collaboration_graph = None
 
         central_widget = QWidget()
         main_layout = QHBoxLayout(central_widget)
@@ -31,10 +107,19 @@ class MainWindow(QMainWindow):
         main_layout.setSpacing(0)
 
         self.chat_box = ChatBox(self)
+        self.comparison_view = ComparisonView(self.config.get('UI', {}).get('stream_fps', 30))
+        self.comparison_view.setVisible(False)
         self.control_panel = ControlPanel(self)
+        self.model_interactions.telemetry.add_listener(self.control_panel.visualization.record)
+
+        chat_splitter = QSplitter(Qt.Vertical)
+        chat_splitter.addWidget(self.comparison_view)
+        chat_splitter.addWidget(self.chat_box)
+        chat_splitter.setStretchFactor(0, 3)
+        chat_splitter.setStretchFactor(1, 2)
 
         splitter = QSplitter(Qt.Horizontal)
-        splitter.addWidget(self.chat_box)
+        splitter.addWidget(chat_splitter)
         splitter.addWidget(self.control_panel)
         splitter.setStretchFactor(0, 7)
         splitter.setStretchFactor(1, 3)
@@ -43,9 +128,11 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(central_widget)
 
         self.current_mode = "single"
-        self.stop_event = threading.Event()
         self.collaboration_models = []
-        self.conversation_history = []
+        self.collaboration_job = (None, None)
+        self.conversation_settings = dict(DEFAULT_CONVERSATION_SETTINGS, **self.config.get('CONVERSATION', {}))
+        self.conversation_history = self.create_conversation_buffer()
+        self.conversation_id = uuid.uuid4().hex
 
         self.collab_settings = {
             "rounds": 0,
@@ -57,12 +144,41 @@ class MainWindow(QMainWindow):
 
         self.create_toolbar()
         self.apply_theme(self.current_theme)
-        self.fetch_all_models()
 
         self.statusBar().showMessage("Ready")
 
+        if self.config.get('UI', {}).get('show_event_loop_lag', True):
+            self.lag_monitor = EventLoopLagMonitor(parent=self)
+            self.lag_label = QLabel()
+            self.statusBar().addPermanentWidget(self.lag_label)
+            self.lag_timer = QTimer(self)
+            self.lag_timer.timeout.connect(self.update_lag_label)
+            self.lag_timer.start(1000)
+
+        self.usage_label = QLabel()
+        self.statusBar().addPermanentWidget(self.usage_label)
+        self.model_interactions.telemetry.add_listener(self.usage_signal.emit)
+
+        self.queue_label = QLabel()
+        self.statusBar().addPermanentWidget(self.queue_label)
+        self.queue_timer = QTimer(self)
+        self.queue_timer.timeout.connect(self.update_queue_label)
+        self.queue_timer.start(500)
+
         self.update_chat_signal.connect(self.chat_box.display_message)
         self.stream_update_signal.connect(self.chat_box.update_streaming_message)
+        self.stream_start_signal.connect(self.chat_box.begin_stream)
+        self.stream_finish_signal.connect(self.chat_box.finish_stream)
+        self.models_fetched_signal.connect(self.on_models_fetched)
+        self.models_fetch_failed_signal.connect(self.on_models_fetch_failed)
+        self.compare_chunk_signal.connect(self.comparison_view.append_chunk)
+        self.compare_finished_signal.connect(self.comparison_view.finish)
+        self.compare_failed_signal.connect(self.comparison_view.fail)
+        self.comparison_view.comparison_finished.connect(self.chat_box.display_message)
+        self.error_signal.connect(self.on_error)
+        self.usage_signal.connect(self.update_usage_label)
+
+        self.fetch_all_models()
 
     def create_toolbar(self):
         toolbar = self.addToolBar("Main Toolbar")
@@ -128,166 +244,568 @@ class MainWindow(QMainWindow):
             }}
         """)
 
-    def fetch_all_models(self):
-        try:
-            groq_models = self.model_interactions.fetch_groq_models()
-            ollama_models = self.model_interactions.fetch_ollama_models()
-            anthropic_models = self.model_interactions.fetch_anthropic_models()
-            openai_models = self.model_interactions.fetch_openai_models()
-            gemini_models = self.model_interactions.fetch_gemini_models()
-            perplexity_models = self.model_interactions.fetch_perplexity_models()
-        except Exception as e:
-            self.show_error_message(f"Error fetching models: {str(e)}")
-            return
+    def update_lag_label(self):
+        average, worst = self.lag_monitor.lag_ms()
+        self.lag_label.setText(f"UI lag: {average:.0f} ms avg / {worst:.0f} ms max")
 
-        combined_models = (
-            ["Groq: " + model for model in groq_models] +
-            ["Ollama: " + model for model in ollama_models] +
-            ["Anthropic: " + model for model in anthropic_models] +
-            ["OpenAI: " + model for model in openai_models] +
-            ["Gemini: " + model for model in gemini_models] +
-            ["Perplexity: " + model for model in perplexity_models]
-        )
-
-        self.control_panel.single_model_dropdown.addItems(combined_models)
-        self.control_panel.model1_dropdown.addItems(combined_models)
-        self.control_panel.model2_dropdown.addItems(combined_models)
+    # Runs for every finished request; the tooltip has the per-model totals and cache hit ratio.
+    @pyqtSlot(dict)
+    def update_usage_label(self, summary):
+        if not summary.get("prompt_tokens"):
+            return
+        self.usage_label.setText(f"{summary['model']}: {format_prompt_usage(summary)}")
+        lines = [f"{model}: {totals['prompt_tokens']} prompt tokens, {totals['cache_hit_ratio']:.0%} cached"
+                 for model, totals in sorted(self.model_interactions.usage_stats().items())]
+        self.usage_label.setToolTip("\n".join(lines))
+
+    def update_queue_label(self):
+        stats = self.scheduler.stats()
+        text = f"Jobs: {stats['running']} running, {stats['queued']} queued"
+        if stats["queued"]:
+            text += f", oldest waiting {stats['oldest_wait_seconds']:.1f}s"
+        elif stats["wait_p90_seconds"] is not None:
+            text += f", p90 wait {stats['wait_p90_seconds']:.1f}s"
+        self.queue_label.setText(text)
 
-        if combined_models:
-            self.control_panel.single_model_dropdown.setCurrentIndex(0)
-            self.control_panel.model1_dropdown.setCurrentIndex(0)
-            self.control_panel.model2_dropdown.setCurrentIndex(1 if len(combined_models) > 1 else 0)
+    def fetch_all_models(self):
+        self.populate_model_dropdowns()
+        threading.Thread(
+            target=self.model_catalog.refresh,
+            args=(self.models_fetched_signal.emit, self.models_fetch_failed_signal.emit),
+            daemon=True
+        ).start()
+
+    def populate_model_dropdowns(self):
+        combined_models = self.model_catalog.combined_models()
+        dropdowns = [
+            self.control_panel.single_model_dropdown,
+            self.control_panel.model1_dropdown,
+            self.control_panel.model2_dropdown
+        ]
+        for dropdown in dropdowns:
+            selected = dropdown.currentText()
+            dropdown.blockSignals(True)
+            dropdown.clear()
+            dropdown.addItems(combined_models)
+            if selected in combined_models:
+                dropdown.setCurrentIndex(combined_models.index(selected))
+            elif combined_models:
+                default_index = 1 if dropdown is self.control_panel.model2_dropdown else 0
+                dropdown.setCurrentIndex(min(default_index, len(combined_models) - 1))
+            dropdown.blockSignals(False)
+        self.control_panel.set_compare_models(combined_models)
+
+    @pyqtSlot(str, list)
+    def on_models_fetched(self, provider, models):
+        self.populate_model_dropdowns()
+        self.statusBar().showMessage(f"Loaded {len(models)} {provider} models", 3000)
+
+    @pyqtSlot(str, str)
+    def on_models_fetch_failed(self, provider, error):
+        self.statusBar().showMessage(f"Could not refresh {provider} models: {error}", 5000)
 
     @pyqtSlot()
     def handle_message(self, message):
         self.chat_box.display_message(f"You: {message}", is_user=True)
 
-        if self.current_mode == "collaboration" and self.collaboration_models:
-            threading.Thread(target=self.collaborative_interaction, args=(message,), daemon=True).start()
+        if self.current_mode == "collaboration" and self.collaboration_graph is not None:
+            self.start_graph(message)
+        elif self.current_mode == "collaboration" and self.collaboration_models:
+            self.submit_collaboration(message)
+        elif self.current_mode == "compare":
+            models = self.control_panel.selected_compare_models()
+            if models:
+                self.start_comparison(models, self.control_panel.compare_role_dropdown.currentText(), message)
+            else:
+                self.statusBar().showMessage("Tick at least one model to compare", 3000)
         else:
             selected_model = self.control_panel.single_model_dropdown.currentText()
             selected_role = self.control_panel.role_dropdown.currentText()
-            threading.Thread(target=self.single_model_response, args=(selected_model, selected_role, message), daemon=True).start()
-
-    def single_model_response(self, model, role, user_message):
-        if not self.stop_event.is_set():
-            role_prompt = {
-                "General Assistant": "You are a helpful assistant. 😊",
-                "Technical Expert": "You are an expert in technology. 🛠️",
-                "Creative Thinker": "You are a creative thinker. ✍️",
-                "Data Analyst": "You are a data analyst. 📊",
-                "Healthcare Advisor": "You are a healthcare advisor. 🏥",
-                "Educational Tutor": "You are an educational tutor. 📚",
-                "Scientific Researcher": "You are a scientific researcher. 🧪",
-                "Project Manager": "You are a project manager. 📋",
-                "Philosopher": "You are a philosopher. 🤔",
-                "Debater": "You are a skilled debater. 💬"
-            }.get(role, "You are a general assistant. 😊")
-
-            full_prompt = f"{role_prompt}\n{user_message}"
+            if self.stream_bridge is not None:
+                self.start_async_response(selected_model, selected_role, message)
+            else:
+                self.submit_job(self.single_model_response, selected_model, selected_role, message,
+                                self.conversation_id, dict(self.collab_settings),
+                                providers=[provider_of(selected_model)], description=selected_model)
 
-            try:
-                start_time = time.time()
-                self.stream_update_signal.emit(f"\n{model}: ")
-                for chunk in self.model_interactions.get_model_response_stream(model, full_prompt,
-                                                   max_tokens=self.collab_settings["max_tokens"],
-                                                   temperature=self.collab_settings["temperature"]):
-                    if self.stop_event.is_set():
-                        break
-                    self.stream_update_signal.emit(chunk)
-                end_time = time.time()
-                response_time = end_time - start_time
-
-                self.control_panel.visualization.update_chart({model: [response_time]})
-            except Exception as e:
-                self.show_error_message(f"Error getting model response: {str(e)}")
+    def build_role_messages(self, role, user_message):
+        return role_messages(role, user_message)
+
+    # Worker threads come from the scheduler; when its queue is full the job is refused instead
+    # of piling up more threads behind a slow provider.
+    def submit_job(self, function, *args, **options):
+        try:
+            return self.scheduler.submit(function, *args, **options)
+        except QueueFull as e:
+            self.show_error_message(f"Too many requests waiting, not sent: {e}")
+            return None
+
+    def single_model_response(self, job, model, role, user_message, session_id, settings):
+        full_prompt = self.build_role_messages(role, user_message)
+        metrics = self.model_interactions.telemetry.start(model)
+        response_parts = []
+        self.open_session(session_id, "chat", user_message)
+        self.record_turn(session_id, "user", user_message, persona=role)
+        stream_id = uuid.uuid4().hex
+        try:
+            self.stream_start_signal.emit(model, stream_id)
+            for chunk in self.model_interactions.get_model_response_stream(model, full_prompt,
+                                               max_tokens=settings["max_tokens"],
+                                               temperature=settings["temperature"],
+                                               metrics=metrics, cancel_token=job.cancel_token):
+                self.stream_update_signal.emit(chunk, stream_id)
+                response_parts.append(chunk)
+        except RequestCancelled:
+            pass
+        except Exception as e:
+            self.show_error_message(f"Error getting model response: {str(e)}")
+        finally:
+            self.stream_finish_signal.emit(stream_id)
+        if response_parts:
+            self.record_turn(session_id, "assistant", "".join(response_parts), model, role, metrics.result)
+
+    def start_async_response(self, model, role, user_message):
+        request_id = str(next(self.async_request_ids))
+        metrics = self.model_interactions.telemetry.start(model)
+        self.async_requests[request_id] = (model, role, self.conversation_id, metrics, [])
+        self.open_session(self.conversation_id, "chat", user_message)
+        self.record_turn(self.conversation_id, "user", user_message, persona=role)
+        self.chat_box.begin_stream(model, request_id)
+        self.stream_bridge.start_stream(request_id, model, self.build_role_messages(role, user_message),
+                                        self.collab_settings["max_tokens"],
+                                        self.collab_settings["temperature"], metrics=metrics)
+
+    @pyqtSlot(str, str)
+    def on_async_chunk(self, request_id, chunk):
+        if request_id in self.compare_requests:
+            run, index, _ = self.compare_requests[request_id]
+            self.comparison_view.append_chunk(run, index, chunk)
+            return
+        if request_id in self.async_requests:
+            self.async_requests[request_id][4].append(chunk)
+        self.chat_box.update_streaming_message(chunk, request_id)
+
+    @pyqtSlot(str)
+    def on_async_finished(self, request_id):
+        self.finish_async_request(request_id)
+        if request_id in self.compare_requests:
+            run, index, metrics = self.compare_requests.pop(request_id)
+            self.comparison_view.finish(run, index, metrics.result)
+
+    @pyqtSlot(str, str)
+    def on_async_failed(self, request_id, error):
+        self.finish_async_request(request_id)
+        if request_id in self.compare_requests:
+            run, index, _ = self.compare_requests.pop(request_id)
+            self.comparison_view.fail(run, index, error)
+            return
+        self.show_error_message(f"Error getting model response: {error}")
+
+    @pyqtSlot(str)
+    def on_async_cancelled(self, request_id):
+        self.finish_async_request(request_id)
+        if request_id in self.compare_requests:
+            run, index, _ = self.compare_requests.pop(request_id)
+            self.comparison_view.fail(run, index, "Stopped")
+
+    # Whatever arrived before a failure or a stop is still saved, as it is still in the chat.
+    def finish_async_request(self, request_id):
+        request = self.async_requests.pop(request_id, None)
+        if request is None:
+            return
+        self.chat_box.finish_stream(request_id)
+        model, role, session_id, metrics, parts = request
+        if parts:
+            self.record_turn(session_id, "assistant", "".join(parts), model, role, metrics.result)
+
+    # Every model is its own job, so models on different providers stream at once while each
+    # provider's limit still holds; a comparison takes about as long as its slowest model.
+    def start_comparison(self, models, role, user_message):
+        run = self.comparison_view.start(models)
+        prompt = self.build_role_messages(role, user_message)
+        if self.stream_bridge is not None:
+            for index, model in enumerate(models):
+                metrics = self.model_interactions.telemetry.start(model)
+                request_id = f"compare-{next(self.async_request_ids)}"
+                self.compare_requests[request_id] = (run, index, metrics)
+                self.stream_bridge.start_stream(request_id, model, prompt, self.collab_settings["max_tokens"],
+                                                self.collab_settings["temperature"], metrics=metrics)
+        else:
+            settings = dict(self.collab_settings)
+            for index, model in enumerate(models):
+                try:
+                    self.scheduler.submit(self.compare_model_response, run, index, model, prompt, settings,
+                                          providers=[provider_of(model)], description=f"Compare {model}")
+                except QueueFull as e:
+                    self.comparison_view.fail(run, index, f"Not sent, queue full: {e}")
+
+    # Metrics start here, when the request is actually sent, so queueing never counts as TTFT.
+    def compare_model_response(self, job, run, index, model, prompt, settings):
+        metrics = self.model_interactions.telemetry.start(model)
+        try:
+            for chunk in self.model_interactions.get_model_response_stream(model, prompt,
+                                               max_tokens=settings["max_tokens"],
+                                               temperature=settings["temperature"],
+                                               metrics=metrics, cancel_token=job.cancel_token):
+                self.compare_chunk_signal.emit(run, index, chunk)
+        except RequestCancelled:
+            self.compare_failed_signal.emit(run, index, "Stopped")
+        except Exception as e:
+            self.compare_failed_signal.emit(run, index, str(e))
+        else:
+            self.compare_finished_signal.emit(run, index, metrics.result)
+
+    @pyqtSlot()
+    def load_collaboration_graph(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load collaboration graph", self.graph_settings["directory"],
+                                              "Graph files (*.json)")
+        if not path:
+            return
+        try:
+            graph = CollaborationGraph.load(path, self.graph_settings)
+        except (OSError, ValueError, KeyError) as e:
+            self.show_error_message(f"Could not load graph {path}: {e}")
+            return
+        self.collaboration_graph = graph
+        self.control_panel.set_graph(graph)
+        self.comparison_view.setVisible(self.current_mode in ("collaboration", "compare"))
+
+    @pyqtSlot()
+    def clear_collaboration_graph(self):
+        self.collaboration_graph = None
+        self.control_panel.set_graph(None)
+        self.comparison_view.setVisible(self.current_mode == "compare")
+
+    def start_graph(self, message):
+        graph = self.collaboration_graph
+        run = self.comparison_view.start([node.title() for node in graph.nodes], graph.name)
+        job = self.submit_job(self.run_collaboration_graph, graph, run, message, priority=COLLABORATION,
+                              providers=graph.providers(), description=graph.name)
+        if job is None:
+            for index in range(len(graph.nodes)):
+                self.comparison_view.fail(run, index, "Not sent")
+
+    def run_collaboration_graph(self, job, graph, run, message):
+        output = GraphRun(graph, self.model_interactions, GraphProgress(self, run, graph), job.cancel_token).run(message)
+        if output is not None:
+            self.update_chat_signal.emit(f"{graph.name} ({graph.output}): {output}", False)
 
     @pyqtSlot()
     def start_collaboration(self):
+        if self.collaboration_graph is not None:
+            self.statusBar().showMessage(f"Send a message to run {self.collaboration_graph.name}", 3000)
+            return
         model1 = self.control_panel.model1_dropdown.currentText()
         model2 = self.control_panel.model2_dropdown.currentText()
         self.collaboration_models = [model1, model2]
-        self.conversation_history = []
+        self.conversation_history = self.create_conversation_buffer()
+        self.model_interactions.reset_conversation(self.conversation_id)
+        self.conversation_id = uuid.uuid4().hex
 
         system_prompt = "You are part of a collaborative AI system. Engage in a conversation, building upon each other's ideas."
 
         self.update_chat_signal.emit(f"Starting collaboration between models with prompt: {system_prompt}", False)
-        threading.Thread(target=self.collaborative_interaction, args=(system_prompt,), daemon=True).start()
-
-    def collaborative_interaction(self, system_prompt):
-        model1_role = self.control_panel.model1_role_dropdown.currentText()
-        model2_role = self.control_panel.model2_role_dropdown.currentText()
-
-        self.conversation_history.append({"role": "system", "content": system_prompt})
-
-        model1 = self.collaboration_models[0]
-        model2 = self.collaboration_models[1]
+        self.submit_collaboration(system_prompt)
+
+    # The job takes the conversation buffer, roles and settings as they are now, so clearing the
+    # chat or starting another collaboration never changes what a running one sees. Jobs on the
+    # same conversation share a group and run one after another. A message for a conversation
+    # whose collaboration is still queued or running is handed to that job instead, so it is
+    # never stuck behind an endless collaboration.
+    def submit_collaboration(self, prompt):
+        models = list(self.collaboration_models)
+        roles = [self.control_panel.model1_role_dropdown.currentText(),
+                 self.control_panel.model2_role_dropdown.currentText()]
+        conversation_id, job = self.collaboration_job
+        if conversation_id == self.conversation_id and job is not None and self.scheduler.deliver(job, prompt):
+            self.statusBar().showMessage("Message added to the running collaboration", 3000)
+            return job
+        self.open_session(self.conversation_id, "collaboration", " / ".join(models),
+                          {"models": models, "roles": roles})
+        job = self.submit_job(self.collaborative_interaction, prompt, self.conversation_history,
+                              self.conversation_id, models, roles, dict(self.collab_settings),
+                              priority=COLLABORATION, providers=[provider_of(model) for model in models],
+                              group=self.conversation_id, description=" / ".join(models))
+        self.collaboration_job = (self.conversation_id, job)
+        return job
+
+    def create_conversation_buffer(self):
+        settings = self.conversation_settings
+        summarizer = self.summarize_history if settings["summarize"] and settings["summary_model"] else None
+        return ConversationBuffer(settings["max_history_tokens"], settings["window_low_watermark"], summarizer)
+
+    def summarize_history(self, previous_summary, evicted_messages):
+        prompt = "Summarize the earlier part of this conversation in a few sentences, keeping key facts and decisions.\n"
+        if previous_summary:
+            prompt += f"Summary so far: {previous_summary}\n"
+        prompt += "\n".join(evicted_messages)
+        parts = list(self.model_interactions.get_model_response_stream(
+            self.conversation_settings["summary_model"], prompt,
+            max_tokens=self.conversation_settings["summary_max_tokens"], temperature=0.2))
+        return "".join(parts)
+
+    # pending is text from the other model that is not in the conversation yet; a speculative
+    # turn is started on it before that reply has finished.
+    def collaboration_prompt(self, conversation, model, role, speaker, settings, pending=None):
+        budget = token_budget(model, self.conversation_settings["token_budgets"]) - settings["max_tokens"]
+        if pending:
+            budget -= estimate_tokens(pending)
+        if self.conversation_settings["structured_messages"]:
+            prompt = [{"role": "system", "content": f"Role: {role}."}] + conversation.render_messages(budget, speaker)
+            if pending:
+                prompt.append({"role": "user", "content": pending})
+            return prompt
+        prompt = f"Role: {role}. {conversation.render(budget)}"
+        if pending:
+            prompt += conversation.separator + pending
+        return prompt
+
+    def collaborative_interaction(self, job, system_prompt, conversation, conversation_id, models, roles, settings):
+        if not conversation.system:
+            conversation.set_system(system_prompt)
+            if self.session_store is not None:
+                self.session_store.set_system(conversation_id, system_prompt)
+        else:
+            conversation.append("user", system_prompt)
+            self.record_turn(conversation_id, "user", system_prompt)
 
-        response_times = {model1: [], model2: []}
-        rounds = self.collab_settings["rounds"]
-        current_model = model1
+        rounds = settings["rounds"]
+        max_failed_turns = self.config.get('RESILIENCE', {}).get('max_failed_turns', 4)
+        slot = 0
         round_num = 0
+        failed_turns = 0
+        speculation = None
 
-        while rounds == 0 or round_num < rounds:
-            if self.stop_event.is_set():
+        while True:
+            if job.cancel_token.cancelled:
                 break
-
-            prompt = "\n".join([msg["content"] for msg in self.conversation_history])
-            if current_model == model1:
-                prompt = f"Role: {model1_role}. {prompt}"
+            # Messages sent while the collaboration runs join it at the next turn; one that arrives
+            # during the last round starts a new set of rounds instead of waiting behind this job.
+            messages = self.scheduler.take_inbox(job)
+            if not messages and rounds and round_num >= rounds:
+                break
+            if messages:
+                self.add_user_messages(conversation, conversation_id, messages)
+                if rounds and round_num >= rounds:
+                    round_num = 0
+                if speculation is not None:
+                    self.pipeline.discard(speculation)
+                    speculation = None
+
+            current_model, role = models[slot], roles[slot]
+            next_slot = 1 - slot
+            next_model, next_role = models[next_slot], roles[next_slot]
+            has_next_turn = rounds == 0 or round_num + 1 < rounds
+            if speculation is not None:
+                stream, speculation = speculation, None
+                metrics = stream.metrics
             else:
-                prompt = f"Role: {model2_role}. {prompt}"
-
+                metrics = self.model_interactions.telemetry.start(current_model)
+                stream = self.model_interactions.get_model_response_stream(
+                    current_model, self.collaboration_prompt(conversation, current_model, role, slot, settings),
+                    max_tokens=settings["max_tokens"],
+                    temperature=settings["temperature"],
+                    conversation_id=conversation_id,
+                    metrics=metrics,
+                    cancel_token=job.cancel_token)
+            speculator = None
+            if has_next_turn:
+                self.pipeline.prewarm(next_model, job)
+                speculator = self.pipeline.speculator(
+                    current_model, next_model,
+                    lambda prefix: self.collaboration_prompt(conversation, next_model, next_role, next_slot,
+                                                             settings, pending=prefix),
+                    settings["max_tokens"], settings["temperature"], job)
+
+            response_parts = []
+            stream_id = uuid.uuid4().hex
             try:
-                start_time = time.time()
-                self.stream_update_signal.emit(f"\n{current_model}: ")
-                full_response = ""
-                for chunk in self.model_interactions.get_model_response_stream(current_model, prompt,
-                                                   max_tokens=self.collab_settings["max_tokens"],
-                                                   temperature=self.collab_settings["temperature"]):
-                    if self.stop_event.is_set():
-                        break
-                    self.stream_update_signal.emit(chunk)
-                    full_response += chunk
-                end_time = time.time()
-                response_time = end_time - start_time
-
-                response_times[current_model].append(response_time)
-                self.conversation_history.append({"role": "assistant", "content": full_response})
-
-                current_model = model2 if current_model == model1 else model1
-                round_num += 1
+                self.stream_start_signal.emit(current_model, stream_id)
+                for chunk in stream:
+                    self.stream_update_signal.emit(chunk, stream_id)
+                    response_parts.append(chunk)
+                    if speculator is not None:
+                        speculator.update(chunk)
+                failed_turns = 0
+                if speculator is not None:
+                    speculation = speculator.finish()
+            except RequestCancelled:
+                pass
             except Exception as e:
-                self.show_error_message(f"Error during collaborative interaction: {str(e)}")
-                break
+                # Retries have already been used up by the resilience layer; skip this turn and let
+                # the other model carry on, unless turns keep failing back to back.
+                failed_turns += 1
+                self.show_error_message(f"{current_model} failed, skipping its turn: {str(e)}")
+                if failed_turns >= max_failed_turns:
+                    self.show_error_message(f"Stopping collaboration after {failed_turns} failed turns in a row")
+                    break
+            finally:
+                self.stream_finish_signal.emit(stream_id)
+                if speculator is not None:
+                    speculator.cancel()
+            if response_parts:
+                response = "".join(response_parts)
+                conversation.append("assistant", response, name=current_model, speaker=slot)
+                self.record_turn(conversation_id, "assistant", response, current_model, role, metrics.result)
+
+            slot = next_slot
+            round_num += 1
+
+        if speculation is not None:
+            self.pipeline.discard(speculation)
+        # Anything that arrived after the last look (or after Stop) still goes into the history.
+        self.add_user_messages(conversation, conversation_id, self.scheduler.close_inbox(job))
+
+    def add_user_messages(self, conversation, conversation_id, messages):
+        for message in messages:
+            conversation.append("user", message)
+            self.record_turn(conversation_id, "user", message)
+
+    def open_session(self, session_id, kind, title, settings=None):
+        if self.session_store is None:
+            return
+        try:
+            self.session_store.ensure_session(session_id, kind, title, settings)
+        except sqlite3.Error as e:
+            print(f"Could not save session {session_id}: {e}")
 
-        self.control_panel.visualization.update_chart(response_times)
+    # Saving is best effort: a full disk or a locked database must not stop the chat.
+    def record_turn(self, session_id, role, content, name=None, persona=None, metrics=None):
+        if self.session_store is None:
+            return
+        try:
+            self.session_store.append_turn(session_id, role, content, name, persona, metrics)
+        except (sqlite3.Error, KeyError) as e:
+            print(f"Could not save turn to session {session_id}: {e}")
+
+    @pyqtSlot()
+    def resume_session(self):
+        if self.session_store is None:
+            self.statusBar().showMessage("Session history is turned off", 3000)
+            return
+        sessions = self.session_store.recent_sessions(self.session_settings["recent_sessions"])
+        if not sessions:
+            self.statusBar().showMessage("No saved sessions yet", 3000)
+            return
+        labels = [f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(session['updated_at']))}  "
+                  f"{session['title']} ({session['kind']}, {session['turn_count']} turns)" for session in sessions]
+        label, ok = QInputDialog.getItem(self, "Resume Session", "Session:", labels, 0, False)
+        if ok:
+            self.load_session(sessions[labels.index(label)]["id"])
+
+    # Searches run on the GUI thread: they go through the full-text index and take milliseconds.
+    def search_sessions(self, text):
+        if self.session_store is None:
+            self.statusBar().showMessage("Session history is turned off", 3000)
+            return []
+        try:
+            terms, filters = parse_search(text)
+        except ValueError as e:
+            self.statusBar().showMessage(f"Dates are written YYYY-MM-DD: {e}", 5000)
+            return []
+        if filters.get("session") == "current":
+            filters["session"] = self.conversation_id
+        if not terms:
+            self.statusBar().showMessage("Type at least one word to search for", 3000)
+            return []
+        try:
+            return self.session_store.search(terms, limit=self.session_settings["search_results"], **filters)
+        except sqlite3.Error as e:
+            self.statusBar().showMessage(f"Search failed: {e}", 5000)
+            return []
+
+    def open_search_result(self, result):
+        self.load_session(result["session_id"], result["seq"])
+
+    # Only the tail that fits in the conversation window is read back; older turns stay on disk.
+    # With focus_seq the chat shows the turns around that one instead of the newest.
+    def load_session(self, session_id, focus_seq=None):
+        session = self.session_store.session(session_id)
+        if session is None:
+            self.show_error_message(f"Session {session_id} no longer exists")
+            return
+        turns = self.session_store.tail(session_id, self.conversation_settings["max_history_tokens"],
+                                        max(self.session_settings["resume_messages"], 1))
+        conversation = self.create_conversation_buffer()
+        if session["system"]:
+            conversation.set_system(session["system"])
+        speaker = None
+        for turn in turns:
+            if turn["role"] == "assistant":
+                speaker = self.turn_speaker(turn, session["settings"], speaker)
+                conversation.append("assistant", turn["content"], name=turn["name"], speaker=speaker)
+            else:
+                conversation.append(turn["role"], turn["content"], name=turn["name"])
+        self.model_interactions.reset_conversation(self.conversation_id)
+        self.conversation_history = conversation
+        self.conversation_id = session_id
+        if session["kind"] == "collaboration":
+            self.collaboration_models = list(session["settings"].get("models", []))
+        shown = turns
+        if focus_seq is not None and not any(turn["seq"] == focus_seq for turn in turns):
+            count = self.session_settings["resume_messages"]
+            shown = self.session_store.turns(session_id, max(focus_seq - count // 2, 1), count)
+        focus = next((index for index, turn in enumerate(shown) if turn["seq"] == focus_seq), None)
+        self.chat_box.load_records([self.turn_record(turn) for turn in shown], focus)
+        self.statusBar().showMessage(f"Resumed {session['title']} ({session['turn_count']} turns)", 5000)
+
+    # Saved turns name the model and persona, not the collaborator slot. When both slots share
+    # the same model and persona, replies alternate, and which side is which does not matter.
+    def turn_speaker(self, turn, settings, previous):
+        for key, value in (("models", turn["name"]), ("roles", turn["persona"])):
+            candidates = settings.get(key, [])
+            if candidates.count(value) == 1:
+                return candidates.index(value)
+        return 0 if previous is None else 1 - previous
+
+    def turn_record(self, turn):
+        if turn["role"] == "user":
+            return {"type": "message", "text": f"You: {turn['content']}", "is_user": True}
+        return {"type": "stream", "title": turn["name"] or turn["role"], "text": turn["content"]}
 
     @pyqtSlot()
     def stop_chat(self):
-        self.stop_event.set()
+        self.scheduler.cancel_all(RequestCancelled("Stopped by user"))
+        if self.stream_bridge is not None:
+            self.stream_bridge.cancel()
         self.update_chat_signal.emit("Chat stopped by user.", False)
         QTimer.singleShot(2000, lambda: self.statusBar().showMessage("Idle"))
 
     @pyqtSlot()
     def clear_chat(self):
         self.chat_box.clear_chat()
-        self.conversation_history = []
+        self.control_panel.visualization.clear()
+        self.conversation_history = self.create_conversation_buffer()
+        self.model_interactions.reset_conversation(self.conversation_id)
+        self.conversation_id = uuid.uuid4().hex
 
     def show_collaboration_settings(self):
         dialog = CollaborationSettingsDialog(self)
         if dialog.exec_() == QDialog.Accepted:
             self.collab_settings = dialog.get_settings()
 
+    def closeEvent(self, event):
+        self.scheduler.shutdown(RequestCancelled("Closing"))
+        if self.stream_bridge is not None:
+            self.stream_bridge.shutdown()
+        self.model_interactions.close()
+        self.chat_box.close_transcript()
+        if self.session_store is not None:
+            self.session_store.close()
+        super().closeEvent(event)
+
     def resizeEvent(self, event):
         super().resizeEvent(event)
 
+    # Errors come from worker threads and must not block a running collaboration, so they are
+    # posted to the GUI thread and shown inline instead of in a modal dialog.
     def show_error_message(self, message):
-        msg_box = QMessageBox()
-        msg_box.setIcon(QMessageBox.Critical)
-        msg_box.setWindowTitle("Error")
-        msg_box.setText(message)
-        msg_box.exec_()
+        self.error_signal.emit(message)
+
+    @pyqtSlot(str)
+    def on_error(self, message):
+        self.statusBar().showMessage(message, 10000)
+        self.chat_box.display_message(f"Error: {message}")
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -300,5 +818,13 @@ if __name__ == "__main__":
         print("Error loading Roboto font. Using system default.")
 
     main_window = MainWindow()
+    startup_timer.mark("main window constructed")
     main_window.show()
+
+    def report_startup():
+        startup_timer.mark("first window shown")
+        if "--startup-report" in sys.argv:
+            print(startup_timer.report())
+            startup_timer.write("startup_timing.json")
+    QTimer.singleShot(0, report_startup)
     sys.exit(app.exec_())
\ No newline at end of file
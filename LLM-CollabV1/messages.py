@@ -0,0 +1,53 @@
+CONTINUE_PROMPT = "Continue the conversation."
+
+ROLE_PROMPTS = {
+    "General Assistant": "You are a helpful assistant. 😊",
+    "Technical Expert": "You are an expert in technology. 🛠️",
+    "Creative Thinker": "You are a creative thinker. ✍️",
+    "Data Analyst": "You are a data analyst. 📊",
+    "Healthcare Advisor": "You are a healthcare advisor. 🏥",
+    "Educational Tutor": "You are an educational tutor. 📚",
+    "Scientific Researcher": "You are a scientific researcher. 🧪",
+    "Project Manager": "You are a project manager. 📋",
+    "Philosopher": "You are a philosopher. 🤔",
+    "Debater": "You are a skilled debater. 💬"
+}
+
+DEFAULT_ROLE_PROMPT = "You are a general assistant. 😊"
+
+def role_messages(role, user_message):
+    return [
+        {"role": "system", "content": ROLE_PROMPTS.get(role, DEFAULT_ROLE_PROMPT)},
+        {"role": "user", "content": user_message}
+    ]
+
+def normalize_messages(prompt):
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return [{"role": message["role"], "content": message["content"]} for message in prompt]
+
+def split_system(messages):
+    system = "\n\n".join(message["content"] for message in messages if message["role"] == "system")
+    return system or None, [message for message in messages if message["role"] != "system"]
+
+def ensure_user_turn(messages):
+    if not any(message["role"] == "user" for message in messages):
+        return messages + [{"role": "user", "content": CONTINUE_PROMPT}]
+    return messages
+
+# Anthropic and Gemini reject consecutive turns from the same side and expect a user turn first.
+def alternate_roles(messages):
+    merged = []
+    for message in messages:
+        if merged and merged[-1]["role"] == message["role"]:
+            merged[-1] = {"role": message["role"], "content": f"{merged[-1]['content']}\n\n{message['content']}"}
+        else:
+            merged.append(dict(message))
+    if not merged or merged[0]["role"] != "user":
+        merged.insert(0, {"role": "user", "content": CONTINUE_PROMPT})
+    return merged
+
+def flatten_messages(prompt):
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(message["content"] for message in prompt)
@@ -1,33 +1,163 @@
-import requests
+import datetime
+import hashlib
 import json
-import anthropic
-import openai
-import google.generativeai as genai
-from google.auth import credentials
-from google.oauth2 import service_account
+import threading
+from collections import OrderedDict
+from connection_pool import ConnectionPool, close_response
+from response_cache import ResponseCache
+from ollama_context import OllamaContextStore
+from stream_parser import iter_sse_json, iter_ndjson, chat_completion_delta
+from messages import normalize_messages, split_system, ensure_user_turn, alternate_roles, flatten_messages
+from conversation import estimate_tokens
+from usage import UsageTracker, empty_usage
+from telemetry import Telemetry
+from router import Router
+from resilience import Resilience, reported_tokens
+from cancellation import CancelToken, RequestCancelled, StreamTimeout, start_cancellable, watch_stream
+from providers import ProviderAdapter, ProviderRegistry, STREAMING, MODEL_LISTING, OPENAI_COMPATIBLE, LOCAL, CONTEXT_REUSE, PROMPT_CACHING, VIRTUAL
+
+def close_stream(response):
+    close = getattr(response, 'close', None)
+    if close is not None:
+        close()
 
 class ModelInteractions:
     def __init__(self, config):
         self.config = config
-        self.anthropic_client = anthropic.Client(api_key=config['API_KEYS']['anthropic'])
-        if hasattr(openai, 'Client'):
-            self.openai_client = openai.Client(api_key=config['API_KEYS']['openai'])
-        else:
-            openai.api_key = config['API_KEYS']['openai']
-            self.openai_client = openai
-        
-        # Initialize Gemini client
-        genai.configure(api_key=config['API_KEYS']['gemini'])
-        self.gemini_client = genai
+        self.connection_pool = ConnectionPool(config.get('CONNECTION_POOL'))
+        self.response_cache = ResponseCache(config.get('RESPONSE_CACHE'))
+        self.ollama_settings = config.get('OLLAMA', {})
+        self.ollama_contexts = OllamaContextStore(self.ollama_settings.get('max_conversations', 64))
+        self.client_lock = threading.Lock()
+        self._anthropic_client = None
+        self._openai_client = None
+        self._gemini_client = None
+        self.gemini_models = OrderedDict()
+        self.gemini_caches = OrderedDict()
+        self.prompt_caching = config.get('PROMPT_CACHING', {})
+        self.usage = UsageTracker()
+        self.telemetry = Telemetry(config.get('TELEMETRY'))
+        self.resilience = Resilience(config.get('RESILIENCE'))
+        self.router = Router(self, config.get('ROUTING'))
+        self.registry = ProviderRegistry()
+        self.register_default_providers()
 
-    def fetch_groq_models(self):
-        response = requests.get(self.config['API_URLS']['groq_models'], headers=self.config['HEADERS']['groq'])
+    def register_default_providers(self):
+        self.registry.register(ProviderAdapter(
+            "Groq", self.get_groq_response_stream, self.fetch_groq_models,
+            capabilities=(STREAMING, MODEL_LISTING, OPENAI_COMPATIBLE),
+            endpoint={"url": self.config['API_URLS']['groq_llm'], "headers": self.config['HEADERS']['groq']},
+            prewarm=lambda model: self.connection_pool.prewarm('groq', self.config['API_URLS']['groq_llm'])))
+        self.registry.register(ProviderAdapter(
+            "Ollama", self.get_ollama_response_stream, self.fetch_ollama_models,
+            capabilities=(STREAMING, MODEL_LISTING, LOCAL, CONTEXT_REUSE, PROMPT_CACHING),
+            prewarm=self.load_ollama_model))
+        self.registry.register(ProviderAdapter(
+            "Anthropic", self.get_anthropic_response_stream, self.fetch_anthropic_models,
+            capabilities=(STREAMING, PROMPT_CACHING), prewarm=lambda model: self.anthropic_client))
+        self.registry.register(ProviderAdapter(
+            "OpenAI", self.get_openai_response_stream, self.fetch_openai_models,
+            capabilities=(STREAMING, MODEL_LISTING, PROMPT_CACHING), prewarm=lambda model: self.openai_client))
+        self.registry.register(ProviderAdapter(
+            "Gemini", self.get_gemini_response_stream, self.fetch_gemini_models,
+            capabilities=(STREAMING, PROMPT_CACHING), prewarm=lambda model: self.gemini_client))
+        self.registry.register(ProviderAdapter(
+            "Perplexity", self.get_perplexity_response_stream, self.fetch_perplexity_models,
+            capabilities=(STREAMING, OPENAI_COMPATIBLE),
+            endpoint={"url": f"{self.config['API_URLS']['perplexity']}/chat/completions",
+                      "headers": self.perplexity_headers()},
+            prewarm=lambda model: self.connection_pool.prewarm(
+                'perplexity', f"{self.config['API_URLS']['perplexity']}/chat/completions")))
+
+        for endpoint in self.config.get('OPENAI_COMPATIBLE_ENDPOINTS', []):
+            self.register_openai_compatible_endpoint(endpoint)
+
+        if self.router.groups:
+            self.registry.register(ProviderAdapter(
+                Router.PREFIX, self.router.stream, self.router.models, capabilities=(STREAMING, MODEL_LISTING, VIRTUAL),
+                prewarm=self.router.prewarm))
+
+    # Covers llama.cpp server, vLLM and anything else exposing /v1/chat/completions.
+    def register_openai_compatible_endpoint(self, endpoint):
+        prefix = endpoint['prefix']
+        base_url = endpoint['base_url'].rstrip('/')
+        headers = {"Content-Type": "application/json"}
+        if endpoint.get('api_key'):
+            headers["Authorization"] = f"Bearer {endpoint['api_key']}"
+        provider = prefix.lower()
+
+        def stream(model, prompt, max_tokens, temperature, on_usage=None, cancel_token=None):
+            return self.get_chat_completions_stream(
+                provider, f"{base_url}/chat/completions", headers, model, prompt, max_tokens, temperature, on_usage,
+                cancel_token)
+
+        def fetch_models():
+            return self.fetch_chat_completions_models(provider, f"{base_url}/models", headers)
+
+        capabilities = [STREAMING, MODEL_LISTING, OPENAI_COMPATIBLE]
+        if endpoint.get('local', True):
+            capabilities.append(LOCAL)
+        return self.registry.register(ProviderAdapter(
+            prefix, stream, fetch_models, capabilities=capabilities,
+            endpoint={"url": f"{base_url}/chat/completions", "headers": headers},
+            prewarm=lambda model: self.connection_pool.prewarm(provider, f"{base_url}/models")))
+
+    def has_api_key(self, provider):
+        return bool(self.config['API_KEYS'].get(provider))
+
+    def require_api_key(self, provider):
+        if not self.has_api_key(provider):
+            raise ValueError(f"No API key configured for {provider}")
+        return self.config['API_KEYS'][provider]
+
+    # Provider SDKs are imported on first use so an Ollama-only setup never pays for them.
+    @property
+    def anthropic_client(self):
+        with self.client_lock:
+            if self._anthropic_client is None:
+                import anthropic
+                self._anthropic_client = anthropic.Client(api_key=self.require_api_key('anthropic'),
+                                                          timeout=self.sdk_timeout('anthropic'))
+            return self._anthropic_client
+
+    @property
+    def openai_client(self):
+        with self.client_lock:
+            if self._openai_client is None:
+                import openai
+                if hasattr(openai, 'Client'):
+                    self._openai_client = openai.Client(api_key=self.require_api_key('openai'),
+                                                        timeout=self.sdk_timeout('openai'))
+                else:
+                    openai.api_key = self.require_api_key('openai')
+                    self._openai_client = openai
+            return self._openai_client
+
+    def sdk_timeout(self, provider):
+        import httpx
+        connect_timeout, read_timeout = self.connection_pool.timeout(provider)
+        return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+    @property
+    def gemini_client(self):
+        with self.client_lock:
+            if self._gemini_client is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.require_api_key('gemini'))
+                self._gemini_client = genai
+            return self._gemini_client
+
+    def fetch_chat_completions_models(self, provider, url, headers):
+        response = self.connection_pool.get(provider, url, headers=headers)
         response.raise_for_status()
         models_data = response.json()
         return [model.get("id", "Unknown") for model in models_data.get("data", [])]
 
+    def fetch_groq_models(self):
+        return self.fetch_chat_completions_models('groq', self.config['API_URLS']['groq_models'], self.config['HEADERS']['groq'])
+
     def fetch_ollama_models(self):
-        response = requests.get(self.config['API_URLS']['ollama_models'])
+        response = self.connection_pool.get('ollama', self.config['API_URLS']['ollama_models'])
         response.raise_for_status()
         data = response.json()
         return [model['name'] for model in data.get('models', [])]
@@ -43,6 +173,8 @@ class ModelInteractions:
         ]
 
     def fetch_openai_models(self):
+        if not self.has_api_key('openai'):
+            return []
         if hasattr(self.openai_client, 'models'):
             models = self.openai_client.models.list()
             return [model.id for model in models.data if "gpt" in model.id.lower()]
@@ -67,145 +199,412 @@ class ModelInteractions:
             "mixtral-8x7b-instruct"
         ]
 
-    def get_groq_response_stream(self, model, prompt, max_tokens, temperature):
-        response = requests.post(
-            self.config['API_URLS']['groq_llm'],
-            headers=self.config['HEADERS']['groq'],
-            json={
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "stream": True
-            },
+    def chat_completions_body(self, model, prompt, max_tokens, temperature):
+        return {
+            "model": model,
+            "messages": ensure_user_turn(normalize_messages(prompt)),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+
+    def chat_completions_usage(self, data, usage):
+        reported = data.get('usage') or (data.get('x_groq') or {}).get('usage')
+        if reported:
+            usage["prompt_tokens"] = reported.get('prompt_tokens')
+            usage["output_tokens"] = reported.get('completion_tokens')
+            usage["cached_tokens"] = (reported.get('prompt_tokens_details') or {}).get('cached_tokens')
+
+    def get_chat_completions_stream(self, provider, url, headers, model, prompt, max_tokens, temperature, on_usage=None,
+                                    cancel_token=None):
+        response = start_cancellable(cancel_token, lambda: self.connection_pool.post(
+            provider,
+            url,
+            headers=headers,
+            json=self.chat_completions_body(model, prompt, max_tokens, temperature),
             stream=True
-        )
-        response.raise_for_status()
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line.decode('utf-8').split('data: ')[1])
-                if 'choices' in data and len(data['choices']) > 0:
-                    chunk = data['choices'][0]['delta'].get('content', '')
-                    if chunk:
-                        yield chunk
-
-    def get_ollama_response_stream(self, model, prompt, max_tokens, temperature):
-        response = requests.post(
-            self.config['API_URLS']['ollama_llm'],
-            json={
-                'model': model,
-                'prompt': prompt,
-                'options': {
-                    'num_predict': max_tokens,
-                    'temperature': temperature
-                },
-                'stream': True
+        ), close_response)
+        usage = empty_usage()
+        with response:
+            response.raise_for_status()
+            for data in iter_sse_json(response.iter_content(chunk_size=None)):
+                self.chat_completions_usage(data, usage)
+                chunk = chat_completion_delta(data)
+                if chunk:
+                    yield chunk
+        if on_usage:
+            on_usage(usage)
+
+    def get_groq_response_stream(self, model, prompt, max_tokens, temperature, on_usage=None, cancel_token=None):
+        return self.get_chat_completions_stream(
+            'groq', self.config['API_URLS']['groq_llm'], self.config['HEADERS']['groq'],
+            model, prompt, max_tokens, temperature, on_usage, cancel_token)
+
+    def ollama_request_body(self, model, prompt, max_tokens, temperature, conversation_id=None):
+        body = {
+            'model': model,
+            'options': {
+                'num_predict': max_tokens,
+                'temperature': temperature
             },
-            stream=True
-        )
-        response.raise_for_status()
+            'stream': True
+        }
+        if isinstance(prompt, str):
+            prompt, context = self.ollama_contexts.prepare(model, conversation_id, prompt)
+            body['prompt'] = prompt
+            if context:
+                body['context'] = context
+        else:
+            body['messages'] = normalize_messages(prompt)
+        if self.ollama_settings.get('keep_alive'):
+            body['keep_alive'] = self.ollama_settings['keep_alive']
+        return body
+
+    # Message lists go to /api/chat, where Ollama reuses the KV cache for an unchanged prefix;
+    # plain prompts keep using /api/generate with the stored context array.
+    def ollama_url(self, prompt):
+        if isinstance(prompt, str):
+            return self.config['API_URLS']['ollama_llm']
+        return self.config['API_URLS'].get('ollama_chat') or \
+            self.config['API_URLS']['ollama_llm'].replace('/api/generate', '/api/chat')
+
+    # A generate request without a prompt only loads the model, which is most of the first-token
+    # latency for a local model that is not already in memory.
+    def load_ollama_model(self, model):
+        body = {'model': model}
+        if self.ollama_settings.get('keep_alive'):
+            body['keep_alive'] = self.ollama_settings['keep_alive']
+        response = self.connection_pool.post('ollama', self.config['API_URLS']['ollama_llm'], json=body)
+        with response:
+            response.raise_for_status()
 
-        for line in response.iter_lines():
-            if line:
-                try:
-                    json_line = json.loads(line)
-                    if 'response' in json_line:
-                        yield json_line['response']
-                except json.JSONDecodeError:
-                    print(f"Error decoding JSON: {line}")
-
-    def get_anthropic_response_stream(self, model, prompt, max_tokens, temperature):
-        response = self.anthropic_client.messages.create(
-            model=model,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            messages=[{"role": "user", "content": prompt}],
+    def ollama_chunk(self, json_line, usage):
+        if json_line.get('done'):
+            usage["prompt_tokens"] = json_line.get('prompt_eval_count')
+            usage["output_tokens"] = json_line.get('eval_count')
+        if 'message' in json_line:
+            return json_line['message'].get('content', '')
+        return json_line.get('response', '')
+
+    def get_ollama_response_stream(self, model, prompt, max_tokens, temperature, conversation_id=None, on_usage=None,
+                                   cancel_token=None):
+        response = start_cancellable(cancel_token, lambda: self.connection_pool.post(
+            'ollama',
+            self.ollama_url(prompt),
+            json=self.ollama_request_body(model, prompt, max_tokens, temperature, conversation_id),
             stream=True
-        )
-        for chunk in response:
-            if chunk.type == 'text_delta':
-                yield chunk.text
+        ), close_response)
+        usage = empty_usage()
+        response_parts = []
+        with response:
+            response.raise_for_status()
+            for json_line in iter_ndjson(response.iter_content(chunk_size=None),
+                                         on_error=lambda line: print(f"Error decoding JSON: {line}")):
+                chunk = self.ollama_chunk(json_line, usage)
+                if chunk:
+                    response_parts.append(chunk)
+                    yield chunk
+                if json_line.get('done') and isinstance(prompt, str):
+                    self.ollama_contexts.remember(model, conversation_id, prompt, "".join(response_parts),
+                                                  json_line.get('context'))
+        if on_usage:
+            on_usage(usage)
+
+    # The system prompt and the latest turn carry cache breakpoints, so each request writes the
+    # whole prefix to Anthropic's prompt cache and the next turn reads it back.
+    def anthropic_request(self, model, prompt, max_tokens, temperature):
+        system, messages = split_system(normalize_messages(prompt))
+        messages = alternate_roles(messages)
+        messages[-1] = {
+            "role": messages[-1]["role"],
+            "content": [{"type": "text", "text": messages[-1]["content"], "cache_control": {"type": "ephemeral"}}]
+        }
+        request = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": messages,
+            "stream": True
+        }
+        if system:
+            request["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        return request
+
+    def anthropic_event(self, event, usage):
+        if event.type == 'message_start':
+            reported = event.message.usage
+            usage["cached_tokens"] = getattr(reported, 'cache_read_input_tokens', 0) or 0
+            usage["cache_write_tokens"] = getattr(reported, 'cache_creation_input_tokens', 0) or 0
+            usage["prompt_tokens"] = (reported.input_tokens or 0) + usage["cached_tokens"] + usage["cache_write_tokens"]
+        elif event.type == 'message_delta':
+            usage["output_tokens"] = getattr(event.usage, 'output_tokens', 0) or 0
+        elif event.type == 'content_block_delta':
+            return getattr(event.delta, 'text', None)
+        return None
 
-    def get_openai_response_stream(self, model, prompt, max_tokens, temperature):
+    def get_anthropic_response_stream(self, model, prompt, max_tokens, temperature, on_usage=None, cancel_token=None):
+        request = self.anthropic_request(model, prompt, max_tokens, temperature)
+        response = start_cancellable(cancel_token, lambda: self.anthropic_client.messages.create(**request),
+                                     close_stream)
+        usage = empty_usage()
+        for event in response:
+            text = self.anthropic_event(event, usage)
+            if text:
+                yield text
+        if on_usage:
+            on_usage(usage)
+
+    def openai_chunk(self, chunk, usage):
+        reported = getattr(chunk, 'usage', None)
+        if reported:
+            usage["prompt_tokens"] = reported.prompt_tokens or 0
+            usage["output_tokens"] = reported.completion_tokens or 0
+            details = getattr(reported, 'prompt_tokens_details', None)
+            usage["cached_tokens"] = getattr(details, 'cached_tokens', None)
+        if chunk.choices:
+            return chunk.choices[0].delta.content
+        return None
+
+    # OpenAI caches identical prompt prefixes automatically; include_usage reports how much of it hit.
+    def get_openai_response_stream(self, model, prompt, max_tokens, temperature, on_usage=None, cancel_token=None):
+        messages = ensure_user_turn(normalize_messages(prompt))
+        usage = empty_usage()
         if hasattr(self.openai_client, 'chat'):
-            response = self.openai_client.chat.completions.create(
+            response = start_cancellable(cancel_token, lambda: self.openai_client.chat.completions.create(
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
-                stream=True
-            )
+                stream=True,
+                stream_options={"include_usage": True}
+            ), close_stream)
             for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+                content = self.openai_chunk(chunk, usage)
+                if content is not None:
+                    yield content
         else:
             response = self.openai_client.ChatCompletion.create(
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
+                messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 stream=True
             )
             for chunk in response:
-                if chunk['choices'][0]['delta'].get('content'):
+                if chunk['choices'] and chunk['choices'][0]['delta'].get('content'):
                     yield chunk['choices'][0]['delta']['content']
+        if on_usage:
+            on_usage(usage)
 
-    def get_gemini_response_stream(self, model, prompt, max_tokens, temperature):
-        gemini_model = self.gemini_client.GenerativeModel(model_name=model)
-        response = gemini_model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                max_output_tokens=max_tokens,
-                temperature=temperature
-            ),
-            stream=True
+    def gemini_request(self, model, prompt, max_tokens, temperature):
+        system, messages = split_system(normalize_messages(prompt))
+        contents = [
+            {"role": "model" if message["role"] == "assistant" else "user", "parts": [message["content"]]}
+            for message in alternate_roles(messages)
+        ]
+        gemini_model, contents = self.get_gemini_cached_model(model, system, contents)
+        generation_config = self.gemini_client.types.GenerationConfig(
+            max_output_tokens=max_tokens,
+            temperature=temperature
         )
+        return gemini_model, contents, generation_config
+
+    def gemini_chunk(self, chunk, usage):
+        reported = getattr(chunk, 'usage_metadata', None)
+        if reported:
+            usage["prompt_tokens"] = getattr(reported, 'prompt_token_count', 0) or 0
+            usage["cached_tokens"] = getattr(reported, 'cached_content_token_count', None)
+            usage["output_tokens"] = getattr(reported, 'candidates_token_count', 0) or 0
+        return chunk.text
+
+    # The Gemini SDK has no way to abort a stream, so a cancelled request stops at the next chunk.
+    def get_gemini_response_stream(self, model, prompt, max_tokens, temperature, on_usage=None, cancel_token=None):
+        gemini_model, contents, generation_config = self.gemini_request(model, prompt, max_tokens, temperature)
+        response = start_cancellable(cancel_token, lambda: gemini_model.generate_content(
+            contents,
+            generation_config=generation_config,
+            stream=True
+        ))
+        usage = empty_usage()
         for chunk in response:
-            if chunk.text:
-                yield chunk.text
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            text = self.gemini_chunk(chunk, usage)
+            if text:
+                yield text
+        if on_usage:
+            on_usage(usage)
 
-    def get_perplexity_response_stream(self, model, prompt, max_tokens, temperature):
-        headers = {
+    def get_gemini_model(self, model, system_instruction=None):
+        key = (model, system_instruction)
+        with self.client_lock:
+            gemini_model = self.gemini_models.get(key)
+            if gemini_model is not None:
+                self.gemini_models.move_to_end(key)
+                return gemini_model
+        if system_instruction:
+            gemini_model = self.gemini_client.GenerativeModel(model_name=model, system_instruction=system_instruction)
+        else:
+            gemini_model = self.gemini_client.GenerativeModel(model_name=model)
+        with self.client_lock:
+            self.gemini_models[key] = gemini_model
+            while len(self.gemini_models) > 32:
+                self.gemini_models.popitem(last=False)
+        return gemini_model
+
+    # Explicit Gemini context caching only pays off for large prefixes, so it is opt-in and
+    # limited to prompts whose prefix clears the configured minimum size.
+    def get_gemini_cached_model(self, model, system, contents):
+        settings = self.prompt_caching
+        if not settings.get('gemini_context_cache') or len(contents) < 2:
+            return self.get_gemini_model(model, system), contents
+
+        prefix = contents[:-1]
+        prefix_text = (system or "") + "".join(part for content in prefix for part in content["parts"])
+        if estimate_tokens(prefix_text) < settings.get('gemini_min_tokens', 32768):
+            return self.get_gemini_model(model, system), contents
+
+        key = hashlib.sha256(json.dumps([model, system, prefix]).encode('utf-8')).hexdigest()
+        try:
+            with self.client_lock:
+                cached_content = self.gemini_caches.get(key)
+            if cached_content is None:
+                cached_content = self.gemini_client.caching.CachedContent.create(
+                    model=model,
+                    system_instruction=system,
+                    contents=prefix,
+                    ttl=datetime.timedelta(seconds=settings.get('gemini_ttl_seconds', 600))
+                )
+                with self.client_lock:
+                    self.gemini_caches[key] = cached_content
+                    while len(self.gemini_caches) > 16:
+                        self.gemini_caches.popitem(last=False)
+            return self.gemini_client.GenerativeModel.from_cached_content(cached_content=cached_content), contents[-1:]
+        except Exception as e:
+            print(f"Gemini context caching unavailable, sending the full prompt: {e}")
+            return self.get_gemini_model(model, system), contents
+
+    def perplexity_headers(self):
+        return {
             "Authorization": f"Bearer {self.config['API_KEYS']['perplexity']}",
             "Content-Type": "application/json"
         }
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stream": True
-        }
-        response = requests.post(
-            f"{self.config['API_URLS']['perplexity']}/chat/completions",
-            headers=headers,
-            json=data,
-            stream=True
-        )
-        response.raise_for_status()
-        for line in response.iter_lines():
-            if line:
-                try:
-                    data = json.loads(line.decode('utf-8').split('data: ')[1])
-                    if 'choices' in data and len(data['choices']) > 0:
-                        chunk = data['choices'][0]['delta'].get('content', '')
-                        if chunk:
-                            yield chunk
-                except json.JSONDecodeError:
-                    continue
-
-    def get_model_response_stream(self, model, prompt, max_tokens=1000, temperature=0.7):
-        if model.startswith("Groq: "):
-            yield from self.get_groq_response_stream(model.replace("Groq: ", ""), prompt, max_tokens, temperature)
-        elif model.startswith("Ollama: "):
-            yield from self.get_ollama_response_stream(model.replace("Ollama: ", ""), prompt, max_tokens, temperature)
-        elif model.startswith("Anthropic: "):
-            yield from self.get_anthropic_response_stream(model.replace("Anthropic: ", ""), prompt, max_tokens, temperature)
-        elif model.startswith("OpenAI: "):
-            yield from self.get_openai_response_stream(model.replace("OpenAI: ", ""), prompt, max_tokens, temperature)
-        elif model.startswith("Gemini: "):
-            yield from self.get_gemini_response_stream(model.replace("Gemini: ", ""), prompt, max_tokens, temperature)
-        elif model.startswith("Perplexity: "):
-            yield from self.get_perplexity_response_stream(model.replace("Perplexity: ", ""), prompt, max_tokens, temperature)
+
+    def get_perplexity_response_stream(self, model, prompt, max_tokens, temperature, on_usage=None, cancel_token=None):
+        return self.get_chat_completions_stream(
+            'perplexity', f"{self.config['API_URLS']['perplexity']}/chat/completions", self.perplexity_headers(),
+            model, prompt, max_tokens, temperature, on_usage, cancel_token)
+
+    def connection_stats(self):
+        return self.connection_pool.stats()
+
+    def usage_stats(self):
+        return self.usage.stats()
+
+    def telemetry_stats(self):
+        return self.telemetry.snapshot()
+
+    def routing_stats(self):
+        return self.router.stats()
+
+    def resilience_stats(self):
+        return self.resilience.stats()
+
+    def prewarm(self, model):
+        try:
+            adapter, model_id = self.registry.resolve(model)
+            if adapter.prewarm is not None:
+                adapter.prewarm(model_id.name)
+        except Exception as e:
+            print(f"Could not prewarm {model}: {e}")
+
+    def request_tokens(self, prompt, max_tokens):
+        return estimate_tokens(flatten_messages(prompt)) + max_tokens
+
+    # reported, when given, keeps the latest attempt's usage for the TPM limit to settle against.
+    def usage_recorder(self, model, metrics, reported=None):
+        def record(usage):
+            self.usage.record(model, usage)
+            metrics.usage(usage)
+            if reported is not None:
+                reported.update(usage)
+        return record
+
+    def cache_stats(self):
+        return self.response_cache.stats()
+
+    def close(self):
+        self.connection_pool.close()
+        self.response_cache.close()
+        if self.telemetry.export_paths:
+            self.telemetry.export()
+
+    def reset_conversation(self, conversation_id=None):
+        self.ollama_contexts.reset(conversation_id)
+
+    def get_model_response_stream(self, model, prompt, max_tokens=1000, temperature=0.7, use_cache=True,
+                                  conversation_id=None, metrics=None, cancel_token=None):
+        try:
+            adapter, model_id = self.registry.resolve(model)
+        except (KeyError, ValueError):
+            yield "Invalid model selected."
+            return
+
+        cache_key = None
+        if use_cache and self.response_cache.should_cache(temperature):
+            cache_key = self.response_cache.key(str(model_id), prompt, max_tokens, temperature)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield from cached
+                return
+
+        if metrics is None:
+            metrics = self.telemetry.start(str(model_id))
+        reported = {}
+        stream_options = {'on_usage': self.usage_recorder(str(model_id), metrics, reported)}
+        if conversation_id is not None and adapter.supports(CONTEXT_REUSE):
+            stream_options['conversation_id'] = conversation_id
+
+        if cancel_token is None:
+            cancel_token = CancelToken()
+        if adapter.supports(VIRTUAL):
+            stream = adapter.stream(model_id.name, prompt, max_tokens, temperature, cancel_token=cancel_token,
+                                    **stream_options)
         else:
-            yield "Invalid model selected."
\ No newline at end of file
+            # Every attempt gets its own child token, so a first-token or idle timeout aborts that
+            # attempt and leaves the retry loop free to start another one.
+            settings = self.connection_pool.settings_for(adapter.key)
+
+            def start_stream():
+                reported.clear()
+                return watch_stream(
+                    lambda token: adapter.stream(model_id.name, prompt, max_tokens, temperature,
+                                                 cancel_token=token, **stream_options),
+                    cancel_token, settings["first_token_timeout"], settings["idle_timeout"], str(model_id))
+
+            stream = self.resilience.stream(
+                adapter.key, start_stream, self.request_tokens(prompt, max_tokens), cancel_token,
+                lambda: reported_tokens(reported))
+
+        chunks = []
+        status = "cancelled"
+        try:
+            for chunk in stream:
+                metrics.chunk(chunk)
+                chunks.append(chunk)
+                yield chunk
+            status = "ok"
+        except RequestCancelled:
+            raise
+        except StreamTimeout:
+            status = "timeout"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            self.telemetry.finish(metrics, status)
+
+        # Only reached when the stream ran to completion, so interrupted responses are never cached.
+        if cache_key is not None:
+            self.response_cache.put(cache_key, str(model_id), chunks)
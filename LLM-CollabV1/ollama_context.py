@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+
+class OllamaContextStore:
+    def __init__(self, max_conversations=64):
+        self.max_conversations = max_conversations
+        self.states = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"reused": 0, "full_prefill": 0}
+
+    # Ollama's context array already encodes the previous prompt and reply, so only text
+    # appended since then has to be sent. Anything else (edited or trimmed history) starts over.
+    def prepare(self, model, conversation_id, prompt):
+        if conversation_id is None:
+            return prompt, None
+
+        with self.lock:
+            state = self.states.get((model, conversation_id))
+            if state is not None:
+                self.states.move_to_end((model, conversation_id))
+
+        if state is not None and prompt.startswith(state["prompt"]):
+            delta = prompt[len(state["prompt"]):]
+            stripped = delta.lstrip("\n")
+            if state["response"] and stripped.startswith(state["response"]):
+                delta = stripped[len(state["response"]):]
+            if delta.strip():
+                with self.lock:
+                    self.counters["reused"] += 1
+                return delta.lstrip("\n"), state["context"]
+
+        with self.lock:
+            self.counters["full_prefill"] += 1
+        return prompt, None
+
+    def remember(self, model, conversation_id, prompt, response, context):
+        if conversation_id is None or not context:
+            return
+        with self.lock:
+            self.states[(model, conversation_id)] = {"prompt": prompt, "response": response, "context": context}
+            self.states.move_to_end((model, conversation_id))
+            while len(self.states) > self.max_conversations:
+                self.states.popitem(last=False)
+
+    def reset(self, conversation_id=None):
+        with self.lock:
+            if conversation_id is None:
+                self.states.clear()
+            else:
+                for key in [key for key in self.states if key[1] == conversation_id]:
+                    del self.states[key]
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["conversations"] = len(self.states)
+        return stats
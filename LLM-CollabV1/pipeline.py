@@ -0,0 +1,199 @@
+import queue
+import threading
+from collections import deque
+
+from cancellation import CancelToken, RequestCancelled
+from scheduler import QueueFull, BACKGROUND
+
+DEFAULT_PIPELINE_SETTINGS = {
+    "enabled": False,
+    "prewarm": True,
+    "speculate": False,
+    "speculate_after_fraction": 0.8,
+    "reply_history": 8,
+    "max_speculations_per_turn": 3
+}
+
+SENTENCE_ENDINGS = (".", "!", "?", "\n")
+
+def ends_sentence(text):
+    stripped = text.rstrip(" \t")
+    return stripped.endswith(SENTENCE_ENDINGS)
+
+def token_count(characters):
+    return (characters + 3) // 4
+
+# The next model's turn, started on the whole reply so far and buffered until that reply is
+# final. It runs as a background child of the collaboration's job, inside the provider slots
+# the collaboration already holds, and is cancelled with it. Nothing reaches the chat unless
+# the turn is confirmed.
+class SpeculativeTurn:
+    def __init__(self, pipeline, model, prompt, prefix, max_tokens, temperature, parent):
+        self.model = model
+        self.prefix = prefix
+        self.cancel_token = CancelToken(parent.cancel_token)
+        self.metrics = pipeline.model_interactions.telemetry.start(model)
+        self.events = queue.Queue()
+        self.scheduler = pipeline.scheduler
+        self.job = self.scheduler.submit(self._run, pipeline.model_interactions, prompt, max_tokens, temperature,
+                                         priority=BACKGROUND, providers=[model.partition(": ")[0]],
+                                         description=f"Speculative turn for {model}", parent=parent)
+
+    def _run(self, job, model_interactions, prompt, max_tokens, temperature):
+        try:
+            for chunk in model_interactions.get_model_response_stream(
+                    self.model, prompt, max_tokens=max_tokens, temperature=temperature, use_cache=False,
+                    metrics=self.metrics, cancel_token=self.cancel_token):
+                self.events.put(("chunk", chunk))
+        except Exception as e:
+            self.events.put(("error", e))
+        else:
+            self.events.put(("done", None))
+
+    # A turn still waiting for a worker cannot be used: the collaboration would wait on it with
+    # no idea how long that takes.
+    def started(self):
+        return self.job.started_at is not None
+
+    def cancel(self):
+        reason = RequestCancelled("Speculative turn discarded")
+        self.scheduler.cancel(self.job, reason)
+        self.cancel_token.cancel(reason)
+        self.cancel_token.detach()
+
+    def __iter__(self):
+        while True:
+            kind, payload = self.events.get()
+            if kind == "chunk":
+                yield payload
+            elif kind == "done":
+                self.cancel_token.detach()
+                return
+            else:
+                raise payload
+
+# Follows one reply as it streams. Once the reply has reached speculate_after_fraction of its
+# expected length (the average of this model's recent replies, or max_tokens before there are
+# any) and has just ended a sentence, the next turn starts on everything so far. Any further
+# text other than whitespace drops that speculation, and another may start at a later sentence
+# end. So a confirmed turn always answered exactly the reply that goes into the conversation.
+class Speculator:
+    def __init__(self, pipeline, model, next_model, build_prompt, max_tokens, temperature, job):
+        self.pipeline = pipeline
+        self.model = model
+        self.next_model = next_model
+        self.build_prompt = build_prompt
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.job = job
+        self.threshold = pipeline.expected_tokens(model, max_tokens) * pipeline.speculate_after_fraction
+        self.parts = []
+        self.characters = 0
+        self.tail = ""
+        self.current = None
+        self.attempts = 0
+
+    def update(self, chunk):
+        self.parts.append(chunk)
+        self.characters += len(chunk)
+        self.tail = (self.tail + chunk)[-16:]
+        if self.current is not None:
+            if not chunk.strip():
+                return
+            self.pipeline.discard(self.current)
+            self.current = None
+        if self.attempts >= self.pipeline.max_speculations or token_count(self.characters) < self.threshold:
+            return
+        if not ends_sentence(self.tail):
+            return
+        prefix = "".join(self.parts)
+        self.attempts += 1
+        try:
+            self.current = SpeculativeTurn(self.pipeline, self.next_model, self.build_prompt(prefix), prefix,
+                                           self.max_tokens, self.temperature, self.job)
+        except (QueueFull, RuntimeError):
+            return
+        self.pipeline.count("speculated")
+
+    def finish(self):
+        self.pipeline.record_reply(self.model, self.characters)
+        current, self.current = self.current, None
+        if current is None:
+            return None
+        if current.started():
+            self.pipeline.count("confirmed")
+            return current
+        self.pipeline.discard(current)
+        return None
+
+    def cancel(self):
+        if self.current is not None:
+            self.pipeline.discard(self.current)
+            self.current = None
+
+class Pipeline:
+    def __init__(self, model_interactions, scheduler, settings=None):
+        settings = dict(DEFAULT_PIPELINE_SETTINGS, **(settings or {}))
+        self.model_interactions = model_interactions
+        self.scheduler = scheduler
+        self.enabled = settings["enabled"]
+        self.prewarm_enabled = settings["prewarm"]
+        self.speculate = settings["speculate"]
+        self.speculate_after_fraction = settings["speculate_after_fraction"]
+        self.reply_history = max(settings["reply_history"], 1)
+        self.max_speculations = settings["max_speculations_per_turn"]
+        self.counters = {"prewarmed": 0, "speculated": 0, "confirmed": 0, "discarded": 0}
+        self.reply_lengths = {}
+        self.prewarm_jobs = {}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def record_reply(self, model, characters):
+        with self.lock:
+            lengths = self.reply_lengths.setdefault(model, deque(maxlen=self.reply_history))
+            lengths.append(characters)
+
+    def expected_tokens(self, model, max_tokens):
+        with self.lock:
+            lengths = self.reply_lengths.get(model)
+            if not lengths:
+                return max_tokens
+            return min(token_count(sum(lengths) // len(lengths)), max_tokens)
+
+    # A background child of the collaboration's job, so the handshake (or an Ollama model load)
+    # overlaps the current model's generation inside the provider slot the collaboration holds.
+    # At most one prewarm per model is waiting at a time, and one still waiting when the
+    # collaboration ends is dropped with it.
+    def prewarm(self, model, parent):
+        if not self.enabled or not self.prewarm_enabled:
+            return
+        with self.lock:
+            job = self.prewarm_jobs.get(model)
+            if job is not None and job.state == "queued":
+                return
+            try:
+                self.prewarm_jobs[model] = self.scheduler.submit(
+                    self._prewarm, model, priority=BACKGROUND, providers=[model.partition(": ")[0]],
+                    description=f"Prewarm {model}", parent=parent)
+            except (QueueFull, RuntimeError):
+                return
+            self.counters["prewarmed"] += 1
+
+    def _prewarm(self, job, model):
+        self.model_interactions.prewarm(model)
+
+    def speculator(self, model, next_model, build_prompt, max_tokens, temperature, job):
+        if not self.enabled or not self.speculate:
+            return None
+        return Speculator(self, model, next_model, build_prompt, max_tokens, temperature, job)
+
+    def discard(self, speculation):
+        speculation.cancel()
+        self.count("discarded")
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
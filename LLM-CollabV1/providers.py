@@ -0,0 +1,69 @@
+STREAMING = "streaming"
+MODEL_LISTING = "model_listing"
+OPENAI_COMPATIBLE = "openai_compatible"
+LOCAL = "local"
+CONTEXT_REUSE = "context_reuse"
+PROMPT_CACHING = "prompt_caching"
+VIRTUAL = "virtual"
+
+class ModelId:
+    SEPARATOR = ": "
+
+    def __init__(self, provider, name):
+        self.provider = provider
+        self.name = name
+
+    @classmethod
+    def parse(cls, model):
+        provider, separator, name = model.partition(cls.SEPARATOR)
+        if not separator or not name:
+            raise ValueError(f"Model identifier must look like 'Provider: model', got {model!r}")
+        return cls(provider, name)
+
+    def __str__(self):
+        return f"{self.provider}{self.SEPARATOR}{self.name}"
+
+    def __repr__(self):
+        return f"ModelId({self.provider!r}, {self.name!r})"
+
+class ProviderAdapter:
+    def __init__(self, prefix, stream, fetch_models, capabilities=(), endpoint=None, prewarm=None):
+        self.prefix = prefix
+        self.key = prefix.lower()
+        self.stream = stream
+        self.fetch_models = fetch_models
+        self.capabilities = frozenset(capabilities)
+        self.endpoint = endpoint
+        self.prewarm = prewarm
+
+    def supports(self, capability):
+        return capability in self.capabilities
+
+class ProviderRegistry:
+    def __init__(self):
+        self.adapters = {}
+
+    def register(self, adapter):
+        if adapter.prefix in self.adapters:
+            raise ValueError(f"Provider {adapter.prefix!r} is already registered")
+        self.adapters[adapter.prefix] = adapter
+        return adapter
+
+    def get(self, prefix):
+        return self.adapters[prefix]
+
+    def providers(self):
+        return list(self.adapters)
+
+    def resolve(self, model):
+        model_id = model if isinstance(model, ModelId) else ModelId.parse(model)
+        adapter = self.adapters.get(model_id.provider)
+        if adapter is None:
+            raise KeyError(f"No provider registered for {model_id.provider!r}")
+        return adapter, model_id
+
+    def __contains__(self, prefix):
+        return prefix in self.adapters
+
+    def __iter__(self):
+        return iter(self.adapters.values())
@@ -0,0 +1,318 @@
+import asyncio
+import random
+import threading
+import time
+
+DEFAULT_RESILIENCE_SETTINGS = {
+    "rpm": 0,
+    "tpm": 0,
+    "max_retries": 3,
+    "backoff_base_seconds": 0.5,
+    "backoff_max_seconds": 30.0,
+    "failure_threshold": 5,
+    "reset_timeout_seconds": 30.0
+}
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+class CircuitOpenError(Exception):
+    pass
+
+# Sleeps that end early, with the cancellation reason raised, when the request is cancelled.
+def pause(delay, cancel_token=None):
+    if cancel_token is None:
+        time.sleep(delay)
+    elif cancel_token.wait(delay):
+        cancel_token.raise_if_cancelled()
+
+def status_code(error):
+    for source in (error, getattr(error, "response", None)):
+        for name in ("status_code", "status"):
+            value = getattr(source, name, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+def retry_after(error):
+    for source in (getattr(error, "response", None), error):
+        headers = getattr(source, "headers", None)
+        if not headers:
+            continue
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                return None
+    return None
+
+# requests, aiohttp and the provider SDKs each have their own exception classes, so
+# connection problems and timeouts are recognised by name rather than by type.
+def is_connection_error(error):
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any("Timeout" in cls.__name__ or "Connection" in cls.__name__ for cls in type(error).__mro__)
+
+def is_retryable(error):
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return is_connection_error(error)
+
+# What a finished request really cost against a TPM limit, or None when the provider did
+# not report both the prompt and the output side.
+def reported_tokens(usage):
+    if usage.get("prompt_tokens") is None or usage.get("output_tokens") is None:
+        return None
+    return usage["prompt_tokens"] + usage["output_tokens"]
+
+# Rate limiting is the provider protecting itself, not the provider being down.
+def is_provider_failure(error):
+    status = status_code(error)
+    if status is not None:
+        return status >= 500
+    return is_connection_error(error)
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Takes the tokens now and returns how long the caller has to wait before using them,
+    # so the same bucket works for blocking threads and for coroutines.
+    def reserve(self, amount=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    # Gives back tokens that were reserved but not used, or takes more when the reservation
+    # was too small; either way requests waiting later see the real spend.
+    def adjust(self, amount):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial = False
+        self.lock = threading.Lock()
+
+    # Once the reset timeout has passed, exactly one request is let through as a trial; the
+    # others are turned away until it has succeeded (closing the circuit) or failed.
+    def check(self):
+        with self.lock:
+            if self.state == "closed":
+                return
+            if self.state == "half_open":
+                if not self.trial:
+                    self.trial = True
+                    return
+                raise CircuitOpenError(f"{self.name} is recovering, waiting for a trial request")
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining <= 0:
+                self.state = "half_open"
+                self.trial = True
+                return
+        raise CircuitOpenError(f"{self.name} is failing, not sending requests for another {remaining:.1f}s")
+
+    def available(self):
+        with self.lock:
+            if self.state == "half_open":
+                return not self.trial
+            return self.state == "closed" or time.monotonic() >= self.opened_at + self.reset_timeout
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+    # A trial that ended without a verdict (cancelled, or a client error that says nothing
+    # about the provider's health) lets the next request be the trial instead.
+    def release(self):
+        with self.lock:
+            self.trial = False
+
+class ProviderGuard:
+    def __init__(self, provider, settings):
+        self.provider = provider
+        self.requests = TokenBucket(settings["rpm"]) if settings["rpm"] else None
+        self.tokens = TokenBucket(settings["tpm"]) if settings["tpm"] else None
+        self.breaker = CircuitBreaker(provider, settings["failure_threshold"], settings["reset_timeout_seconds"])
+        self.max_retries = settings["max_retries"]
+        self.backoff_base = settings["backoff_base_seconds"]
+        self.backoff_max = settings["backoff_max_seconds"]
+        self.counters = {"requests": 0, "retries": 0, "throttled_seconds": 0.0, "rejected": 0}
+        self.lock = threading.Lock()
+
+    def admit(self, estimated_tokens):
+        try:
+            self.breaker.check()
+        except CircuitOpenError:
+            with self.lock:
+                self.counters["rejected"] += 1
+            raise
+        delay = 0.0
+        if self.requests is not None:
+            delay = self.requests.reserve(1)
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(estimated_tokens))
+        with self.lock:
+            self.counters["requests"] += 1
+            self.counters["throttled_seconds"] += delay
+        return delay
+
+    # The TPM bucket is charged prompt plus max_tokens up front; the difference from what the
+    # provider reports is settled after each attempt. An attempt that failed before producing
+    # anything and reported nothing gets its whole reservation back.
+    def finish_attempt(self, estimated_tokens, started, used_tokens=None):
+        self.breaker.release()
+        if self.tokens is None or not estimated_tokens:
+            return
+        used = used_tokens() if used_tokens is not None else None
+        if used is None and not started:
+            used = 0
+        if used is not None:
+            self.tokens.adjust(min(estimated_tokens, self.tokens.capacity) - used)
+
+    # Full jitter keeps clients that failed together from retrying together; a Retry-After
+    # from the provider is a floor, not something to jitter below.
+    def backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        wait = retry_after(error)
+        if wait is not None:
+            delay = max(delay, min(wait, self.backoff_max))
+        with self.lock:
+            self.counters["retries"] += 1
+        return delay
+
+    def should_retry(self, error, attempt, started):
+        if is_provider_failure(error):
+            self.breaker.record_failure()
+        return not started and attempt < self.max_retries and is_retryable(error)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["circuit"] = self.breaker.state
+        return stats
+
+class Resilience:
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.defaults = dict(DEFAULT_RESILIENCE_SETTINGS, **settings.get("default", {}))
+        self.overrides = settings.get("providers", {})
+        self.guards = {}
+        self.lock = threading.Lock()
+
+    def guard(self, provider):
+        with self.lock:
+            guard = self.guards.get(provider)
+            if guard is None:
+                guard = ProviderGuard(provider, dict(self.defaults, **self.overrides.get(provider, {})))
+                self.guards[provider] = guard
+            return guard
+
+    def available(self, provider):
+        return self.guard(provider).breaker.available()
+
+    def call(self, provider, function, *args, **kwargs):
+        guard = self.guard(provider)
+        attempt = 0
+        while True:
+            delay = guard.admit(0)
+            try:
+                if delay:
+                    time.sleep(delay)
+                result = function(*args, **kwargs)
+            except Exception as e:
+                if not guard.should_retry(e, attempt, False):
+                    raise
+                time.sleep(guard.backoff(attempt, e))
+                attempt += 1
+                continue
+            else:
+                guard.breaker.record_success()
+                return result
+            finally:
+                guard.finish_attempt(0, True)
+
+    # A stream is only retried if it failed before yielding anything; once text has reached
+    # the caller a retry would repeat it.
+    def stream(self, provider, start_stream, estimated_tokens=0, cancel_token=None, used_tokens=None):
+        guard = self.guard(provider)
+        attempt = 0
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            delay = guard.admit(estimated_tokens)
+            started = False
+            try:
+                if delay:
+                    pause(delay, cancel_token)
+                for chunk in start_stream():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise
+                if not guard.should_retry(e, attempt, started):
+                    raise
+                pause(guard.backoff(attempt, e), cancel_token)
+                attempt += 1
+                continue
+            else:
+                guard.breaker.record_success()
+                return
+            finally:
+                guard.finish_attempt(estimated_tokens, started, used_tokens)
+
+    async def astream(self, provider, start_stream, estimated_tokens=0, used_tokens=None):
+        guard = self.guard(provider)
+        attempt = 0
+        while True:
+            delay = guard.admit(estimated_tokens)
+            started = False
+            try:
+                if delay:
+                    await asyncio.sleep(delay)
+                async for chunk in start_stream():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if not guard.should_retry(e, attempt, started):
+                    raise
+                await asyncio.sleep(guard.backoff(attempt, e))
+                attempt += 1
+                continue
+            else:
+                guard.breaker.record_success()
+                return
+            finally:
+                guard.finish_attempt(estimated_tokens, started, used_tokens)
+
+    def stats(self):
+        with self.lock:
+            guards = dict(self.guards)
+        return {provider: guard.stats() for provider, guard in guards.items()}
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_SETTINGS = {
+    "enabled": False,
+    "path": "response_cache.sqlite3",
+    "memory_entries": 256,
+    "max_entries": 10000,
+    "max_bytes": 50 * 1024 * 1024,
+    "ttl_seconds": 7 * 86400,
+    "max_temperature": 0.7
+}
+
+class ResponseCache:
+    def __init__(self, settings=None):
+        settings = dict(DEFAULT_CACHE_SETTINGS, **(settings or {}))
+        self.enabled = settings["enabled"]
+        self.path = settings["path"]
+        self.memory_entries = settings["memory_entries"]
+        self.max_entries = settings["max_entries"]
+        self.max_bytes = settings["max_bytes"]
+        self.ttl = settings["ttl_seconds"]
+        self.max_temperature = settings["max_temperature"]
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stored": 0, "evicted": 0}
+
+    def _connection(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    chunks TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self.db.commit()
+        return self.db
+
+    # High temperatures ask for varied samples, so replaying one would change behaviour.
+    def should_cache(self, temperature):
+        if not self.enabled:
+            return False
+        if temperature > self.max_temperature:
+            with self.lock:
+                self.counters["bypassed"] += 1
+            return False
+        return True
+
+    def key(self, model, prompt, max_tokens, temperature):
+        payload = json.dumps([model, prompt, max_tokens, round(float(temperature), 3)], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                chunks, created_at = entry
+                if now - created_at <= self.ttl:
+                    self.memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return chunks
+                del self.memory[key]
+
+            db = self._connection()
+            row = db.execute("SELECT chunks, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            if now - row[1] > self.ttl:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                self.counters["evicted"] += 1
+                self.counters["misses"] += 1
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+            chunks = json.loads(row[0])
+            self._remember(key, chunks, row[1])
+            self.counters["disk_hits"] += 1
+            return chunks
+
+    def put(self, key, model, chunks):
+        if not chunks:
+            return
+        now = time.time()
+        serialized = json.dumps(chunks, ensure_ascii=False)
+        with self.lock:
+            self._remember(key, list(chunks), now)
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, chunks, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, serialized, len(serialized), now, now)
+            )
+            self._evict(db, now)
+            db.commit()
+            self.counters["stored"] += 1
+
+    def _remember(self, key, chunks, created_at):
+        self.memory[key] = (chunks, created_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict(self, db, now):
+        evicted = db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        count, total_size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self.max_entries or total_size > self.max_bytes:
+            row = db.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT 1").fetchone()
+            if row is None:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self.memory.pop(row[0], None)
+            count -= 1
+            total_size -= row[1]
+            evicted += 1
+        self.counters["evicted"] += evicted
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None or self.enabled:
+                db = self._connection()
+                db.execute("DELETE FROM responses")
+                db.commit()
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
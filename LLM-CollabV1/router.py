@@ -0,0 +1,200 @@
+import queue
+import threading
+import time
+
+from telemetry import percentile
+from cancellation import CancelToken, RequestCancelled
+
+DEFAULT_ROUTING_SETTINGS = {
+    "groups": {},
+    "min_samples": 3,
+    "expected_output_tokens": 200,
+    "hedge": True,
+    "hedge_percentile": 0.9,
+    "hedge_min_seconds": 0.5,
+    "hedge_default_seconds": 3.0,
+    "failure_threshold": 2,
+    "failure_cooldown_seconds": 60
+}
+
+# "Auto: <group>" models are served by whichever member of the group looks fastest right now,
+# judged from the recent telemetry of each backend and from how often it has been failing.
+class Router:
+    PREFIX = "Auto"
+
+    def __init__(self, model_interactions, settings=None):
+        settings = dict(DEFAULT_ROUTING_SETTINGS, **(settings or {}))
+        self.model_interactions = model_interactions
+        self.groups = settings["groups"]
+        self.min_samples = settings["min_samples"]
+        self.expected_output_tokens = settings["expected_output_tokens"]
+        self.hedge = settings["hedge"]
+        self.hedge_percentile = settings["hedge_percentile"]
+        self.hedge_min_seconds = settings["hedge_min_seconds"]
+        self.hedge_default_seconds = settings["hedge_default_seconds"]
+        self.failure_threshold = settings["failure_threshold"]
+        self.failure_cooldown = settings["failure_cooldown_seconds"]
+        self.failures = {}
+        self.lock = threading.Lock()
+        self.counters = {"routed": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    def models(self):
+        return list(self.groups)
+
+    def healthy(self, model):
+        with self.lock:
+            failure = self.failures.get(model)
+        if failure is not None and failure[1] > time.monotonic():
+            return False
+        adapter, _ = self.model_interactions.registry.resolve(model)
+        return self.model_interactions.resilience.available(adapter.key)
+
+    def record_success(self, model):
+        with self.lock:
+            self.failures.pop(model, None)
+
+    def record_failure(self, model):
+        with self.lock:
+            count = self.failures.get(model, (0, 0.0))[0] + 1
+            until = time.monotonic() + self.failure_cooldown if count >= self.failure_threshold else 0.0
+            self.failures[model] = (count, until)
+
+    def recent(self, model):
+        return [summary for summary in self.model_interactions.telemetry.recent(model) if summary["status"] == "ok"]
+
+    # Expected seconds to a typical reply. Backends without enough samples score lowest so
+    # they get tried and measured before the ranking settles.
+    def score(self, model):
+        summaries = self.recent(model)
+        ttfts = [summary["ttft_seconds"] for summary in summaries if summary["ttft_seconds"] is not None]
+        if len(ttfts) < self.min_samples:
+            return -1.0
+        score = percentile(ttfts, 0.5)
+        rates = [summary["tokens_per_second"] for summary in summaries if summary["tokens_per_second"]]
+        if rates:
+            score += self.expected_output_tokens / percentile(rates, 0.5)
+        return score
+
+    def hedge_delay(self, model):
+        ttfts = [summary["ttft_seconds"] for summary in self.recent(model) if summary["ttft_seconds"] is not None]
+        if len(ttfts) < self.min_samples:
+            return self.hedge_default_seconds
+        return max(percentile(ttfts, self.hedge_percentile), self.hedge_min_seconds)
+
+    def candidates(self, name):
+        group = self.groups.get(name)
+        if not group:
+            raise ValueError(f"No routing group named {name!r}")
+        registry = self.model_interactions.registry
+        available = [model for model in group if model.partition(": ")[0] in registry]
+        if not available:
+            raise ValueError(f"None of the models in routing group {name!r} have a registered provider")
+        order = {model: i for i, model in enumerate(available)}
+        return sorted(available, key=lambda model: (not self.healthy(model), self.score(model), order[model]))
+
+    def prewarm(self, name):
+        self.model_interactions.prewarm(self.candidates(name)[0])
+
+    def _run(self, index, model, prompt, max_tokens, temperature, events, cancel_token):
+        try:
+            stream = self.model_interactions.get_model_response_stream(
+                model, prompt, max_tokens=max_tokens, temperature=temperature, use_cache=False,
+                cancel_token=cancel_token)
+            try:
+                for chunk in stream:
+                    cancel_token.raise_if_cancelled()
+                    events.put((index, "chunk", chunk))
+            finally:
+                stream.close()
+        except Exception as e:
+            events.put((index, "error", e))
+        else:
+            events.put((index, "done", None))
+
+    # The best backend starts right away. If its first token is later than its usual
+    # hedge_percentile TTFT, or it fails before streaming anything, the next backend is started
+    # too; the first one to produce output wins and the losers' connections are closed.
+    def stream(self, name, prompt, max_tokens, temperature, on_usage=None, cancel_token=None):
+        candidates = self.candidates(name)
+        events = queue.Queue()
+        launched = []
+        cancels = []
+        if cancel_token is None:
+            cancel_token = CancelToken()
+
+        def launch():
+            model = candidates[len(launched)]
+            cancel = CancelToken(cancel_token)
+            launched.append(model)
+            cancels.append(cancel)
+            threading.Thread(target=self._run, args=(len(launched) - 1, model, prompt, max_tokens, temperature,
+                                                     events, cancel), daemon=True).start()
+            if self.hedge and len(launched) < len(candidates):
+                return time.monotonic() + self.hedge_delay(model)
+            return None
+
+        with self.lock:
+            self.counters["routed"] += 1
+        deadline = launch()
+        winner = None
+        failed = set()
+        try:
+            while winner is None:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    index, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    with self.lock:
+                        self.counters["hedged"] += 1
+                    deadline = launch()
+                    continue
+
+                if index in failed:
+                    continue
+                if kind == "error":
+                    cancel_token.raise_if_cancelled()
+                    failed.add(index)
+                    self.record_failure(launched[index])
+                    if len(launched) < len(candidates):
+                        with self.lock:
+                            self.counters["failovers"] += 1
+                        deadline = launch()
+                    elif len(failed) == len(launched):
+                        raise payload
+                    continue
+
+                winner = index
+                if winner > 0:
+                    with self.lock:
+                        self.counters["hedge_wins"] += 1
+                for i, cancel in enumerate(cancels):
+                    if i != winner:
+                        cancel.cancel(RequestCancelled(f"{launched[winner]} answered first"))
+                if kind == "done":
+                    self.record_success(launched[winner])
+                    return
+                yield payload
+
+            while True:
+                index, kind, payload = events.get()
+                if index != winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    self.record_success(launched[winner])
+                    return
+                else:
+                    cancel_token.raise_if_cancelled()
+                    self.record_failure(launched[winner])
+                    raise payload
+        finally:
+            for cancel in cancels:
+                cancel.cancel()
+                cancel.detach()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["cooling_down"] = [model for model, (_, until) in self.failures.items() if until > time.monotonic()]
+        return stats
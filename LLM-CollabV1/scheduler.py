@@ -0,0 +1,226 @@
+import itertools
+import threading
+import time
+from bisect import insort
+from collections import deque
+
+from cancellation import CancelToken, RequestCancelled
+from telemetry import percentile
+
+DEFAULT_SCHEDULER_SETTINGS = {
+    "workers": 4,
+    "max_queue": 16,
+    "provider_limits": {"Ollama": 1},
+    "wait_window": 50
+}
+
+INTERACTIVE = 0
+COLLABORATION = 1
+BACKGROUND = 2
+
+class QueueFull(Exception):
+    pass
+
+# Everything a job needs travels with it: its own cancel token and whatever state the caller
+# handed over, so two jobs never share a buffer or a stop flag.
+class Job:
+    def __init__(self, function, args, priority, providers, group, description, parent=None):
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.providers = frozenset(providers)
+        self.group = group
+        self.description = description
+        self.parent = parent
+        self.children = []
+        self.counted = frozenset()
+        self.cancel_token = CancelToken()
+        self.inbox = []
+        self.inbox_open = True
+        self.state = "queued"
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    def wait_seconds(self):
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+class Scheduler:
+    def __init__(self, settings=None):
+        settings = dict(DEFAULT_SCHEDULER_SETTINGS, **(settings or {}))
+        self.max_queue = settings["max_queue"]
+        self.provider_limits = settings["provider_limits"]
+        self.default_limit = max(settings["workers"], 1)
+        self.queue = []
+        self.running = set()
+        self.provider_counts = {}
+        self.busy_groups = set()
+        self.sequence = itertools.count()
+        self.waits = deque(maxlen=settings["wait_window"])
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                        for i in range(self.default_limit)]
+        for thread in self.threads:
+            thread.start()
+
+    # Jobs are queued by priority, then submission order. A full queue raises QueueFull unless
+    # the caller asks to block, which is how backpressure reaches whoever is submitting.
+    # A job submitted with a parent is work done on the parent's behalf (a prewarm, a speculative
+    # turn): it may use the provider slots the running parent holds, and it is cancelled when
+    # the parent ends.
+    def submit(self, function, *args, priority=INTERACTIVE, providers=(), group=None, description="",
+               block=False, timeout=None, parent=None):
+        job = Job(function, args, priority, providers, group, description, parent)
+        with self.condition:
+            if len(self.queue) >= self.max_queue:
+                if not block or not self.condition.wait_for(
+                        lambda: len(self.queue) < self.max_queue or self.stopped, timeout):
+                    self.counters["rejected"] += 1
+                    raise QueueFull(f"{len(self.queue)} jobs are already waiting")
+            if self.stopped:
+                raise RuntimeError("Scheduler has been shut down")
+            if parent is not None:
+                if parent.state != "running":
+                    raise RuntimeError("Parent job is not running")
+                parent.children.append(job)
+            insort(self.queue, (priority, next(self.sequence), job))
+            self.counters["submitted"] += 1
+            self.condition.notify_all()
+        return job
+
+    def limit(self, provider):
+        return self.provider_limits.get(provider, self.default_limit)
+
+    def borrowed(self, job):
+        if job.parent is not None and job.parent.state == "running":
+            return job.providers & job.parent.counted
+        return frozenset()
+
+    def runnable(self, job):
+        if job.group is not None and job.group in self.busy_groups:
+            return False
+        return all(self.provider_counts.get(provider, 0) < self.limit(provider)
+                   for provider in job.providers - self.borrowed(job))
+
+    # The first runnable job wins, so a job stuck behind a busy provider does not hold up
+    # lower-priority work for other providers.
+    def _take(self):
+        for index, (_, _, job) in enumerate(self.queue):
+            if self.runnable(job):
+                del self.queue[index]
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                job = None
+                while not self.stopped:
+                    job = self._take()
+                    if job is not None:
+                        break
+                    self.condition.wait()
+                if job is None:
+                    return
+                job.counted = job.providers - self.borrowed(job)
+                for provider in job.counted:
+                    self.provider_counts[provider] = self.provider_counts.get(provider, 0) + 1
+                if job.group is not None:
+                    self.busy_groups.add(job.group)
+                self.running.add(job)
+                job.state = "running"
+                job.started_at = time.monotonic()
+                self.waits.append(job.started_at - job.submitted_at)
+                self.condition.notify_all()
+
+            try:
+                job.cancel_token.raise_if_cancelled()
+                job.function(job, *job.args)
+                state = "cancelled" if job.cancel_token.cancelled else "completed"
+            except RequestCancelled:
+                state = "cancelled"
+            except Exception as e:
+                job.error = e
+                state = "failed"
+                print(f"Job {job.description or job.function.__name__} failed: {e}")
+
+            with self.condition:
+                for provider in job.counted:
+                    self.provider_counts[provider] -= 1
+                self.busy_groups.discard(job.group)
+                self.running.discard(job)
+                job.state = state
+                job.finished_at = time.monotonic()
+                self.counters[state] += 1
+                children, job.children = job.children, []
+                for child in children:
+                    self._dequeue(child)
+                self.condition.notify_all()
+            reason = RequestCancelled(f"{job.description or 'Parent job'} has finished")
+            for child in children:
+                child.cancel_token.cancel(reason)
+
+    # Lets a long-running job pick up input that arrives after it started (a new message for a
+    # collaboration that is still going). Returns False once the job has closed its inbox or
+    # finished, and the caller should then submit a new job instead.
+    def deliver(self, job, item):
+        with self.condition:
+            if not job.inbox_open or job.state not in ("queued", "running"):
+                return False
+            job.inbox.append(item)
+            return True
+
+    def take_inbox(self, job):
+        with self.condition:
+            items, job.inbox = job.inbox, []
+            return items
+
+    # Called by the job before it returns; whatever is still waiting is handed back so it is
+    # never dropped between the job's last look and its end.
+    def close_inbox(self, job):
+        with self.condition:
+            job.inbox_open = False
+            items, job.inbox = job.inbox, []
+            return items
+
+    def _dequeue(self, job):
+        queued = [entry for entry in self.queue if entry[2] is job]
+        for entry in queued:
+            self.queue.remove(entry)
+            job.state = "cancelled"
+            self.counters["cancelled"] += 1
+
+    def cancel(self, job, reason=None):
+        with self.condition:
+            self._dequeue(job)
+            self.condition.notify_all()
+        job.cancel_token.cancel(reason)
+
+    def cancel_all(self, reason=None):
+        with self.condition:
+            jobs = [job for _, _, job in self.queue] + list(self.running)
+        for job in jobs:
+            self.cancel(job, reason)
+
+    def stats(self):
+        with self.condition:
+            waits = list(self.waits)
+            stats = dict(self.counters)
+            stats["queued"] = len(self.queue)
+            stats["running"] = len(self.running)
+            stats["oldest_wait_seconds"] = max((job.wait_seconds() for _, _, job in self.queue), default=0.0)
+        stats["workers"] = len(self.threads)
+        stats["wait_p50_seconds"] = percentile(waits, 0.5)
+        stats["wait_p90_seconds"] = percentile(waits, 0.9)
+        return stats
+
+    def shutdown(self, reason=None):
+        self.cancel_all(reason)
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=1)
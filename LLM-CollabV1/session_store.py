@@ -0,0 +1,252 @@
+import json
+import os
+import shlex
+import sqlite3
+import threading
+import time
+
+from conversation import estimate_tokens
+
+DEFAULT_SESSION_SETTINGS = {
+    "enabled": True,
+    "path": "sessions.sqlite3",
+    "synchronous": "NORMAL",
+    "recent_sessions": 50,
+    "resume_messages": 50,
+    "search_results": 50
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    system TEXT,
+    settings TEXT,
+    turn_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    seq INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    role TEXT NOT NULL,
+    name TEXT,
+    persona TEXT,
+    content TEXT NOT NULL,
+    metrics TEXT,
+    UNIQUE (session_id, seq)
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated_at);
+"""
+
+# An external-content FTS5 index over turns.content, filled by a trigger inside the same
+# transaction as the insert, so the index never lags behind or misses a turn.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(content, content='turns', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts (rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+SEARCH_FILTERS = ("model", "role", "session", "after", "before")
+
+# Splits "model:gpt-4o role:\"Technical Expert\" after:2024-05-01 retry backoff" into the
+# words to match and the filters. Dates are local days; before: includes the whole day.
+def parse_search(text):
+    try:
+        words = shlex.split(text)
+    except ValueError:
+        words = text.split()
+    terms = []
+    filters = {}
+    for word in words:
+        key, sep, value = word.partition(":")
+        if sep and key.lower() in SEARCH_FILTERS and value:
+            key = key.lower()
+            if key in ("after", "before"):
+                day = time.mktime(time.strptime(value, "%Y-%m-%d"))
+                filters[key] = day + 86400 if key == "before" else day
+            else:
+                filters[key] = value
+        else:
+            terms.append(word)
+    return terms, filters
+
+# Every word is quoted so punctuation in it is matched literally instead of being read as
+# FTS5 syntax; a trailing * still makes it a prefix match.
+def match_expression(terms):
+    phrases = []
+    for term in terms:
+        prefix = term.endswith("*") and len(term) > 1
+        term = term.rstrip("*") if prefix else term
+        phrases.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(phrases)
+
+def turn_dict(row):
+    return {
+        "id": row[0],
+        "session_id": row[1],
+        "seq": row[2],
+        "created_at": row[3],
+        "role": row[4],
+        "name": row[5],
+        "persona": row[6],
+        "content": row[7],
+        "metrics": json.loads(row[8]) if row[8] else None
+    }
+
+# Turns are only ever inserted, one short transaction each, so a crash loses at most the turn
+# being written. WAL mode lets the GUI read sessions while a worker thread appends.
+class SessionStore:
+    TURN_COLUMNS = "id, session_id, seq, created_at, role, name, persona, content, metrics"
+
+    def __init__(self, settings=None):
+        settings = dict(DEFAULT_SESSION_SETTINGS, **(settings or {}))
+        self.path = settings["path"]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"PRAGMA synchronous={settings['synchronous']}")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        self.searchable = self.create_search_index()
+        self.lock = threading.Lock()
+
+    # Python builds whose SQLite lacks FTS5 still get the store, just without search. A store
+    # written before the index existed is indexed once, here.
+    def create_search_index(self):
+        existed = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'turns_fts'").fetchone() is not None
+        try:
+            self.connection.executescript(SEARCH_SCHEMA)
+            if not existed:
+                self.connection.execute("INSERT INTO turns_fts (turns_fts) VALUES ('rebuild')")
+            self.connection.commit()
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable in {self.path}: {e}")
+            return False
+        return True
+
+    def ensure_session(self, session_id, kind, title, settings=None):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO sessions (id, kind, title, created_at, updated_at, settings) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, kind, title[:200], now, now, json.dumps(settings) if settings is not None else None))
+
+    def set_system(self, session_id, content):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE sessions SET system = ? WHERE id = ?", (content, session_id))
+
+    def append_turn(self, session_id, role, content, name=None, persona=None, metrics=None):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE sessions SET turn_count = turn_count + 1, updated_at = ? WHERE id = ?",
+                                    (now, session_id))
+            seq = self.connection.execute("SELECT turn_count FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if seq is None:
+                raise KeyError(f"No session {session_id!r}")
+            cursor = self.connection.execute(
+                "INSERT INTO turns (session_id, seq, created_at, role, name, persona, content, metrics) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, seq[0], now, role, name, persona, content, json.dumps(metrics) if metrics is not None else None))
+            return cursor.lastrowid
+
+    def session(self, session_id):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT id, kind, title, created_at, updated_at, system, settings, turn_count FROM sessions WHERE id = ?",
+                (session_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0], "kind": row[1], "title": row[2], "created_at": row[3], "updated_at": row[4],
+            "system": row[5], "settings": json.loads(row[6]) if row[6] else {}, "turn_count": row[7]
+        }
+
+    def recent_sessions(self, limit=50):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, kind, title, updated_at, turn_count FROM sessions WHERE turn_count > 0 "
+                "ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+        return [{"id": row[0], "kind": row[1], "title": row[2], "updated_at": row[3], "turn_count": row[4]}
+                for row in rows]
+
+    def turns(self, session_id, start_seq=1, limit=100):
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT {self.TURN_COLUMNS} FROM turns WHERE session_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (session_id, start_seq, limit)).fetchall()
+        return [turn_dict(row) for row in rows]
+
+    # Walks the session backwards through the (session_id, seq) index and stops once max_tokens
+    # worth of turns (or max_turns) have been read, so resuming a long session never touches
+    # the turns that would be evicted from the conversation window anyway.
+    def tail(self, session_id, max_tokens=None, max_turns=None):
+        turns = []
+        tokens = 0
+        with self.lock:
+            cursor = self.connection.execute(
+                f"SELECT {self.TURN_COLUMNS} FROM turns WHERE session_id = ? ORDER BY seq DESC", (session_id,))
+            try:
+                for row in cursor:
+                    tokens += estimate_tokens(row[7])
+                    if turns and max_tokens is not None and tokens > max_tokens:
+                        break
+                    turns.append(turn_dict(row))
+                    if max_turns is not None and len(turns) >= max_turns:
+                        break
+            finally:
+                cursor.close()
+        turns.reverse()
+        return turns
+
+    # Best matches first (bm25), each with a snippet around the hit and its session title.
+    # model matches any part of the model name; role matches the speaker ("user",
+    # "assistant") or the persona the model was given.
+    def search(self, terms, model=None, role=None, session=None, after=None, before=None, limit=50):
+        if not self.searchable:
+            return []
+        expression = match_expression(terms)
+        if not expression:
+            return []
+        sql = (f"SELECT {', '.join('t.' + column for column in self.TURN_COLUMNS.split(', '))}, "
+               "snippet(turns_fts, 0, '[', ']', '...', 12), s.title "
+               "FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid JOIN sessions s ON s.id = t.session_id "
+               "WHERE turns_fts MATCH ?")
+        parameters = [expression]
+        if model:
+            sql += " AND t.name LIKE ?"
+            parameters.append(f"%{model}%")
+        if role:
+            sql += " AND (t.role = ? COLLATE NOCASE OR t.persona = ? COLLATE NOCASE)"
+            parameters.extend([role, role])
+        if session:
+            sql += " AND t.session_id LIKE ?"
+            parameters.append(f"{session}%")
+        if after is not None:
+            sql += " AND t.created_at >= ?"
+            parameters.append(after)
+        if before is not None:
+            sql += " AND t.created_at < ?"
+            parameters.append(before)
+        sql += " ORDER BY bm25(turns_fts) LIMIT ?"
+        parameters.append(limit)
+        with self.lock:
+            rows = self.connection.execute(sql, parameters).fetchall()
+        results = []
+        for row in rows:
+            result = turn_dict(row)
+            result["snippet"] = row[9]
+            result["title"] = row[10]
+            results.append(result)
+        return results
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,38 @@
+import json
+import time
+from contextlib import contextmanager
+
+class StartupTimer:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.imports = []
+        self.marks = []
+
+    @contextmanager
+    def measure_import(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.imports.append((name, time.perf_counter() - start))
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter() - self.started_at))
+
+    def as_dict(self):
+        return {
+            "imports_ms": {name: round(seconds * 1000, 1) for name, seconds in self.imports},
+            "marks_ms": {label: round(seconds * 1000, 1) for label, seconds in self.marks}
+        }
+
+    def report(self):
+        lines = ["Startup timing:"]
+        for name, seconds in sorted(self.imports, key=lambda item: item[1], reverse=True):
+            lines.append(f"  import {name:<24} {seconds * 1000:8.1f} ms")
+        for label, seconds in self.marks:
+            lines.append(f"  {label:<31} {seconds * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+    def write(self, path):
+        with open(path, 'w') as report_file:
+            json.dump(self.as_dict(), report_file, indent=4)
@@ -0,0 +1,209 @@
+import json
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+    JSON_ERRORS = (orjson.JSONDecodeError, ValueError)
+except ImportError:
+    try:
+        import ujson
+        json_loads = ujson.loads
+        JSON_BACKEND = "ujson"
+        JSON_ERRORS = (ValueError,)
+    except ImportError:
+        json_loads = json.loads
+        JSON_BACKEND = "json"
+        JSON_ERRORS = (ValueError,)
+
+DONE_SENTINEL = b"[DONE]"
+
+class SSEParser:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.data_lines = []
+        self.event = None
+        self.done = False
+
+    def feed(self, chunk):
+        if self.done or not chunk:
+            return []
+        self.buffer += chunk
+        events = []
+        start = 0
+        buffer = self.buffer
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            line = bytes(buffer[start:end])
+            start = end + 1
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if self._process_line(line, events):
+                break
+        del buffer[:start]
+        return events
+
+    def flush(self):
+        events = []
+        if not self.done:
+            if self.buffer:
+                line = bytes(self.buffer).rstrip(b"\r")
+                self.buffer.clear()
+                if self._process_line(line, events):
+                    return events
+            self._dispatch(events)
+        return events
+
+    def _process_line(self, line, events):
+        if not line:
+            return self._dispatch(events)
+        if line[:1] == b":":
+            return False
+        field, _, value = line.partition(b":")
+        if value[:1] == b" ":
+            value = value[1:]
+        if field == b"data":
+            self.data_lines.append(value)
+        elif field == b"event":
+            self.event = value.decode("utf-8", "replace")
+        return False
+
+    def _dispatch(self, events):
+        if not self.data_lines:
+            self.event = None
+            return False
+        data = self.data_lines[0] if len(self.data_lines) == 1 else b"\n".join(self.data_lines)
+        self.data_lines = []
+        event, self.event = self.event, None
+        if data.strip() == DONE_SENTINEL:
+            self.done = True
+            return True
+        events.append((event, data))
+        return False
+
+class NDJSONParser:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, chunk):
+        if not chunk:
+            return []
+        self.buffer += chunk
+        lines = []
+        start = 0
+        buffer = self.buffer
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            line = bytes(buffer[start:end]).strip()
+            start = end + 1
+            if line:
+                lines.append(line)
+        del buffer[:start]
+        return lines
+
+    def flush(self):
+        line = bytes(self.buffer).strip()
+        self.buffer.clear()
+        return [line] if line else []
+
+def _decode(payload, on_error):
+    try:
+        return json_loads(payload)
+    except JSON_ERRORS:
+        if on_error is not None:
+            on_error(payload)
+        return None
+
+def iter_sse_json(chunks, on_error=None):
+    parser = SSEParser()
+    for chunk in chunks:
+        for _, data in parser.feed(chunk):
+            decoded = _decode(data, on_error)
+            if decoded is not None:
+                yield decoded
+        if parser.done:
+            return
+    for _, data in parser.flush():
+        decoded = _decode(data, on_error)
+        if decoded is not None:
+            yield decoded
+
+def iter_ndjson(chunks, on_error=None):
+    parser = NDJSONParser()
+    for chunk in chunks:
+        for line in parser.feed(chunk):
+            decoded = _decode(line, on_error)
+            if decoded is not None:
+                yield decoded
+    for line in parser.flush():
+        decoded = _decode(line, on_error)
+        if decoded is not None:
+            yield decoded
+
+async def aiter_sse_json(chunks, on_error=None):
+    parser = SSEParser()
+    async for chunk in chunks:
+        for _, data in parser.feed(chunk):
+            decoded = _decode(data, on_error)
+            if decoded is not None:
+                yield decoded
+        if parser.done:
+            return
+    for _, data in parser.flush():
+        decoded = _decode(data, on_error)
+        if decoded is not None:
+            yield decoded
+
+async def aiter_ndjson(chunks, on_error=None):
+    parser = NDJSONParser()
+    async for chunk in chunks:
+        for line in parser.feed(chunk):
+            decoded = _decode(line, on_error)
+            if decoded is not None:
+                yield decoded
+    for line in parser.flush():
+        decoded = _decode(line, on_error)
+        if decoded is not None:
+            yield decoded
+
+def chat_completion_delta(data):
+    choices = data.get('choices')
+    if choices:
+        delta = choices[0].get('delta') or {}
+        return delta.get('content') or ''
+    return ''
+
+def benchmark(tokens=200000, chunk_size=512):
+    import time
+
+    events = []
+    for i in range(tokens):
+        payload = json.dumps({"id": "bench", "choices": [{"index": 0, "delta": {"content": f"tok{i} "}}]})
+        events.append(f"data: {payload}\n\n")
+        if i % 100 == 0:
+            events.append(": keep-alive\n\n")
+    events.append("data: [DONE]\n\n")
+    body = "".join(events).encode("utf-8")
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    start = time.perf_counter()
+    count = 0
+    for data in iter_sse_json(chunks):
+        if chat_completion_delta(data):
+            count += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "json_backend": JSON_BACKEND,
+        "tokens": count,
+        "bytes": len(body),
+        "seconds": round(elapsed, 3),
+        "tokens_per_second": round(count / elapsed),
+        "megabytes_per_second": round(len(body) / elapsed / 1e6, 1)
+    }
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=4))
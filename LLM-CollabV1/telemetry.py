@@ -0,0 +1,269 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+DEFAULT_TELEMETRY_SETTINGS = {
+    "enabled": True,
+    "export_paths": [],
+    "export_interval_seconds": 60,
+    "recent_window": 50
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200, 300, 500, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+METRICS = {
+    "ttft_seconds": ("Time from sending the request to the first streamed chunk.", LATENCY_BUCKETS),
+    "inter_chunk_seconds": ("Gap between consecutive streamed chunks.", LATENCY_BUCKETS),
+    "total_seconds": ("Time from sending the request to the end of the stream.", LATENCY_BUCKETS),
+    "tokens_per_second": ("Output tokens per second after the first chunk.", RATE_BUCKETS),
+    "response_bytes": ("UTF-8 bytes of streamed response text.", SIZE_BUCKETS)
+}
+
+def format_prompt_usage(summary):
+    text = f"{summary['prompt_tokens']} prompt tok"
+    if summary.get("cached_tokens") is not None:
+        text += f" ({summary['cached_tokens']} cached)"
+    return text
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Linear interpolation inside the bucket holding the q-th observation, the same
+    # estimate Prometheus' histogram_quantile() gives for these buckets.
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def as_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+class RequestMetrics:
+    def __init__(self, model):
+        self.model = model
+        self.provider = model.partition(": ")[0]
+        self.start = time.monotonic()
+        self.first_chunk = None
+        self.last_chunk = None
+        self.gaps = []
+        self.chunks = 0
+        self.bytes = 0
+        self.characters = 0
+        self.output_tokens = None
+        self.prompt_tokens = None
+        self.cached_tokens = None
+        self.result = None
+
+    def chunk(self, text):
+        now = time.monotonic()
+        if self.first_chunk is None:
+            self.first_chunk = now
+        else:
+            self.gaps.append(now - self.last_chunk)
+        self.last_chunk = now
+        self.chunks += 1
+        self.bytes += len(text.encode("utf-8"))
+        self.characters += len(text)
+
+    # Prompt and cached counts stay None for providers that do not report them, so "no cache
+    # hit" (0) and "unknown" can be told apart in the summary.
+    def usage(self, usage):
+        if usage.get("output_tokens"):
+            self.output_tokens = usage["output_tokens"]
+        if usage.get("prompt_tokens") is not None:
+            self.prompt_tokens = usage["prompt_tokens"]
+        if usage.get("cached_tokens") is not None:
+            self.cached_tokens = usage["cached_tokens"]
+
+    def summary(self, status):
+        end = time.monotonic()
+        tokens = self.output_tokens
+        if tokens is None:
+            tokens = (self.characters + 3) // 4
+        summary = {
+            "model": self.model,
+            "provider": self.provider,
+            "status": status,
+            "ttft_seconds": None,
+            "total_seconds": end - self.start,
+            "chunks": self.chunks,
+            "response_bytes": self.bytes,
+            "output_tokens": tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "tokens_per_second": None
+        }
+        if self.first_chunk is not None:
+            summary["ttft_seconds"] = self.first_chunk - self.start
+            decode_time = self.last_chunk - self.first_chunk
+            if decode_time > 0 and tokens:
+                summary["tokens_per_second"] = tokens / decode_time
+        return summary
+
+class Telemetry:
+    def __init__(self, settings=None):
+        settings = dict(DEFAULT_TELEMETRY_SETTINGS, **(settings or {}))
+        self.enabled = settings["enabled"]
+        self.export_paths = list(settings["export_paths"])
+        self.export_interval = settings["export_interval_seconds"]
+        self.recent_window = settings["recent_window"]
+        self.histograms = {}
+        self.recent_requests = {}
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.last_export = time.monotonic()
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def start(self, model):
+        return RequestMetrics(model)
+
+    # Listeners run on the thread that finished the stream and get the per-request summary.
+    def finish(self, metrics, status="ok"):
+        summary = metrics.summary(status)
+        metrics.result = summary
+        for listener in self.listeners:
+            try:
+                listener(summary)
+            except Exception as e:
+                print(f"Telemetry listener failed: {e}")
+        if not self.enabled:
+            return summary
+
+        with self.lock:
+            key = (summary["provider"], summary["model"])
+            histograms = self.histograms.get(key)
+            if histograms is None:
+                histograms = {name: Histogram(bounds) for name, (_, bounds) in METRICS.items()}
+                self.histograms[key] = histograms
+            for name in ("ttft_seconds", "total_seconds", "tokens_per_second", "response_bytes"):
+                if summary[name] is not None:
+                    histograms[name].observe(summary[name])
+            inter_chunk = histograms["inter_chunk_seconds"]
+            for gap in metrics.gaps:
+                inter_chunk.observe(gap)
+            statuses = self.requests.setdefault(key, {})
+            statuses[status] = statuses.get(status, 0) + 1
+            recent = self.recent_requests.get(summary["model"])
+            if recent is None:
+                recent = self.recent_requests[summary["model"]] = deque(maxlen=self.recent_window)
+            recent.append(summary)
+
+        if self.export_paths and time.monotonic() - self.last_export >= self.export_interval:
+            self.export()
+        return summary
+
+    def recent(self, model):
+        with self.lock:
+            return list(self.recent_requests.get(model, ()))
+
+    def snapshot(self):
+        with self.lock:
+            models = {}
+            for (provider, model), histograms in self.histograms.items():
+                models[model] = {
+                    "provider": provider,
+                    "requests": dict(self.requests.get((provider, model), {})),
+                    "metrics": {name: histogram.as_dict() for name, histogram in histograms.items()}
+                }
+        return {"generated_at": time.time(), "models": models}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=4)
+
+    def to_prometheus(self, namespace="llm_collab"):
+        lines = []
+        with self.lock:
+            items = sorted(self.histograms.items())
+            requests = {key: dict(statuses) for key, statuses in self.requests.items()}
+            lines.append(f"# HELP {namespace}_requests_total Streamed requests by final status.")
+            lines.append(f"# TYPE {namespace}_requests_total counter")
+            for (provider, model), statuses in sorted(requests.items()):
+                for status, count in sorted(statuses.items()):
+                    lines.append(f'{namespace}_requests_total{{{_labels(provider, model)},status="{status}"}} {count}')
+
+            for name, (help_text, _) in METRICS.items():
+                metric = f"{namespace}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (provider, model), histograms in items:
+                    histogram = histograms[name]
+                    labels = _labels(provider, model)
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # The file extension picks the format: .prom gets Prometheus text, anything else JSON.
+    def write(self, path):
+        content = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temporary, path)
+
+    def export(self):
+        self.last_export = time.monotonic()
+        for path in self.export_paths:
+            try:
+                self.write(path)
+            except OSError as e:
+                print(f"Could not write telemetry to {path}: {e}")
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.requests.clear()
+            self.recent_requests.clear()
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(provider, model):
+    return f'provider="{_escape(provider)}",model="{_escape(model)}"'
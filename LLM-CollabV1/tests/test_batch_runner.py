@@ -0,0 +1,102 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from batch_runner import BatchRunner, load_completed, open_output, read_rows
+from providers import ProviderAdapter, ProviderRegistry
+from telemetry import Telemetry
+
+class FakeModelInteractions:
+    def __init__(self, delays):
+        self.delays = delays
+        self.registry = ProviderRegistry()
+        for prefix in delays:
+            self.registry.register(ProviderAdapter(prefix, None, None))
+        self.telemetry = Telemetry({"enabled": False})
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+        self.finished = []
+
+    def get_model_response_stream(self, model, prompt, max_tokens=1000, temperature=0.7, metrics=None):
+        provider = model.partition(": ")[0]
+        with self.lock:
+            self.active[provider] = self.active.get(provider, 0) + 1
+            self.peak[provider] = max(self.peak.get(provider, 0), self.active[provider])
+        try:
+            time.sleep(self.delays[provider])
+            if prompt == "fail":
+                raise ConnectionError("refused")
+            yield f"{model} says {prompt}"
+        finally:
+            with self.lock:
+                self.active[provider] -= 1
+                self.finished.append(provider)
+
+def rows(*specs):
+    return [(str(index), {"model": model, "prompt": prompt}) for index, (model, prompt) in enumerate(specs)]
+
+def results(output):
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+def test_rows_for_a_limited_provider_do_not_hold_up_the_others():
+    interactions = FakeModelInteractions({"Ollama": 0.1, "Groq": 0.0})
+    runner = BatchRunner(interactions, {"concurrency": 4, "provider_limits": {"Ollama": 1}})
+    output = io.StringIO()
+    counts = runner.run(rows(*[("Ollama: llama3", "hi")] * 3 + [("Groq: llama3", "hi")] * 6), output)
+    assert counts == {"ok": 9, "error": 0, "skipped": 0}
+    assert interactions.peak["Ollama"] == 1
+    assert interactions.finished.index("Ollama") >= 6
+
+def test_failures_and_unknown_models_are_written_as_errors():
+    interactions = FakeModelInteractions({"Groq": 0.0})
+    output = io.StringIO()
+    counts = BatchRunner(interactions).run(rows(("Groq: llama3", "fail"), ("Nowhere: model", "hi")), output)
+    assert counts == {"ok": 0, "error": 2, "skipped": 0}
+    by_id = {result["id"]: result for result in results(output)}
+    assert by_id["0"]["error"] == "refused"
+    assert "Nowhere" in by_id["1"]["error"]
+
+def test_completed_rows_are_skipped():
+    interactions = FakeModelInteractions({"Groq": 0.0})
+    output = io.StringIO()
+    counts = BatchRunner(interactions).run(rows(("Groq: llama3", "a"), ("Groq: llama3", "b")), output, {"0"})
+    assert counts == {"ok": 1, "error": 0, "skipped": 1}
+    assert [result["id"] for result in results(output)] == ["1"]
+
+def test_input_is_read_as_rows_are_sent():
+    interactions = FakeModelInteractions({"Groq": 0.0})
+    consumed = []
+
+    def source():
+        for row in rows(*[("Groq: llama3", "hi")] * 20):
+            consumed.append(row[0])
+            yield row
+
+    runner = BatchRunner(interactions, {"concurrency": 1, "max_buffered_rows": 2})
+    original = runner.run_row
+
+    def run_row(row_id, row):
+        assert len(consumed) <= int(row_id) + 3
+        return original(row_id, row)
+
+    runner.run_row = run_row
+    assert runner.run(source(), io.StringIO())["ok"] == 20
+
+def test_resume_retries_failed_rows_and_ignores_a_cut_off_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_text('{"id": "1", "status": "ok"}\n{"id": "2", "status": "error"}\n{"id": "3", "sta', encoding="utf-8")
+    assert load_completed(str(path)) == {"1"}
+    with open_output(str(path)) as output:
+        output.write('{"id": "3", "status": "ok"}\n')
+    assert load_completed(str(path)) == {"1", "3"}
+
+def test_read_rows_skips_bad_lines_and_numbers_rows_without_ids(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text('{"id": "a", "prompt": "x"}\n\nnot json\n[1, 2]\n{"prompt": "y"}\n', encoding="utf-8")
+    assert [row_id for row_id, _ in read_rows(str(path))] == ["a", "5"]
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from cancellation import CancelToken, RequestCancelled, StreamTimeout, start_cancellable, watch_stream
+
+class Response:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+def cancel_later(token, delay=0.05):
+    timer = threading.Timer(delay, token.cancel)
+    timer.start()
+    return timer
+
+def test_cancel_releases_a_caller_blocked_before_the_response():
+    token = CancelToken()
+    release = threading.Event()
+    response = Response()
+
+    def start():
+        release.wait(5)
+        return response
+
+    cancel_later(token)
+    started = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        start_cancellable(token, start, Response.close)
+    assert time.monotonic() - started < 1
+    release.set()
+    assert response.closed.wait(5)
+
+def test_response_that_arrives_first_is_closed_on_cancel():
+    token = CancelToken()
+    response = Response()
+    assert start_cancellable(token, lambda: response, Response.close) is response
+    assert not response.closed.is_set()
+    token.cancel()
+    assert response.closed.is_set()
+
+def test_start_errors_reach_the_caller():
+    def start():
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        start_cancellable(CancelToken(), start)
+
+def test_without_a_token_start_runs_on_the_callers_thread():
+    assert start_cancellable(None, threading.current_thread) is threading.current_thread()
+
+def test_child_tokens_follow_their_parent():
+    parent = CancelToken()
+    child = CancelToken(parent)
+    closed = []
+    child.on_cancel(lambda: closed.append(True))
+    parent.cancel(RequestCancelled("Stopped"))
+    assert child.cancelled
+    assert str(child.reason) == "Stopped"
+    assert closed == [True]
+
+def test_detached_child_is_not_cancelled():
+    parent = CancelToken()
+    child = CancelToken(parent)
+    child.detach()
+    parent.cancel()
+    assert not child.cancelled
+
+def blocking_stream(token, chunks=(), stall=5):
+    for chunk in chunks:
+        yield chunk
+    token.wait(stall)
+    token.raise_if_cancelled()
+
+def test_first_token_timeout():
+    started = time.monotonic()
+    with pytest.raises(StreamTimeout):
+        list(watch_stream(lambda token: blocking_stream(token), CancelToken(), 0.2, 0, "Test: model"))
+    assert time.monotonic() - started < 2
+
+def test_idle_timeout_after_the_first_chunk():
+    received = []
+    with pytest.raises(StreamTimeout):
+        for chunk in watch_stream(lambda token: blocking_stream(token, ["a"]), CancelToken(), 5, 0.2, "Test: model"):
+            received.append(chunk)
+    assert received == ["a"]
+
+def test_parent_cancel_stops_a_watched_stream():
+    parent = CancelToken()
+    cancel_later(parent)
+    with pytest.raises(RequestCancelled):
+        list(watch_stream(lambda token: blocking_stream(token), parent, 5, 5, "Test: model"))
+
+def test_finished_stream_is_not_timed_out_later():
+    parent = CancelToken()
+    assert list(watch_stream(lambda token: iter(["a", "b"]), parent, 0.1, 0.1, "Test: model")) == ["a", "b"]
+    time.sleep(0.3)
+    assert not parent.cancelled
@@ -0,0 +1,123 @@
+import glob
+import os
+import threading
+
+import pytest
+
+from collab_graph import CollaborationGraph, GraphRun, fill, split_chunks
+from telemetry import Telemetry
+
+class FakeModelInteractions:
+    def __init__(self, fail=(), barrier=None):
+        self.fail = set(fail)
+        self.barrier = barrier
+        self.telemetry = Telemetry({"enabled": False})
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def get_model_response_stream(self, model, prompt, max_tokens=1000, temperature=0.7, metrics=None,
+                                  cancel_token=None):
+        text = prompt if isinstance(prompt, str) else prompt[-1]["content"]
+        with self.lock:
+            self.prompts.append((model, prompt))
+        if self.barrier is not None and model.startswith("Branch"):
+            self.barrier.wait(5)
+        if model in self.fail:
+            self.telemetry.finish(metrics, "error")
+            raise ConnectionError(f"{model} is down")
+        metrics.chunk(text)
+        self.telemetry.finish(metrics)
+        yield f"<{model.partition(': ')[2]}:"
+        yield f"{text}>"
+
+class Listener:
+    def __init__(self):
+        self.chunks = {}
+        self.items = []
+        self.finished = {}
+        self.failed = {}
+
+    def node_chunk(self, node, chunk):
+        self.chunks.setdefault(node.id, []).append(chunk)
+
+    def node_item_finished(self, node, index, text):
+        self.items.append((node.id, index, text))
+
+    def node_finished(self, node, text, summary):
+        self.finished[node.id] = (text, summary)
+
+    def node_failed(self, node, error):
+        self.failed[node.id] = str(error)
+
+def graph(*nodes, **definition):
+    return CollaborationGraph(dict({"name": "Test", "nodes": list(nodes)}, **definition))
+
+def run(definition, user_input, interactions=None):
+    listener = Listener()
+    output = GraphRun(definition, interactions or FakeModelInteractions(), listener).run(user_input)
+    return output, listener
+
+def test_fill_expands_placeholders_once():
+    assert fill("{input} / {other} / {\"json\": 1}", {"input": "say {other}", "other": "x"}) == \
+        "say {other} / x / {\"json\": 1}"
+    assert fill("{missing}", {}) == "{missing}"
+
+def test_split_chunks_keeps_paragraphs_together_under_the_limit():
+    text = "\n\n".join(["a" * 10, "b" * 10, "c" * 30])
+    assert split_chunks(text, 6) == ["a" * 10 + "\n\n" + "b" * 10, "c" * 24, "c" * 6]
+    assert split_chunks("  ", 10) == []
+
+@pytest.mark.parametrize("definition, message", [
+    ({"nodes": []}, "no nodes"),
+    ({"nodes": [{"id": "a", "model": "M: m", "inputs": ["b"]}]}, "unknown node"),
+    ({"nodes": [{"id": "a", "model": "M: m"}, {"id": "a", "model": "M: m"}]}, "duplicate"),
+    ({"nodes": [{"id": "input", "model": "M: m"}]}, "reserved"),
+    ({"nodes": [{"id": "a", "model": "M: m", "inputs": ["b"]}, {"id": "b", "model": "M: m", "inputs": ["a"]}]},
+     "cycle"),
+    ({"nodes": [{"id": "a", "model": "M: m"}], "output": "z"}, "not a node"),
+])
+def test_invalid_graphs_are_rejected(definition, message):
+    with pytest.raises(ValueError, match=message):
+        CollaborationGraph(definition)
+
+def test_bundled_graphs_load():
+    paths = glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "graphs", "*.json"))
+    assert paths
+    for path in paths:
+        assert CollaborationGraph.load(path).order
+
+def test_branches_run_in_parallel_and_join():
+    definition = graph(
+        {"id": "left", "model": "Branch: l"},
+        {"id": "right", "model": "Branch: r"},
+        {"id": "join", "model": "Join: j", "inputs": ["left", "right"]})
+    interactions = FakeModelInteractions(barrier=threading.Barrier(2))
+    output, listener = run(definition, "q", interactions)
+    assert output == "<j:[left]\n<l:q>\n\n[right]\n<r:q>>"
+    assert listener.chunks["join"] == ["<j:", "[left]\n<l:q>\n\n[right]\n<r:q>>"]
+    assert listener.finished["left"][1]["status"] == "ok"
+
+def test_map_node_runs_once_per_chunk_and_joins_in_order():
+    definition = graph(
+        {"id": "each", "model": "Map: m", "map": "input", "chunk_tokens": 1, "prompt": "{index}/{count} {item}"})
+    output, listener = run(definition, "aaaa\n\nbbbb\n\ncccc")
+    assert output == "<m:1/3 aaaa>\n\n<m:2/3 bbbb>\n\n<m:3/3 cccc>"
+    assert sorted(index for _, index, _ in listener.items) == [0, 1, 2]
+    assert "each" not in listener.chunks
+
+def test_failed_node_fails_its_dependents_only():
+    definition = graph(
+        {"id": "broken", "model": "Down: d"},
+        {"id": "after", "model": "Up: u", "inputs": ["broken"]},
+        {"id": "other", "model": "Up: u"},
+        output="other")
+    output, listener = run(definition, "q", FakeModelInteractions(fail={"Down: d"}))
+    assert output == "<u:q>"
+    assert listener.failed == {"broken": "Down: d is down", "after": "input 'broken' failed"}
+
+def test_role_nodes_get_a_system_prompt():
+    definition = graph({"id": "a", "model": "Role: r", "role": "Philosopher"})
+    interactions = FakeModelInteractions()
+    run(definition, "q", interactions)
+    prompt = interactions.prompts[0][1]
+    assert [message["role"] for message in prompt] == ["system", "user"]
@@ -0,0 +1,99 @@
+from conversation import ConversationBuffer, estimate_tokens, token_budget
+from messages import alternate_roles, split_system
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+def test_token_budget_falls_back_to_provider_then_default():
+    budgets = {"OpenAI: gpt-4o": 100, "OpenAI": 50, "default": 10}
+    assert token_budget("OpenAI: gpt-4o", budgets) == 100
+    assert token_budget("OpenAI: gpt-4o-mini", budgets) == 50
+    assert token_budget("Ollama: llama3", budgets) == 10
+    assert token_budget("Ollama: llama3", {}) == 8000
+
+def test_append_evicts_down_to_low_watermark():
+    buffer = ConversationBuffer(max_tokens=100, low_watermark=0.5)
+    for i in range(10):
+        buffer.append("user", f"{i}" * 40)
+    assert len(buffer.messages) == 10
+    buffer.append("user", "x" * 40)
+    assert buffer.history_tokens() == 50
+    assert buffer.messages[0].content == "6" * 40
+    # Trimmed to the watermark in one go, so the next few appends leave the prefix alone.
+    for _ in range(5):
+        buffer.append("user", "y" * 40)
+    assert buffer.messages[0].content == "6" * 40
+
+def test_eviction_keeps_the_newest_messages_and_summarizes_the_rest():
+    seen = []
+
+    def summarizer(previous, evicted):
+        seen.append(evicted)
+        return "summary"
+
+    buffer = ConversationBuffer(max_tokens=30, low_watermark=0.5, summarizer=summarizer)
+    for i in range(4):
+        buffer.append("user", f"{i}" * 40)
+    assert buffer.messages[-1].content == "3" * 40
+    assert buffer.summary.content == "summary"
+    assert [content for batch in seen for content in batch] == ["0" * 40, "1" * 40, "2" * 40]
+
+def test_summarizer_failure_keeps_the_buffer_usable():
+    def summarizer(previous, evicted):
+        raise RuntimeError("offline")
+
+    buffer = ConversationBuffer(max_tokens=10, summarizer=summarizer)
+    buffer.append("user", "a" * 40)
+    buffer.append("user", "b" * 40)
+    assert buffer.summary is None
+    assert [message.content for message in buffer.messages] == ["b" * 40]
+
+def test_render_messages_from_each_speakers_perspective():
+    buffer = ConversationBuffer()
+    buffer.set_system("Be brief.")
+    buffer.append("user", "Question")
+    buffer.append("assistant", "From A", name="OpenAI: gpt-4o", speaker=0)
+    buffer.append("assistant", "From B", name="Groq: llama3", speaker=1)
+    assert [message["role"] for message in buffer.render_messages(speaker=0)] == \
+        ["system", "user", "assistant", "user"]
+    assert [message["role"] for message in buffer.render_messages(speaker=1)] == \
+        ["system", "user", "user", "assistant"]
+    assert [message["role"] for message in buffer.render_messages()] == ["system", "user", "user", "user"]
+
+def test_same_model_on_both_sides_still_takes_turns():
+    buffer = ConversationBuffer()
+    buffer.append("assistant", "A1", name="Ollama: llama3", speaker=0)
+    buffer.append("assistant", "B1", name="Ollama: llama3", speaker=1)
+    _, messages = split_system(buffer.render_messages(speaker=0))
+    assert alternate_roles(messages) == [
+        {"role": "user", "content": "Continue the conversation."},
+        {"role": "assistant", "content": "A1"},
+        {"role": "user", "content": "B1"}
+    ]
+    _, messages = split_system(buffer.render_messages(speaker=1))
+    assert alternate_roles(messages) == [
+        {"role": "user", "content": "A1"},
+        {"role": "assistant", "content": "B1"}
+    ]
+
+def test_budget_window_drops_oldest_messages_but_keeps_system():
+    buffer = ConversationBuffer()
+    buffer.set_system("sys")
+    for i in range(10):
+        buffer.append("user", f"{i}" * 40)
+    visible = buffer.visible_messages(budget=50)
+    assert visible[0].content == "sys"
+    assert visible[-1].content == "9" * 40
+    assert sum(message.tokens for message in visible) <= 50
+
+def test_render_cache_matches_full_render_after_appends():
+    buffer = ConversationBuffer(max_tokens=200)
+    buffer.set_system("sys")
+    for i in range(30):
+        buffer.append("user", f"message {i} " * 3)
+        for budget in (None, 60):
+            cached = buffer.render(budget)
+            buffer.render_cache.clear()
+            assert cached == buffer.render(budget)
@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from cancellation import CancelToken, RequestCancelled, StreamTimeout
+from models import ModelInteractions
+
+PROMPT = "x" * 4000
+MAX_TOKENS = 1000
+
+def sse(*events):
+    return b"".join(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n" for event in events) + b"data: [DONE]\n\n"
+
+def delta(text):
+    return {"choices": [{"delta": {"content": text}}]}
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        yield self.body
+
+    def close(self):
+        self.closed = True
+
+def model_interactions(resilience=None):
+    return ModelInteractions({
+        "API_KEYS": {"perplexity": ""},
+        "API_URLS": {"groq_llm": "http://groq.invalid/chat/completions", "perplexity": "http://perplexity.invalid"},
+        "HEADERS": {"groq": {}},
+        "RESILIENCE": resilience or {}
+    })
+
+def serve(interactions, body):
+    interactions.connection_pool.post = lambda provider, url, **kwargs: FakeResponse(body)
+
+def run(interactions, model="Groq: llama3"):
+    return "".join(interactions.get_model_response_stream(model, PROMPT, max_tokens=MAX_TOKENS, use_cache=False))
+
+def tpm_bucket(interactions):
+    return interactions.resilience.guard("groq").tokens
+
+def test_unreported_usage_keeps_the_tpm_charge():
+    interactions = model_interactions({"default": {"tpm": 6000}})
+    serve(interactions, sse(delta("Hello"), delta(" there")))
+    for _ in range(2):
+        assert run(interactions) == "Hello there"
+    charge = interactions.request_tokens(PROMPT, MAX_TOKENS)
+    assert tpm_bucket(interactions).tokens == pytest.approx(6000 - 2 * charge, abs=50)
+
+def test_reported_usage_settles_the_tpm_charge():
+    interactions = model_interactions({"default": {"tpm": 6000}})
+    serve(interactions, sse(delta("Hi"), {"choices": [], "usage": {"prompt_tokens": 1000, "completion_tokens": 200}}))
+    run(interactions)
+    assert tpm_bucket(interactions).tokens == pytest.approx(6000 - 1200, abs=50)
+
+def test_summary_leaves_cached_tokens_unknown_when_not_reported():
+    interactions = model_interactions()
+    serve(interactions, sse(delta("Hi"), {"choices": [], "usage": {"prompt_tokens": 1000, "completion_tokens": 2}}))
+    metrics = interactions.telemetry.start("Groq: llama3")
+    "".join(interactions.get_model_response_stream("Groq: llama3", PROMPT, use_cache=False, metrics=metrics))
+    assert metrics.result["prompt_tokens"] == 1000
+    assert metrics.result["cached_tokens"] is None
+
+def test_summary_reports_cached_tokens_when_the_provider_does():
+    interactions = model_interactions()
+    serve(interactions, sse(delta("Hi"), {"choices": [], "usage": {
+        "prompt_tokens": 1000, "completion_tokens": 2, "prompt_tokens_details": {"cached_tokens": 768}}}))
+    metrics = interactions.telemetry.start("Groq: llama3")
+    "".join(interactions.get_model_response_stream("Groq: llama3", PROMPT, use_cache=False, metrics=metrics))
+    assert metrics.result["cached_tokens"] == 768
+
+def test_stop_while_connecting_releases_the_stream():
+    interactions = model_interactions()
+    release = threading.Event()
+    response = FakeResponse(sse(delta("late")))
+
+    def post(provider, url, **kwargs):
+        release.wait(5)
+        return response
+
+    interactions.connection_pool.post = post
+    token = CancelToken()
+    threading.Timer(0.1, token.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(RequestCancelled):
+        list(interactions.get_model_response_stream("Groq: llama3", PROMPT, use_cache=False, cancel_token=token))
+    assert time.monotonic() - started < 1
+    release.set()
+    for _ in range(100):
+        if response.closed:
+            break
+        time.sleep(0.01)
+    assert response.closed
+
+def test_first_token_timeout_while_connecting():
+    interactions = model_interactions({"default": {"max_retries": 0}})
+    interactions.connection_pool.defaults["first_token_timeout"] = 0.2
+    release = threading.Event()
+    interactions.connection_pool.post = lambda provider, url, **kwargs: release.wait(5) and FakeResponse(b"")
+    started = time.monotonic()
+    with pytest.raises(StreamTimeout):
+        list(interactions.get_model_response_stream("Groq: llama3", PROMPT, use_cache=False))
+    assert time.monotonic() - started < 2
+    release.set()
@@ -0,0 +1,158 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline
+from scheduler import Scheduler, COLLABORATION
+from telemetry import Telemetry
+
+class FakeModelInteractions:
+    def __init__(self, reply="Next reply."):
+        self.reply = reply
+        self.telemetry = Telemetry({"enabled": False})
+        self.prompts = []
+        self.prewarmed = []
+        self.prewarm_event = threading.Event()
+
+    def get_model_response_stream(self, model, prompt, max_tokens=1000, temperature=0.7, use_cache=True,
+                                  metrics=None, cancel_token=None):
+        self.prompts.append(prompt)
+        for word in self.reply.split(" "):
+            cancel_token.raise_if_cancelled()
+            yield word + " "
+
+    def prewarm(self, model):
+        self.prewarmed.append(model)
+        self.prewarm_event.set()
+
+@pytest.fixture
+def scheduler():
+    schedulers = []
+
+    def create(**settings):
+        created = Scheduler(dict({"provider_limits": {"Ollama": 1}}, **settings))
+        schedulers.append(created)
+        return created
+
+    yield create
+    for created in schedulers:
+        created.shutdown()
+
+def run_in_job(jobs, function, providers=("Ollama",)):
+    result = {}
+    done = threading.Event()
+
+    def body(job):
+        try:
+            result["value"] = function(job)
+        finally:
+            done.set()
+
+    job = jobs.submit(body, priority=COLLABORATION, providers=providers)
+    assert done.wait(5)
+    wait_finished(job)
+    return job, result.get("value")
+
+def wait_finished(job):
+    deadline = time.monotonic() + 5
+    while job.state in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.state not in ("queued", "running")
+
+def wait_started(job):
+    deadline = time.monotonic() + 5
+    while job.started_at is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.started_at is not None
+
+def pipeline(jobs, interactions, **settings):
+    return Pipeline(interactions, jobs, dict({"enabled": True, "speculate": True}, **settings))
+
+def test_prewarm_runs_inside_the_collaborations_provider_slot(scheduler):
+    jobs = scheduler(workers=2)
+    interactions = FakeModelInteractions()
+    pipe = pipeline(jobs, interactions)
+
+    def collaboration(job):
+        pipe.prewarm("Ollama: llama3", job)
+        return interactions.prewarm_event.wait(5)
+
+    _, prewarmed_during_job = run_in_job(jobs, collaboration)
+    assert prewarmed_during_job
+    assert interactions.prewarmed == ["Ollama: llama3"]
+
+def test_queued_prewarm_is_dropped_when_the_collaboration_ends(scheduler):
+    jobs = scheduler(workers=1)
+    interactions = FakeModelInteractions()
+    pipe = pipeline(jobs, interactions)
+
+    def collaboration(job):
+        pipe.prewarm("Ollama: llama3", job)
+        pipe.prewarm("Ollama: llama3", job)
+        return pipe.prewarm_jobs["Ollama: llama3"]
+
+    _, prewarm = run_in_job(jobs, collaboration)
+    wait_finished(prewarm)
+    assert prewarm.state == "cancelled"
+    assert interactions.prewarmed == []
+    assert pipe.stats()["prewarmed"] == 1
+    assert jobs.stats()["queued"] == 0
+
+def test_prewarm_is_skipped_when_disabled(scheduler):
+    jobs = scheduler(workers=1)
+    pipe = pipeline(jobs, FakeModelInteractions(), prewarm=False)
+    run_in_job(jobs, lambda job: pipe.prewarm("Ollama: llama3", job))
+    assert pipe.prewarm_jobs == {}
+
+def speculate(pipe, job, chunks, wait_for_turn=True):
+    speculator = pipe.speculator("Groq: llama3", "Ollama: llama3", lambda prefix: f"prompt:{prefix}",
+                                 max_tokens=4, temperature=0.7, job=job)
+    for chunk in chunks:
+        speculator.update(chunk)
+        if wait_for_turn and speculator.current is not None:
+            wait_started(speculator.current.job)
+    turn = speculator.finish()
+    if turn is None:
+        return None, None
+    return turn, "".join(turn)
+
+def test_speculative_turn_is_confirmed_when_the_reply_only_adds_whitespace(scheduler):
+    jobs = scheduler(workers=2)
+    interactions = FakeModelInteractions()
+    pipe = pipeline(jobs, interactions)
+    _, (turn, text) = run_in_job(jobs, lambda job: speculate(pipe, job, ["Hello there, friend.", " \n"]))
+    assert turn.prefix == "Hello there, friend."
+    assert interactions.prompts == ["prompt:Hello there, friend."]
+    assert text == "Next reply. "
+    assert pipe.stats()["confirmed"] == 1
+
+def test_speculative_turn_is_discarded_when_the_reply_continues(scheduler):
+    jobs = scheduler(workers=2)
+    pipe = pipeline(jobs, FakeModelInteractions())
+    _, (turn, _) = run_in_job(jobs, lambda job: speculate(pipe, job, ["Hello there, friend.", " And more"]))
+    assert turn is None
+    assert pipe.stats()["speculated"] == 1
+    assert pipe.stats()["discarded"] == 1
+
+def test_speculation_waits_for_a_sentence_end_past_the_expected_length(scheduler):
+    jobs = scheduler(workers=2)
+    pipe = pipeline(jobs, FakeModelInteractions())
+    run_in_job(jobs, lambda job: speculate(pipe, job, ["Hi.", " A long sentence with no end"]))
+    assert pipe.stats()["speculated"] == 0
+
+def test_speculative_turn_without_a_worker_is_not_used(scheduler):
+    jobs = scheduler(workers=1)
+    pipe = pipeline(jobs, FakeModelInteractions())
+    _, (turn, _) = run_in_job(jobs, lambda job: speculate(pipe, job, ["Hello there, friend."], wait_for_turn=False))
+    assert turn is None
+    assert pipe.stats()["discarded"] == 1
+    assert jobs.stats()["queued"] == 0
+
+def test_expected_length_follows_recent_replies(scheduler):
+    pipe = pipeline(scheduler(workers=1), FakeModelInteractions(), reply_history=2)
+    assert pipe.expected_tokens("A", 1000) == 1000
+    for characters in (400, 800, 1200):
+        pipe.record_reply("A", characters)
+    assert pipe.expected_tokens("A", 1000) == 250
+    assert pipe.expected_tokens("A", 100) == 100
@@ -0,0 +1,134 @@
+import threading
+
+import pytest
+
+from resilience import (CircuitBreaker, CircuitOpenError, Resilience, TokenBucket, is_retryable,
+                        reported_tokens)
+
+class StatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+
+def settings(**overrides):
+    return {"default": dict({"backoff_base_seconds": 0.0, "backoff_max_seconds": 0.0}, **overrides)}
+
+def test_token_bucket_reserves_and_refunds():
+    bucket = TokenBucket(6000)
+    assert bucket.reserve(6000) == 0.0
+    assert bucket.reserve(600) == pytest.approx(6.0, rel=0.01)
+    bucket.adjust(1200)
+    assert bucket.reserve(0) == 0.0
+    bucket.adjust(10 ** 6)
+    assert bucket.tokens == bucket.capacity
+
+def test_is_retryable():
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(400))
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(CircuitOpenError())
+
+def test_reported_tokens_needs_both_sides():
+    assert reported_tokens({"prompt_tokens": 10, "output_tokens": 5}) == 15
+    assert reported_tokens({"prompt_tokens": 10}) is None
+
+def test_circuit_opens_and_allows_a_single_half_open_trial():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.0)
+    breaker.reset_timeout = 60.0
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.reset_timeout = 0.0
+    admitted = []
+    barrier = threading.Barrier(4)
+
+    def attempt():
+        barrier.wait()
+        try:
+            breaker.check()
+        except CircuitOpenError:
+            return
+        admitted.append(True)
+
+    threads = [threading.Thread(target=attempt) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(admitted) == 1
+    assert not breaker.available()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+def test_released_trial_lets_the_next_request_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    breaker.check()
+    breaker.release()
+    breaker.check()
+
+def test_stream_retries_before_the_first_chunk():
+    calls = []
+
+    def start_stream():
+        calls.append(True)
+        if len(calls) == 1:
+            raise StatusError(503)
+        yield "a"
+        yield "b"
+
+    assert list(Resilience(settings()).stream("P", start_stream)) == ["a", "b"]
+    assert len(calls) == 2
+
+def test_stream_does_not_retry_after_a_chunk():
+    calls = []
+
+    def start_stream():
+        calls.append(True)
+        yield "a"
+        raise StatusError(503)
+
+    received = []
+    with pytest.raises(StatusError):
+        for chunk in Resilience(settings()).stream("P", start_stream):
+            received.append(chunk)
+    assert received == ["a"]
+    assert len(calls) == 1
+
+def test_stream_does_not_retry_client_errors():
+    calls = []
+
+    def start_stream():
+        calls.append(True)
+        raise StatusError(400)
+        yield
+
+    with pytest.raises(StatusError):
+        list(Resilience(settings()).stream("P", start_stream))
+    assert len(calls) == 1
+
+def test_stream_settles_tpm_against_reported_usage():
+    resilience = Resilience(settings(tpm=6000))
+
+    def start_stream():
+        yield "a"
+
+    list(resilience.stream("P", start_stream, estimated_tokens=3000, used_tokens=lambda: 1000))
+    assert resilience.guard("P").tokens.tokens == pytest.approx(5000, abs=5)
+
+def test_failed_attempt_without_output_is_refunded():
+    resilience = Resilience(settings(tpm=6000, max_retries=0))
+
+    def start_stream():
+        raise StatusError(400)
+        yield
+
+    with pytest.raises(StatusError):
+        list(resilience.stream("P", start_stream, estimated_tokens=3000))
+    assert resilience.guard("P").tokens.tokens == pytest.approx(6000, abs=5)
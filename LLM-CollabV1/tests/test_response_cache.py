@@ -0,0 +1,142 @@
+import json
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+@pytest.fixture
+def cache(tmp_path):
+    caches = []
+
+    def create(**settings):
+        created = ResponseCache(dict({"enabled": True, "path": str(tmp_path / "cache.sqlite3")}, **settings))
+        caches.append(created)
+        return created
+
+    yield create
+    for created in caches:
+        created.close()
+
+def test_key_covers_everything_that_changes_the_reply(cache):
+    responses = cache()
+    key = responses.key("Groq: llama3", "hi", 100, 0.2)
+    assert key == responses.key("Groq: llama3", "hi", 100, 0.2000001)
+    assert key != responses.key("Groq: llama3", "hi", 101, 0.2)
+    assert key != responses.key("Groq: llama3", [{"role": "user", "content": "hi"}], 100, 0.2)
+    assert key != responses.key("Ollama: llama3", "hi", 100, 0.2)
+
+def test_replays_chunks_from_memory_then_disk(cache, tmp_path):
+    responses = cache()
+    key = responses.key("Groq: llama3", "hi", 100, 0.0)
+    assert responses.get(key) is None
+    responses.put(key, "Groq: llama3", ["Hel", "lo"])
+    assert responses.get(key) == ["Hel", "lo"]
+    responses.close()
+
+    reopened = cache()
+    assert reopened.get(key) == ["Hel", "lo"]
+    assert reopened.get(key) == ["Hel", "lo"]
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+def test_high_temperatures_and_disabled_caches_are_bypassed(cache):
+    assert not cache(max_temperature=0.5).should_cache(0.7)
+    assert cache(max_temperature=0.5).should_cache(0.5)
+    assert not cache(enabled=False).should_cache(0.0)
+
+def test_expired_entries_are_misses(cache):
+    responses = cache(ttl_seconds=60)
+    key = responses.key("Groq: llama3", "hi", 100, 0.0)
+    responses.put(key, "Groq: llama3", ["old"])
+    responses.memory.clear()
+    responses._connection().execute("UPDATE responses SET created_at = ?", (time.time() - 120,))
+    assert responses.get(key) is None
+    assert responses.stats()["evicted"] == 1
+
+def test_least_recently_used_entries_are_evicted(cache):
+    responses = cache(max_entries=2, memory_entries=0)
+    keys = [responses.key("Groq: llama3", str(index), 100, 0.0) for index in range(3)]
+    responses.put(keys[0], "Groq: llama3", ["0"])
+    responses.put(keys[1], "Groq: llama3", ["1"])
+    time.sleep(0.01)
+    assert responses.get(keys[0]) == ["0"]
+    responses.put(keys[2], "Groq: llama3", ["2"])
+    assert responses.get(keys[1]) is None
+    assert responses.get(keys[0]) == ["0"]
+    assert responses.get(keys[2]) == ["2"]
+
+def test_empty_responses_are_not_stored(cache):
+    responses = cache()
+    key = responses.key("Groq: llama3", "hi", 100, 0.0)
+    responses.put(key, "Groq: llama3", [])
+    assert responses.get(key) is None
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=None):
+        yield from self.body
+
+    def close(self):
+        pass
+
+def cached_interactions(tmp_path, bodies):
+    pytest.importorskip("requests")
+    from models import ModelInteractions
+    interactions = ModelInteractions({
+        "API_KEYS": {"perplexity": ""},
+        "API_URLS": {"groq_llm": "http://groq.invalid/chat/completions", "perplexity": "http://perplexity.invalid"},
+        "HEADERS": {"groq": {}},
+        "RESILIENCE": {"default": {"max_retries": 0}},
+        "RESPONSE_CACHE": {"enabled": True, "path": str(tmp_path / "cache.sqlite3")}
+    })
+    sent = []
+
+    def post(provider, url, **kwargs):
+        sent.append(kwargs["json"])
+        return FakeResponse(bodies.pop(0))
+
+    interactions.connection_pool.post = post
+    return interactions, sent
+
+def sse(*texts):
+    events = [b"data: " + json.dumps({"choices": [{"delta": {"content": text}}]}).encode("utf-8") + b"\n\n"
+              for text in texts]
+    return events + [b"data: [DONE]\n\n"]
+
+def test_repeated_prompt_is_replayed_chunk_by_chunk(tmp_path):
+    interactions, sent = cached_interactions(tmp_path, [sse("Hel", "lo")])
+    try:
+        first = list(interactions.get_model_response_stream("Groq: llama3", "hi", temperature=0.0))
+        second = list(interactions.get_model_response_stream("Groq: llama3", "hi", temperature=0.0))
+    finally:
+        interactions.close()
+    assert first == second == ["Hel", "lo"]
+    assert len(sent) == 1
+
+def test_interrupted_stream_is_not_cached(tmp_path):
+    broken = sse("Hel")[:1] + [b"data: {\"choices\": [{\"delta\": {\"content\": \"lo\"}}]}\n\n"]
+
+    def failing():
+        yield from broken
+        raise ConnectionError("reset")
+
+    interactions, sent = cached_interactions(tmp_path, [failing(), sse("Hello")])
+    try:
+        with pytest.raises(ConnectionError):
+            list(interactions.get_model_response_stream("Groq: llama3", "hi", temperature=0.0))
+        assert list(interactions.get_model_response_stream("Groq: llama3", "hi", temperature=0.0)) == ["Hello"]
+    finally:
+        interactions.close()
+    assert len(sent) == 2
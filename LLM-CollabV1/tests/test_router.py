@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from providers import ProviderAdapter, ProviderRegistry
+from resilience import Resilience
+from router import Router
+from telemetry import Telemetry
+
+class FakeModelInteractions:
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.registry = ProviderRegistry()
+        for prefix in {model.partition(": ")[0] for model in behaviour}:
+            self.registry.register(ProviderAdapter(prefix, None, None))
+        self.telemetry = Telemetry()
+        self.resilience = Resilience()
+        self.started = []
+        self.tokens = {}
+
+    def get_model_response_stream(self, model, prompt, max_tokens=1000, temperature=0.7, use_cache=True,
+                                  cancel_token=None):
+        self.started.append(model)
+        self.tokens[model] = cancel_token
+        delay, result = self.behaviour[model]
+        if cancel_token.wait(delay):
+            cancel_token.raise_if_cancelled()
+        if isinstance(result, Exception):
+            raise result
+        for chunk in result:
+            yield chunk
+
+    def prewarm(self, model):
+        self.started.append(f"prewarm {model}")
+
+def record(interactions, model, ttft, count=3):
+    for _ in range(count):
+        metrics = interactions.telemetry.start(model)
+        metrics.start -= ttft
+        metrics.chunk("x" * 40)
+        interactions.telemetry.finish(metrics)
+
+def router(behaviour, **settings):
+    interactions = FakeModelInteractions(behaviour)
+    groups = {"fast": list(behaviour)}
+    return Router(interactions, dict({"groups": groups, "hedge_default_seconds": 5.0}, **settings)), interactions
+
+def test_unmeasured_backends_are_tried_first_then_the_fastest():
+    routing, interactions = router({"A: slow": (0, ["a"]), "B: quick": (0, ["b"]), "C: new": (0, ["c"])})
+    record(interactions, "A: slow", 2.0)
+    record(interactions, "B: quick", 0.2)
+    assert routing.candidates("fast") == ["C: new", "B: quick", "A: slow"]
+
+def test_backends_cooling_down_after_failures_go_last():
+    routing, interactions = router({"A: one": (0, ["a"]), "B: two": (0, ["b"])}, failure_threshold=2)
+    routing.record_failure("A: one")
+    assert routing.candidates("fast")[0] == "A: one"
+    routing.record_failure("A: one")
+    assert routing.candidates("fast") == ["B: two", "A: one"]
+    assert routing.stats()["cooling_down"] == ["A: one"]
+    routing.record_success("A: one")
+    assert routing.candidates("fast")[0] == "A: one"
+
+def test_unknown_group_is_an_error():
+    routing, _ = router({"A: one": (0, ["a"])})
+    with pytest.raises(ValueError):
+        routing.candidates("missing")
+
+def test_slow_first_token_is_hedged_and_the_loser_cancelled():
+    routing, interactions = router({"A: stuck": (5, ["late"]), "B: quick": (0, ["he", "llo"])},
+                                   hedge_default_seconds=0.05)
+    started = time.monotonic()
+    assert list(routing.stream("fast", "hi", 100, 0.0)) == ["he", "llo"]
+    assert time.monotonic() - started < 2
+    assert interactions.started == ["A: stuck", "B: quick"]
+    assert interactions.tokens["A: stuck"].cancelled
+    stats = routing.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+
+def test_fast_backend_is_not_hedged():
+    routing, interactions = router({"A: quick": (0, ["a"]), "B: other": (0, ["b"])})
+    assert list(routing.stream("fast", "hi", 100, 0.0)) == ["a"]
+    assert interactions.started == ["A: quick"]
+
+def test_failure_before_output_fails_over():
+    routing, interactions = router({"A: broken": (0, ConnectionError("refused")), "B: fine": (0, ["b"])})
+    assert list(routing.stream("fast", "hi", 100, 0.0)) == ["b"]
+    assert routing.stats()["failovers"] == 1
+
+def test_all_backends_failing_raises():
+    routing, _ = router({"A: broken": (0, ConnectionError("a")), "B: broken": (0, ConnectionError("b"))})
+    with pytest.raises(ConnectionError):
+        list(routing.stream("fast", "hi", 100, 0.0))
+
+def test_prewarm_goes_to_the_best_candidate():
+    routing, interactions = router({"A: one": (0, ["a"]), "B: two": (0, ["b"])})
+    record(interactions, "A: one", 2.0)
+    record(interactions, "B: two", 0.1)
+    routing.prewarm("fast")
+    assert interactions.started == ["prewarm B: two"]
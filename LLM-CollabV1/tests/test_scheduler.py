@@ -0,0 +1,182 @@
+import threading
+
+import pytest
+
+from scheduler import Scheduler, QueueFull, INTERACTIVE, BACKGROUND
+
+@pytest.fixture
+def scheduler():
+    schedulers = []
+
+    def create(**settings):
+        created = Scheduler(settings)
+        schedulers.append(created)
+        return created
+
+    yield create
+    for created in schedulers:
+        created.shutdown()
+
+def wait_done(*jobs, timeout=5):
+    for job in jobs:
+        for _ in range(int(timeout / 0.01)):
+            if job.state not in ("queued", "running"):
+                break
+            threading.Event().wait(0.01)
+        assert job.state not in ("queued", "running")
+
+def test_jobs_receive_their_job_and_arguments(scheduler):
+    seen = []
+    job = scheduler(workers=1).submit(lambda job, a, b: seen.append((job, a, b)), 1, 2)
+    wait_done(job)
+    assert seen == [(job, 1, 2)]
+    assert job.state == "completed"
+
+def test_higher_priority_runs_first(scheduler):
+    jobs = scheduler(workers=1)
+    gate = threading.Event()
+    order = []
+    blocker = jobs.submit(lambda job: gate.wait(5))
+    background = jobs.submit(lambda job: order.append("background"), priority=BACKGROUND)
+    interactive = jobs.submit(lambda job: order.append("interactive"), priority=INTERACTIVE)
+    gate.set()
+    wait_done(blocker, background, interactive)
+    assert order == ["interactive", "background"]
+
+def test_provider_limit_is_respected(scheduler):
+    jobs = scheduler(workers=4, provider_limits={"Ollama": 1})
+    lock = threading.Lock()
+    active = [0, 0]
+
+    def work(job):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        threading.Event().wait(0.05)
+        with lock:
+            active[0] -= 1
+
+    submitted = [jobs.submit(work, providers=["Ollama"]) for _ in range(4)]
+    wait_done(*submitted)
+    assert active[1] == 1
+
+def test_jobs_in_the_same_group_never_overlap(scheduler):
+    jobs = scheduler(workers=4)
+    lock = threading.Lock()
+    active = [0, 0]
+
+    def work(job):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        threading.Event().wait(0.05)
+        with lock:
+            active[0] -= 1
+
+    submitted = [jobs.submit(work, group="conversation") for _ in range(3)]
+    wait_done(*submitted)
+    assert active[1] == 1
+
+def test_full_queue_raises(scheduler):
+    jobs = scheduler(workers=1, max_queue=1)
+    gate = threading.Event()
+    started = threading.Event()
+    blocker = jobs.submit(lambda job: (started.set(), gate.wait(5)))
+    assert started.wait(5)
+    jobs.submit(lambda job: None)
+    with pytest.raises(QueueFull):
+        jobs.submit(lambda job: None)
+    assert jobs.stats()["rejected"] == 1
+    gate.set()
+    wait_done(blocker)
+
+def test_cancel_removes_a_queued_job(scheduler):
+    jobs = scheduler(workers=1)
+    gate = threading.Event()
+    ran = []
+    blocker = jobs.submit(lambda job: gate.wait(5))
+    queued = jobs.submit(lambda job: ran.append(job))
+    jobs.cancel(queued)
+    gate.set()
+    wait_done(blocker)
+    assert queued.state == "cancelled"
+    assert queued.cancel_token.cancelled
+    assert ran == []
+
+def test_failed_job_records_its_error(scheduler):
+    def fail(job):
+        raise ValueError("boom")
+
+    job = scheduler(workers=1).submit(fail)
+    wait_done(job)
+    assert job.state == "failed"
+    assert isinstance(job.error, ValueError)
+
+def test_inbox_delivers_until_closed(scheduler):
+    jobs = scheduler(workers=1)
+    gate = threading.Event()
+    job = jobs.submit(lambda job: gate.wait(5))
+    assert jobs.deliver(job, "first")
+    assert jobs.take_inbox(job) == ["first"]
+    assert jobs.deliver(job, "second")
+    assert jobs.close_inbox(job) == ["second"]
+    assert not jobs.deliver(job, "third")
+    gate.set()
+    wait_done(job)
+    assert not jobs.deliver(job, "fourth")
+
+def test_child_job_shares_its_parents_provider_slot(scheduler):
+    jobs = scheduler(workers=3, provider_limits={"Ollama": 1})
+    child_ran = threading.Event()
+    outsider_ran = threading.Event()
+
+    def parent(job):
+        jobs.submit(lambda child: child_ran.set(), providers=["Ollama"], priority=BACKGROUND, parent=job)
+        assert child_ran.wait(5)
+        jobs.submit(lambda other: outsider_ran.set(), providers=["Ollama"])
+        threading.Event().wait(0.1)
+        assert not outsider_ran.is_set()
+
+    job = jobs.submit(parent, providers=["Ollama"])
+    wait_done(job)
+    assert job.state == "completed"
+    assert outsider_ran.wait(5)
+
+def test_children_are_cancelled_when_the_parent_ends(scheduler):
+    jobs = scheduler(workers=2)
+    children = []
+    child_started = threading.Event()
+
+    def child(job):
+        child_started.set()
+        job.cancel_token.wait(5)
+        job.cancel_token.raise_if_cancelled()
+
+    def parent(job):
+        children.append(jobs.submit(child, priority=BACKGROUND, parent=job))
+        assert child_started.wait(5)
+        children.append(jobs.submit(lambda job: None, priority=BACKGROUND, parent=job))
+
+    wait_done(jobs.submit(parent))
+    wait_done(*children)
+    assert [job.state for job in children] == ["cancelled", "cancelled"]
+    assert jobs.stats()["queued"] == 0
+
+def test_child_of_a_finished_job_is_refused(scheduler):
+    jobs = scheduler(workers=1)
+    parent = jobs.submit(lambda job: None)
+    wait_done(parent)
+    with pytest.raises(RuntimeError):
+        jobs.submit(lambda job: None, parent=parent)
+
+def test_finished_collaborations_leave_no_background_jobs_queued(scheduler):
+    jobs = scheduler(workers=1, max_queue=2)
+
+    def collaboration(job):
+        for _ in range(2):
+            jobs.submit(lambda job: None, priority=BACKGROUND, providers=["Ollama"], parent=job)
+
+    for _ in range(5):
+        wait_done(jobs.submit(collaboration, providers=["Ollama"]))
+    assert jobs.stats()["queued"] == 0
+    wait_done(jobs.submit(lambda job: None))
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from session_store import SessionStore, match_expression, parse_search
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore({"path": str(tmp_path / "sessions.sqlite3")})
+    yield store
+    store.close()
+
+def test_search_with_filters(store):
+    if not store.searchable:
+        pytest.skip("SQLite was built without FTS5")
+    store.ensure_session("s1", "collaboration", "Retries")
+    store.append_turn("s1", "user", "How should retry backoff work?")
+    store.append_turn("s1", "assistant", "Use exponential backoff with jitter.", name="OpenAI: gpt-4o",
+                      persona="Technical Expert")
+    store.append_turn("s1", "assistant", "Backoff needs a cap.", name="Ollama: llama3")
+
+    assert len(store.search(["backoff"])) == 3
+    assert [result["name"] for result in store.search(["backoff"], model="gpt-4o")] == ["OpenAI: gpt-4o"]
+    assert [result["role"] for result in store.search(["backoff"], role="user")] == ["user"]
+    assert len(store.search(["backoff"], role="technical expert")) == 1
+    assert store.search(["backoff"], session="other") == []
+    assert store.search(["backoff"], after=time.time() + 60) == []
+    assert len(store.search(["expon*"])) == 1
+    assert store.search(["backoff"])[0]["title"] == "Retries"
+
+def test_search_treats_punctuation_literally(store):
+    if not store.searchable:
+        pytest.skip("SQLite was built without FTS5")
+    store.ensure_session("s", "chat", "Syntax")
+    store.append_turn("s", "user", "What does C++ (or C#) do with NOT AND OR?")
+    assert len(store.search(["C++", "(or", "NOT"])) == 1
+
+def test_match_expression_quotes_terms():
+    assert match_expression(['say "hi"', "retr*", "*"]) == '"say ""hi"""' + ' "retr"* "*"'
+    assert match_expression([]) == ""
+
+def test_parse_search_splits_terms_and_filters():
+    terms, filters = parse_search('model:gpt-4o role:"Technical Expert" after:2024-05-01 retry backoff')
+    assert terms == ["retry", "backoff"]
+    assert filters["model"] == "gpt-4o"
+    assert filters["role"] == "Technical Expert"
+    assert filters["after"] == time.mktime(time.strptime("2024-05-01", "%Y-%m-%d"))
+
+def test_parse_search_before_includes_the_whole_day():
+    _, filters = parse_search("before:2024-05-01")
+    assert filters["before"] == time.mktime(time.strptime("2024-05-01", "%Y-%m-%d")) + 86400
+
+def test_parse_search_tolerates_unbalanced_quotes():
+    terms, filters = parse_search('"unclosed quote')
+    assert terms == ['"unclosed', "quote"]
+    assert filters == {}
+
+def test_turns_saved_before_the_index_existed_are_searchable(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SessionStore({"path": path})
+    if not store.searchable:
+        store.close()
+        pytest.skip("SQLite was built without FTS5")
+    store.connection.executescript("DROP TRIGGER turns_fts_insert; DROP TABLE turns_fts;")
+    store.ensure_session("s", "chat", "Old")
+    store.append_turn("s", "user", "written before search existed")
+    store.close()
+
+    store = SessionStore({"path": path})
+    try:
+        assert [result["content"] for result in store.search(["before"])] == ["written before search existed"]
+    finally:
+        store.close()
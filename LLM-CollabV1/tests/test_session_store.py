@@ -0,0 +1,50 @@
+import pytest
+
+from session_store import SessionStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore({"path": str(tmp_path / "sessions.sqlite3")})
+    yield store
+    store.close()
+
+def test_turns_are_numbered_per_session(store):
+    store.ensure_session("s1", "chat", "First")
+    store.ensure_session("s2", "chat", "Second")
+    store.append_turn("s1", "user", "hello")
+    store.append_turn("s2", "user", "other")
+    store.append_turn("s1", "assistant", "hi", name="OpenAI: gpt-4o", metrics={"output_tokens": 1})
+    turns = store.turns("s1")
+    assert [(turn["seq"], turn["content"]) for turn in turns] == [(1, "hello"), (2, "hi")]
+    assert turns[1]["metrics"] == {"output_tokens": 1}
+    assert store.session("s1")["turn_count"] == 2
+
+def test_append_to_unknown_session_raises(store):
+    with pytest.raises(KeyError):
+        store.append_turn("missing", "user", "hello")
+
+def test_tail_stops_at_the_token_limit(store):
+    store.ensure_session("s", "chat", "Tail")
+    for i in range(5):
+        store.append_turn("s", "user", f"{i}" * 40)
+    turns = store.tail("s", max_tokens=25)
+    assert [turn["seq"] for turn in turns] == [4, 5]
+    assert [turn["seq"] for turn in store.tail("s", max_turns=1)] == [5]
+    # The newest turn is always returned, even when it alone is over the limit.
+    assert [turn["seq"] for turn in store.tail("s", max_tokens=1)] == [5]
+
+def test_recent_sessions_skip_empty_ones_and_reopen_from_disk(store, tmp_path):
+    store.ensure_session("empty", "chat", "Nothing said")
+    store.ensure_session("s", "collaboration", "Talk", {"models": ["A", "B"]})
+    store.set_system("s", "Be brief.")
+    store.append_turn("s", "user", "hello")
+    assert [session["id"] for session in store.recent_sessions()] == ["s"]
+
+    reopened = SessionStore({"path": str(tmp_path / "sessions.sqlite3")})
+    try:
+        session = reopened.session("s")
+        assert session["system"] == "Be brief."
+        assert session["settings"] == {"models": ["A", "B"]}
+        assert [turn["content"] for turn in reopened.tail("s")] == ["hello"]
+    finally:
+        reopened.close()
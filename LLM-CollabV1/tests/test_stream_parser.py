@@ -0,0 +1,93 @@
+import asyncio
+
+from stream_parser import SSEParser, NDJSONParser, iter_sse_json, iter_ndjson, aiter_sse_json, chat_completion_delta
+
+def split_every(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def test_sse_events_split_across_chunks():
+    body = b'data: {"a": 1}\n\ndata: {"a": 2}\n\n'
+    for size in range(1, len(body) + 1):
+        assert list(iter_sse_json(split_every(body, size))) == [{"a": 1}, {"a": 2}]
+
+def test_sse_crlf_line_endings():
+    body = b'data: {"a": 1}\r\n\r\nevent: message\r\ndata: {"a": 2}\r\n\r\n'
+    for size in (1, 3, len(body)):
+        assert list(iter_sse_json(split_every(body, size))) == [{"a": 1}, {"a": 2}]
+
+def test_sse_done_split_across_chunks_stops_the_stream():
+    body = b'data: {"a": 1}\n\ndata: [DONE]\n\ndata: {"a": 2}\n\n'
+    for size in range(1, len(body) + 1):
+        assert list(iter_sse_json(split_every(body, size))) == [{"a": 1}]
+
+def test_sse_done_stops_reading_further_chunks():
+    read = []
+
+    def chunks():
+        for chunk in (b'data: {"a": 1}\n\n', b"data: [DO", b"NE]\n\n", b'data: {"a": 2}\n\n'):
+            read.append(chunk)
+            yield chunk
+
+    assert list(iter_sse_json(chunks())) == [{"a": 1}]
+    assert len(read) == 3
+
+def test_sse_comments_and_keep_alives_are_ignored():
+    body = b': keep-alive\n\n:\n\ndata: {"a": 1}\n: ping\n\n\n\n'
+    assert list(iter_sse_json([body])) == [{"a": 1}]
+
+def test_sse_final_event_without_trailing_newline():
+    assert list(iter_sse_json([b'data: {"a": 1}\n\ndata: {"a": 2}'])) == [{"a": 1}, {"a": 2}]
+    assert list(iter_sse_json([b'data: {"a": 1}\r'])) == [{"a": 1}]
+
+def test_sse_done_without_trailing_newline():
+    assert list(iter_sse_json([b'data: {"a": 1}\n\n', b"data: [DONE]"])) == [{"a": 1}]
+
+def test_sse_multiline_data_and_event_name():
+    parser = SSEParser()
+    events = parser.feed(b'event: delta\ndata: {"a":\ndata: 1}\n\n')
+    assert events == [("delta", b'{"a":\n1}')]
+
+def test_sse_invalid_json_is_reported_and_skipped():
+    errors = []
+    body = b'data: {"a": 1}\n\ndata: not json\n\ndata: {"a": 2}\n\n'
+    assert list(iter_sse_json([body], on_error=errors.append)) == [{"a": 1}, {"a": 2}]
+    assert errors == [b"not json"]
+
+def test_sse_multibyte_utf8_split_across_chunks():
+    body = 'data: {"text": "héllo ✓"}\n\n'.encode("utf-8")
+    assert list(iter_sse_json(split_every(body, 1))) == [{"text": "héllo ✓"}]
+
+def test_async_sse_matches_sync():
+    body = b'data: {"a": 1}\r\n\r\n: ping\r\n\r\ndata: [DONE]\r\n\r\n'
+
+    async def collect():
+        async def chunks():
+            for chunk in split_every(body, 5):
+                yield chunk
+        return [data async for data in aiter_sse_json(chunks())]
+
+    assert asyncio.run(collect()) == [{"a": 1}]
+
+def test_ndjson_lines_split_across_chunks():
+    body = b'{"a": 1}\n{"a": 2}\n'
+    for size in range(1, len(body) + 1):
+        assert list(iter_ndjson(split_every(body, size))) == [{"a": 1}, {"a": 2}]
+
+def test_ndjson_crlf_and_blank_lines():
+    body = b'{"a": 1}\r\n\r\n{"a": 2}\r\n'
+    assert list(iter_ndjson(split_every(body, 4))) == [{"a": 1}, {"a": 2}]
+
+def test_ndjson_final_line_without_newline():
+    assert list(iter_ndjson([b'{"a": 1}\n{"a"', b': 2}'])) == [{"a": 1}, {"a": 2}]
+
+def test_ndjson_parser_keeps_partial_line_until_flush():
+    parser = NDJSONParser()
+    assert parser.feed(b'{"a": 1}\n{"a": ') == [b'{"a": 1}']
+    assert parser.flush() == [b'{"a":']
+    assert parser.flush() == []
+
+def test_chat_completion_delta():
+    assert chat_completion_delta({"choices": [{"delta": {"content": "hi"}}]}) == "hi"
+    assert chat_completion_delta({"choices": [{"delta": {}}]}) == ""
+    assert chat_completion_delta({"choices": []}) == ""
+    assert chat_completion_delta({"usage": {"prompt_tokens": 3}}) == ""
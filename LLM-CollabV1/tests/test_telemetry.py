@@ -0,0 +1,40 @@
+from telemetry import RequestMetrics, Telemetry, format_prompt_usage
+from usage import UsageTracker, empty_usage
+
+def test_unknown_cached_tokens_stay_none():
+    metrics = RequestMetrics("Groq: llama3")
+    metrics.usage(dict(empty_usage(), prompt_tokens=120, output_tokens=30))
+    summary = metrics.summary("ok")
+    assert summary["prompt_tokens"] == 120
+    assert summary["cached_tokens"] is None
+    assert format_prompt_usage(summary) == "120 prompt tok"
+
+def test_reported_zero_cached_tokens_are_shown():
+    metrics = RequestMetrics("OpenAI: gpt-4o")
+    metrics.usage(dict(empty_usage(), prompt_tokens=120, cached_tokens=0, output_tokens=30))
+    assert format_prompt_usage(metrics.summary("ok")) == "120 prompt tok (0 cached)"
+
+def test_no_usage_falls_back_to_estimated_output_tokens():
+    metrics = RequestMetrics("Ollama: llama3")
+    metrics.chunk("12345678")
+    metrics.usage(empty_usage())
+    summary = metrics.summary("ok")
+    assert summary["output_tokens"] == 2
+    assert summary["prompt_tokens"] is None
+
+def test_usage_tracker_counts_unreported_fields_as_zero():
+    tracker = UsageTracker()
+    tracker.record("Groq: llama3", empty_usage())
+    tracker.record("Groq: llama3", dict(empty_usage(), prompt_tokens=100, cached_tokens=40))
+    stats = tracker.stats()["Groq: llama3"]
+    assert stats["requests"] == 2
+    assert stats["prompt_tokens"] == 100
+    assert stats["cache_hit_ratio"] == 0.4
+
+def test_finish_passes_the_summary_to_listeners():
+    telemetry = Telemetry({"enabled": False})
+    seen = []
+    telemetry.add_listener(seen.append)
+    summary = telemetry.finish(telemetry.start("Groq: llama3"), "cancelled")
+    assert seen == [summary]
+    assert summary["status"] == "cancelled"
@@ -0,0 +1,48 @@
+import json
+import os
+import time
+from array import array
+
+DEFAULT_TRANSCRIPT_SETTINGS = {
+    "directory": "transcripts",
+    "max_resident_messages": 200,
+    "page_size": 50
+}
+
+# Append-only JSON lines file. Only the byte offset of each record stays in memory
+# (eight bytes per message), so any range can be read back without scanning the file.
+class TranscriptFile:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.file = open(path, "w+b")
+        self.offsets = array("q")
+
+    @classmethod
+    def create(cls, directory):
+        name = time.strftime("chat-%Y%m%d-%H%M%S") + f"-{os.getpid()}-{int(time.time() * 1000) % 1000:03d}.jsonl"
+        return cls(os.path.join(directory, name))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, record):
+        self.file.seek(0, os.SEEK_END)
+        self.offsets.append(self.file.tell())
+        self.file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.file.flush()
+        return len(self.offsets) - 1
+
+    def read(self, start, stop):
+        start = max(start, 0)
+        stop = min(stop, len(self.offsets))
+        if start >= stop:
+            return []
+        self.file.seek(self.offsets[start])
+        return [json.loads(self.file.readline()) for _ in range(stop - start)]
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
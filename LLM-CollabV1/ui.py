@@ -1,14 +1,20 @@
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLineEdit, QTextEdit, QComboBox,
-    QLabel, QSplitter, QTabWidget, QDialog, QDialogButtonBox, QToolBar, QAction, QSpinBox
+    QLabel, QSplitter, QTabWidget, QDialog, QDialogButtonBox, QToolBar, QAction, QSpinBox,
+    QListWidget, QListWidgetItem, QAbstractItemView
 )
 from PyQt5.QtGui import QColor, QIcon, QTextCursor, QFont, QFontDatabase, QTextCharFormat, QPainter, QSyntaxHighlighter
-from PyQt5.QtCore import Qt, pyqtSlot, Q_ARG, QMetaObject, pyqtSignal, QTimer, QSize
-from PyQt5.QtChart import QChart, QChartView, QBarSeries, QBarSet, QValueAxis, QBarCategoryAxis, QLineSeries
-from pygments import highlight
-from pygments.lexers import PythonLexer
-from pygments.formatters import HtmlFormatter
-from bs4 import BeautifulSoup
+from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal, QTimer, QSize, QObject, QPoint
+from PyQt5.QtChart import QChart, QChartView, QValueAxis, QLineSeries
+from pygments.lexers import get_lexer_by_name
+from pygments.token import Token
+from pygments.util import ClassNotFound
+import asyncio
+import time
+from collections import OrderedDict, deque
+from async_models import EventLoopThread
+from transcript import DEFAULT_TRANSCRIPT_SETTINGS, TranscriptFile
+from telemetry import percentile, format_prompt_usage
 
 class Theme:
     DARK = {
@@ -23,36 +29,172 @@ class Theme:
     }
 
 class CodeHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent=None):
+    PROSE = 0
+    MEMO_SIZE = 4096
+
+    TOKEN_COLORS = [
+        (Token.Keyword, '#c678dd'),
+        (Token.Literal.String, '#98c379'),
+        (Token.Comment, '#5c6370'),
+        (Token.Literal.Number, '#d19a66'),
+        (Token.Name, '#e5c07b'),
+        (Token.Operator, '#d19a66'),
+        (Token.Punctuation, '#abb2bf'),
+    ]
+
+    def __init__(self, parent=None, default_language="python"):
         super().__init__(parent)
-        self.formatter = HtmlFormatter()
+        self.default_language = default_language
+        self.languages = []
+        self.lexers = {}
+        self.token_formats = {}
+        self.memo = OrderedDict()
+
+        self.color_formats = {}
+        for token_type, color in self.TOKEN_COLORS:
+            char_format = QTextCharFormat()
+            char_format.setForeground(QColor(color))
+            self.color_formats[token_type] = char_format
+        self.fence_format = QTextCharFormat()
+        self.fence_format.setForeground(QColor('#5c6370'))
+
+    # Block states: PROSE outside fences, otherwise 1 + index of the fence language,
+    # so Qt only re-highlights following blocks when a fence actually opens or closes.
+    def language_state(self, language):
+        language = language or self.default_language
+        if language not in self.languages:
+            self.languages.append(language)
+        return self.languages.index(language) + 1
+
+    def lexer_for(self, state):
+        lexer = self.lexers.get(state)
+        if lexer is None:
+            language = self.languages[state - 1]
+            try:
+                lexer = get_lexer_by_name(language, stripnl=False, ensurenl=False)
+            except ClassNotFound:
+                lexer = get_lexer_by_name(self.default_language, stripnl=False, ensurenl=False)
+            self.lexers[state] = lexer
+        return lexer
+
+    def format_for(self, token_type):
+        if token_type in self.token_formats:
+            return self.token_formats[token_type]
+        char_format = None
+        for parent_type, color_format in self.color_formats.items():
+            if token_type in parent_type:
+                char_format = color_format
+                break
+        self.token_formats[token_type] = char_format
+        return char_format
+
+    def spans_for(self, state, text):
+        key = (state, text)
+        spans = self.memo.get(key)
+        if spans is not None:
+            self.memo.move_to_end(key)
+            return spans
+
+        spans = []
+        for index, token_type, value in self.lexer_for(state).get_tokens_unprocessed(text):
+            char_format = self.format_for(token_type)
+            if char_format is not None and value:
+                spans.append((index, len(value), char_format))
+        self.memo[key] = spans
+        if len(self.memo) > self.MEMO_SIZE:
+            self.memo.popitem(last=False)
+        return spans
 
     def highlightBlock(self, text):
-        highlighted = highlight(text, PythonLexer(), self.formatter)
-        soup = BeautifulSoup(highlighted, 'html.parser')
-
-        format_dict = {
-            'k': QColor('#c678dd'),  # Keyword
-            's': QColor('#98c379'),  # String
-            'c': QColor('#5c6370'),  # Comment
-            'n': QColor('#e5c07b'),  # Name
-            'o': QColor('#d19a66'),  # Operator
-            'p': QColor('#abb2bf'),  # Punctuation
-        }
+        previous_state = self.previousBlockState()
+        in_code = previous_state > self.PROSE
+        stripped = text.lstrip()
+
+        if stripped.startswith("```"):
+            if in_code:
+                self.setCurrentBlockState(self.PROSE)
+            else:
+                language = stripped[3:].strip().split(maxsplit=1)
+                self.setCurrentBlockState(self.language_state(language[0].lower() if language else None))
+            self.setFormat(0, len(text), self.fence_format)
+            return
 
-        self.setFormat(0, len(text), QTextCharFormat())  # Reset format
+        if not in_code:
+            self.setCurrentBlockState(self.PROSE)
+            return
+
+        self.setCurrentBlockState(previous_state)
+        for start, length, char_format in self.spans_for(previous_state, text):
+            self.setFormat(start, length, char_format)
+
+class AsyncStreamBridge(QObject):
+    chunk_received = pyqtSignal(str, str)
+    stream_finished = pyqtSignal(str)
+    stream_failed = pyqtSignal(str, str)
+    stream_cancelled = pyqtSignal(str)
+
+    def __init__(self, async_interactions, parent=None):
+        super().__init__(parent)
+        self.async_interactions = async_interactions
+        self.loop_thread = EventLoopThread().start()
+        self.futures = {}
 
-        pos = 0
-        for tag in soup.find_all(['span']):
-            class_name = tag.get('class', [None])[0]
-            if class_name in format_dict:
-                color = format_dict[class_name]
-                char_format = QTextCharFormat()
-                char_format.setForeground(color)
-                start = text.find(tag.get_text(), pos)
-                end = start + len(tag.get_text())
-                self.setFormat(start, end - start, char_format)
-                pos = end
+    def start_stream(self, request_id, model, prompt, max_tokens, temperature, metrics=None):
+        future = self.loop_thread.submit(self._consume(request_id, model, prompt, max_tokens, temperature, metrics))
+        self.futures[request_id] = future
+        future.add_done_callback(lambda _: self.futures.pop(request_id, None))
+        return future
+
+    async def _consume(self, request_id, model, prompt, max_tokens, temperature, metrics=None):
+        try:
+            async for chunk in self.async_interactions.get_model_response_stream(
+                    model, prompt, max_tokens=max_tokens, temperature=temperature, metrics=metrics):
+                self.chunk_received.emit(request_id, chunk)
+        except asyncio.CancelledError:
+            self.stream_cancelled.emit(request_id)
+            raise
+        except Exception as e:
+            self.stream_failed.emit(request_id, str(e))
+        else:
+            self.stream_finished.emit(request_id)
+
+    def cancel(self, request_id=None):
+        futures = [self.futures.get(request_id)] if request_id else list(self.futures.values())
+        for future in futures:
+            if future is not None:
+                future.cancel()
+
+    def active_streams(self):
+        return len(self.futures)
+
+    def shutdown(self):
+        self.cancel()
+        self.loop_thread.submit(self.async_interactions.close()).result(timeout=5)
+        self.loop_thread.stop()
+
+class EventLoopLagMonitor(QObject):
+    def __init__(self, interval_ms=100, window=50, parent=None):
+        super().__init__(parent)
+        self.interval = interval_ms / 1000.0
+        self.window = window
+        self.samples = []
+        self.last_tick = time.perf_counter()
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start()
+
+    def tick(self):
+        now = time.perf_counter()
+        self.samples.append(max(now - self.last_tick - self.interval, 0.0))
+        if len(self.samples) > self.window:
+            del self.samples[0]
+        self.last_tick = now
+
+    def lag_ms(self):
+        if not self.samples:
+            return 0.0, 0.0
+        return sum(self.samples) / len(self.samples) * 1000, max(self.samples) * 1000
 
 class Role:
     ROLES = [
@@ -206,17 +348,24 @@ class ControlPanel(QWidget):
 
         self.init_single_model_tab()
         self.init_collab_tab()
+        self.init_compare_tab()
 
-        self.visualization = VisualizationWidget()
+        self.visualization = VisualizationWidget(self.main_window.config.get('UI', {}))
         layout.addWidget(self.visualization)
 
+        self.init_search(layout)
         self.init_control_buttons(layout)
 
         self.mode_tabs.currentChanged.connect(self.toggle_mode)
         self.start_collab_button.clicked.connect(self.main_window.start_collaboration)
         self.stop_button.clicked.connect(self.main_window.stop_chat)
         self.clear_chat_button.clicked.connect(self.main_window.clear_chat)
+        self.resume_session_button.clicked.connect(self.main_window.resume_session)
+        self.search_input.returnPressed.connect(self.search)
+        self.search_results.itemClicked.connect(self.open_search_result)
         self.collab_settings_button.clicked.connect(self.main_window.show_collaboration_settings)
+        self.load_graph_button.clicked.connect(self.main_window.load_collaboration_graph)
+        self.clear_graph_button.clicked.connect(self.main_window.clear_collaboration_graph)
 
     def init_single_model_tab(self):
         single_model_widget = QWidget()
@@ -259,25 +408,142 @@ class ControlPanel(QWidget):
         self.collab_settings_button = ModernButton("Collaboration Settings")
         collab_layout.addWidget(self.collab_settings_button)
 
+        self.graph_label = QLabel("No graph loaded: two models take turns")
+        self.graph_label.setWordWrap(True)
+        collab_layout.addWidget(self.graph_label)
+        graph_buttons_layout = QHBoxLayout()
+        self.load_graph_button = ModernButton("Load Graph...")
+        self.clear_graph_button = ModernButton("Clear Graph")
+        graph_buttons_layout.addWidget(self.load_graph_button)
+        graph_buttons_layout.addWidget(self.clear_graph_button)
+        collab_layout.addLayout(graph_buttons_layout)
+
         self.mode_tabs.addTab(collab_widget, "Collaboration")
 
+    def init_compare_tab(self):
+        compare_widget = QWidget()
+        compare_layout = QVBoxLayout(compare_widget)
+
+        compare_layout.addWidget(QLabel("Models to compare:"))
+        self.compare_model_list = QListWidget()
+        self.compare_model_list.setSelectionMode(QAbstractItemView.NoSelection)
+        self.compare_model_list.setStyleSheet("""
+            QListWidget {
+                background-color: #2c2c2c;
+                color: #e0e0e0;
+                border: 1px solid #3d3d3d;
+                border-radius: 5px;
+            }
+        """)
+        compare_layout.addWidget(self.compare_model_list)
+
+        compare_layout.addWidget(QLabel("Role for every model:"))
+        self.compare_role_dropdown = ModernComboBox()
+        self.compare_role_dropdown.addItems(Role.ROLES)
+        compare_layout.addWidget(self.compare_role_dropdown)
+
+        self.mode_tabs.addTab(compare_widget, "Compare")
+
+    def set_compare_models(self, models):
+        checked = set(self.selected_compare_models())
+        self.compare_model_list.clear()
+        for model in models:
+            item = QListWidgetItem(model)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if model in checked else Qt.Unchecked)
+            self.compare_model_list.addItem(item)
+
+    def selected_compare_models(self):
+        return [self.compare_model_list.item(i).text() for i in range(self.compare_model_list.count())
+                if self.compare_model_list.item(i).checkState() == Qt.Checked]
+
+    def init_search(self, layout):
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search past sessions (model: role: session: after: before:)")
+        self.search_input.setStyleSheet("""
+            QLineEdit {
+                background-color: #2c2c2c;
+                color: #e0e0e0;
+                border: 1px solid #3d3d3d;
+                padding: 5px;
+                border-radius: 5px;
+            }
+        """)
+        layout.addWidget(self.search_input)
+
+        self.search_results = QListWidget()
+        self.search_results.setWordWrap(True)
+        self.search_results.setVisible(False)
+        self.search_results.setStyleSheet("""
+            QListWidget {
+                background-color: #2c2c2c;
+                color: #e0e0e0;
+                border: 1px solid #3d3d3d;
+                border-radius: 5px;
+            }
+        """)
+        layout.addWidget(self.search_results)
+
+    def search(self):
+        text = self.search_input.text().strip()
+        self.search_results.clear()
+        self.search_results.setVisible(bool(text))
+        if not text:
+            return
+        for result in self.main_window.search_sessions(text):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(result["created_at"]))
+            speaker = result["name"] or result["role"]
+            item = QListWidgetItem(f"{when}  {result['title']} / {speaker}\n{result['snippet']}")
+            item.setData(Qt.UserRole, result)
+            self.search_results.addItem(item)
+        if self.search_results.count() == 0:
+            self.search_results.addItem(QListWidgetItem("No matches"))
+
+    def open_search_result(self, item):
+        result = item.data(Qt.UserRole)
+        if result is not None:
+            self.main_window.open_search_result(result)
+
     def init_control_buttons(self, layout):
         control_buttons_layout = QHBoxLayout()
         self.stop_button = ModernButton("Stop")
         self.clear_chat_button = ModernButton("Clear Chat")
+        self.resume_session_button = ModernButton("Resume Session...")
         control_buttons_layout.addWidget(self.stop_button)
         control_buttons_layout.addWidget(self.clear_chat_button)
+        control_buttons_layout.addWidget(self.resume_session_button)
         layout.addLayout(control_buttons_layout)
 
     def toggle_mode(self, index):
-        self.main_window.current_mode = "collaboration" if index == 1 else "single"
+        self.main_window.current_mode = ("single", "collaboration", "compare")[index]
+        showing_graph = index == 1 and self.main_window.collaboration_graph is not None
+        self.main_window.comparison_view.setVisible(index == 2 or showing_graph)
+
+    def set_graph(self, graph):
+        if graph is None:
+            self.graph_label.setText("No graph loaded: two models take turns")
+        else:
+            self.graph_label.setText(f"Graph: {graph.name} ({len(graph.nodes)} nodes). Send a message to run it.")
 
 class ChatBox(QWidget):
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
         self.init_ui()
-        self.current_stream_message = ""
+        self.pending_chunks = OrderedDict()
+
+        stream_fps = main_window.config.get('UI', {}).get('stream_fps', 30)
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(max(int(1000 / stream_fps), 1))
+        self.flush_timer.timeout.connect(self.flush_stream)
+
+        self.transcript_settings = dict(DEFAULT_TRANSCRIPT_SETTINGS, **main_window.config.get('TRANSCRIPT', {}))
+        self.max_resident = max(self.transcript_settings["max_resident_messages"], 1)
+        self.page_size = max(self.transcript_settings["page_size"], 1)
+        self.paging = False
+        self.transcript = None
+        self.reset_transcript()
+        self.chat_display.verticalScrollBar().valueChanged.connect(self.on_scroll)
 
     def init_ui(self):
         layout = QVBoxLayout(self)
@@ -324,97 +590,567 @@ class ChatBox(QWidget):
             self.main_window.handle_message(message)
             self.chat_input.clear()
 
-    def display_message(self, message, is_user=False):
-        cursor = self.chat_display.textCursor()
-        cursor.movePosition(QTextCursor.End)
+    # Every finished message goes to the transcript file; the document only holds the
+    # messages in window (their lengths in document positions) plus the ones still streaming,
+    # one live record per stream id.
+    # window_start is the transcript index of the first resident message.
+    def reset_transcript(self):
+        if self.transcript is not None:
+            self.transcript.close()
+        self.transcript = TranscriptFile.create(self.transcript_settings["directory"])
+        self.window = deque()
+        self.window_start = 0
+        self.lives = OrderedDict()
+        self.attached = True
+
+    def insert_record(self, cursor, record):
         format = QTextCharFormat()
-        if is_user:
+        if record["type"] == "stream":
+            header = f"\n{record['title']}: " if record["title"] else ""
+            cursor.insertText(header + record["text"], format)
+            return
+
+        message = record["text"]
+        if record["is_user"]:
             format.setForeground(QColor("#4a9de7"))
             cursor.insertText("You: ", format)
+            format.setForeground(QColor("#e0e0e0"))
+            cursor.insertText(message[5:] if message.startswith("You: ") else message, format)
+        elif ":" in message:
+            model_name, content = message.split(":", 1)
+            format.setForeground(QColor("#e67e22") if "Model 1:" in model_name else QColor("#e6e622"))
+            cursor.insertText(f"{model_name}: ", format)
+            format.setForeground(QColor("#e0e0e0"))
+            cursor.insertText(content.strip(), format)
         else:
-            if ":" in message:
-                model_name, content = message.split(":", 1)
-                format.setForeground(QColor("#e67e22") if "Model 1:" in model_name else QColor("#e6e622"))
-                cursor.insertText(f"{model_name}: ", format)
-                format.setForeground(QColor("#e0e0e0"))
-                cursor.insertText(content.strip(), format)
-            else:
-                format.setForeground(QColor("#e0e0e0"))
-                cursor.insertText(message, format)
+            format.setForeground(QColor("#e0e0e0"))
+            cursor.insertText(message, format)
         cursor.insertText("\n\n", format)
 
-        self.chat_display.setTextCursor(cursor)
-        self.chat_display.ensureCursorVisible()
-
-    def update_streaming_message(self, chunk):
-        self.current_stream_message += chunk
-        cursor = self.chat_display.textCursor()
+    def end_cursor(self):
+        cursor = QTextCursor(self.chat_display.document())
         cursor.movePosition(QTextCursor.End)
-        cursor.insertText(chunk)
-        self.chat_display.setTextCursor(cursor)
-        self.chat_display.ensureCursorVisible()
+        return cursor
+
+    def at_bottom(self):
+        scroll_bar = self.chat_display.verticalScrollBar()
+        return scroll_bar.value() >= scroll_bar.maximum() - 4
+
+    def scroll_to_bottom(self):
+        scroll_bar = self.chat_display.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+
+    # The scroll position is pinned to the text under the top of the viewport rather than
+    # to a pixel offset, so removing or inserting messages elsewhere does not move the view.
+    def viewport_anchor(self):
+        return self.chat_display.cursorForPosition(QPoint(0, 0)).position()
+
+    def restore_anchor(self, position):
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(max(0, min(position, self.chat_display.document().characterCount() - 1)))
+        scroll_bar = self.chat_display.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.value() + self.chat_display.cursorRect(cursor).top())
+
+    def remove_range(self, start, end):
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+
+    def drop_top(self, count):
+        removed = sum(self.window.popleft() for _ in range(count))
+        self.window_start += count
+        self.remove_range(0, removed)
+        return removed
+
+    def drop_bottom(self, count):
+        removed = sum(self.window.pop() for _ in range(count))
+        if self.attached:
+            for live in self.lives.values():
+                removed += live["length"]
+                live["length"] = 0
+        self.attached = False
+        end = self.chat_display.document().characterCount() - 1
+        self.remove_range(end - removed, end)
+
+    def trim_window(self):
+        excess = len(self.window) - self.max_resident
+        if excess <= 0 or not self.attached:
+            return
+        at_bottom = self.at_bottom()
+        anchor = self.viewport_anchor()
+        removed = self.drop_top(excess)
+        if at_bottom:
+            self.scroll_to_bottom()
+        else:
+            self.restore_anchor(anchor - removed)
+
+    def append_live(self, cursor, live):
+        start = cursor.position()
+        self.insert_record(cursor, {"type": "stream", "title": live["title"], "text": "".join(live["parts"])})
+        live["length"] = cursor.position() - start
+
+    def append_lives(self):
+        cursor = self.end_cursor()
+        for live in self.lives.values():
+            self.append_live(cursor, live)
+
+    # Live streams always sit below the resident messages, in the order they began; this is
+    # where the first of them starts, or the end of the document when none is drawn.
+    def window_end_cursor(self):
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(sum(self.window))
+        return cursor
+
+    def live_start(self, stream_id):
+        position = sum(self.window)
+        for key, live in self.lives.items():
+            if key == stream_id:
+                break
+            position += live["length"]
+        return position
+
+    def append_records(self, records, cursor=None):
+        if cursor is None:
+            cursor = self.end_cursor()
+        for record in records:
+            start = cursor.position()
+            self.insert_record(cursor, record)
+            self.window.append(cursor.position() - start)
+
+    def show_tail(self):
+        self.paging = True
+        try:
+            self.chat_display.clear()
+            self.window.clear()
+            self.window_start = max(len(self.transcript) - self.max_resident, 0)
+            self.append_records(self.transcript.read(self.window_start, len(self.transcript)))
+            self.attached = True
+            self.append_lives()
+            self.scroll_to_bottom()
+        finally:
+            self.paging = False
+
+    def on_scroll(self, value):
+        if self.paging:
+            return
+        scroll_bar = self.chat_display.verticalScrollBar()
+        if value <= scroll_bar.minimum() and self.window_start > 0:
+            self.page_up()
+        elif value >= scroll_bar.maximum() and not self.attached:
+            self.page_down()
+
+    # Paging keeps the resident count fixed: loading older messages drops as many of the
+    # newest ones, which are already on disk and come back when the user scrolls down again.
+    def page_up(self):
+        self.flush_stream()
+        count = min(self.page_size, self.window_start)
+        records = self.transcript.read(self.window_start - count, self.window_start)
+        self.paging = True
+        try:
+            anchor = self.viewport_anchor()
+            cursor = QTextCursor(self.chat_display.document())
+            lengths = []
+            for record in records:
+                start = cursor.position()
+                self.insert_record(cursor, record)
+                lengths.append(cursor.position() - start)
+            self.window.extendleft(reversed(lengths))
+            self.window_start -= len(records)
+
+            excess = len(self.window) - self.max_resident
+            if excess > 0:
+                self.drop_bottom(excess)
+            self.restore_anchor(anchor + sum(lengths))
+        finally:
+            self.paging = False
+
+    def page_down(self):
+        self.flush_stream()
+        end = self.window_start + len(self.window)
+        records = self.transcript.read(end, end + self.page_size)
+        self.paging = True
+        try:
+            anchor = self.viewport_anchor()
+            self.append_records(records)
+            if end + len(records) >= len(self.transcript):
+                self.attached = True
+                self.append_lives()
+
+            excess = len(self.window) - self.max_resident
+            if excess > 0:
+                anchor -= self.drop_top(excess)
+            self.restore_anchor(anchor)
+        finally:
+            self.paging = False
+
+    # A finished stream becomes an ordinary message. If streams that began earlier are still
+    # live above it, its text is moved up to the end of the window so the document keeps the
+    # transcript's order.
+    def finish_stream(self, stream_id=""):
+        self.flush_stream()
+        live = self.lives.get(stream_id)
+        if live is None:
+            return
+        start = self.live_start(stream_id)
+        del self.lives[stream_id]
+        record = {"type": "stream", "title": live["title"], "text": "".join(live["parts"])}
+        self.transcript.append(record)
+        if self.attached:
+            if start == sum(self.window):
+                self.window.append(live["length"])
+            else:
+                at_bottom = self.at_bottom()
+                self.remove_range(start, start + live["length"])
+                self.append_records([record], self.window_end_cursor())
+                if at_bottom:
+                    self.scroll_to_bottom()
+        self.trim_window()
+
+    def display_message(self, message, is_user=False):
+        self.flush_stream()
+        record = {"type": "message", "text": message, "is_user": is_user}
+        self.transcript.append(record)
+        if not self.attached:
+            if is_user:
+                self.show_tail()
+            return
+
+        self.append_records([record], self.window_end_cursor())
+        self.scroll_to_bottom()
+        self.trim_window()
+
+    def begin_stream(self, title, stream_id=""):
+        self.finish_stream(stream_id)
+        live = {"title": title, "parts": [], "length": 0}
+        self.lives[stream_id] = live
+        if self.attached:
+            at_bottom = self.at_bottom()
+            self.append_live(self.end_cursor(), live)
+            if at_bottom:
+                self.scroll_to_bottom()
+
+    # Chunks are only buffered here; flush_stream writes them to the document at most once
+    # per frame, so fast providers cost one insert and one scroll per frame instead of per token.
+    # Each stream id has its own buffer and its own live message, so jobs streaming at the
+    # same time never interleave.
+    def update_streaming_message(self, chunk, stream_id=""):
+        self.pending_chunks.setdefault(stream_id, []).append(chunk)
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush_stream(self):
+        if not self.pending_chunks:
+            self.flush_timer.stop()
+            return
+        pending, self.pending_chunks = self.pending_chunks, OrderedDict()
+        at_bottom = self.attached and self.at_bottom()
+        for stream_id, chunks in pending.items():
+            text = "".join(chunks)
+            live = self.lives.get(stream_id)
+            if live is None:
+                live = {"title": None, "parts": [], "length": 0}
+                self.lives[stream_id] = live
+            live["parts"].append(text)
+            if not self.attached:
+                continue
+            cursor = QTextCursor(self.chat_display.document())
+            cursor.setPosition(self.live_start(stream_id) + live["length"])
+            start = cursor.position()
+            cursor.insertText(text)
+            live["length"] += cursor.position() - start
+        if at_bottom:
+            self.scroll_to_bottom()
 
     def clear_chat(self):
+        self.pending_chunks.clear()
+        self.flush_timer.stop()
         self.chat_display.clear()
-        self.current_stream_message = ""
+        self.reset_transcript()
+
+    def load_records(self, records, focus=None):
+        self.clear_chat()
+        for record in records:
+            self.transcript.append(record)
+        if focus is None or not 0 <= focus < len(records):
+            self.show_tail()
+        else:
+            self.show_record(focus)
+
+    # Loads a window of the transcript around record index, selects that record and scrolls
+    # it to the top of the view. Paging in either direction works from there as usual.
+    def show_record(self, index):
+        self.paging = True
+        try:
+            self.chat_display.clear()
+            self.window.clear()
+            total = len(self.transcript)
+            self.window_start = max(min(index - self.page_size, total - self.max_resident), 0)
+            end = min(self.window_start + self.max_resident, total)
+            self.append_records(self.transcript.read(self.window_start, end))
+            self.attached = end == total
+            if self.attached:
+                self.append_lives()
+            lengths = list(self.window)
+            position = sum(lengths[:index - self.window_start])
+            cursor = QTextCursor(self.chat_display.document())
+            cursor.setPosition(position)
+            cursor.setPosition(position + lengths[index - self.window_start], QTextCursor.KeepAnchor)
+            self.chat_display.setTextCursor(cursor)
+            self.chat_display.verticalScrollBar().setValue(0)
+            self.restore_anchor(position)
+        finally:
+            self.paging = False
+
+    def close_transcript(self):
+        self.transcript.close()
+
+class ComparisonPane(QWidget):
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.pending = []
+        self.done = False
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        self.title_label = QLabel(model)
+        self.title_label.setStyleSheet("color: #e67e22; font-weight: bold;")
+        self.stats_label = QLabel("Waiting for first token...")
+        self.stats_label.setStyleSheet("color: #aaaaaa;")
+        self.display = QTextEdit()
+        self.display.setReadOnly(True)
+        self.display.setFont(QFont("Roboto", 10))
+        self.display.setStyleSheet("""
+            QTextEdit {
+                background-color: #1a1a1a;
+                color: #e0e0e0;
+                border: 1px solid #3d3d3d;
+                padding: 6px;
+            }
+        """)
+        self.highlighter = CodeHighlighter(self.display.document())
+        layout.addWidget(self.title_label)
+        layout.addWidget(self.stats_label)
+        layout.addWidget(self.display)
+
+    def flush(self):
+        if not self.pending:
+            return
+        text = "".join(self.pending)
+        self.pending = []
+        scroll_bar = self.display.verticalScrollBar()
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum() - 4
+        cursor = QTextCursor(self.display.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+    def text(self):
+        return self.display.toPlainText() + "".join(self.pending)
+
+# One pane per model for the compare mode. Each run gets a number so chunks that arrive
+# from a previous, abandoned comparison are dropped instead of landing in the new panes.
+class ComparisonView(QWidget):
+    comparison_finished = pyqtSignal(str)
+
+    def __init__(self, stream_fps=30, parent=None):
+        super().__init__(parent)
+        self.run = 0
+        self.label = "Comparison"
+        self.panes = []
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.splitter = QSplitter(Qt.Horizontal)
+        layout.addWidget(self.splitter)
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(max(int(1000 / stream_fps), 1))
+        self.flush_timer.timeout.connect(self.flush)
+
+    def start(self, models, label="Comparison"):
+        self.run += 1
+        self.label = label
+        for pane in self.panes:
+            pane.setParent(None)
+            pane.deleteLater()
+        self.panes = []
+        for model in models:
+            pane = ComparisonPane(model)
+            self.splitter.addWidget(pane)
+            self.panes.append(pane)
+        self.flush_timer.start()
+        return self.run
+
+    def pane(self, run, index):
+        if run != self.run or index >= len(self.panes):
+            return None
+        return self.panes[index]
+
+    @pyqtSlot(int, int, str)
+    def append_chunk(self, run, index, chunk):
+        pane = self.pane(run, index)
+        if pane is not None and not pane.done:
+            pane.pending.append(chunk)
+
+    @pyqtSlot(int, int, object)
+    def finish(self, run, index, summary):
+        pane = self.pane(run, index)
+        if pane is None:
+            return
+        if summary is None:
+            pane.stats_label.setText("Served from the response cache")
+        else:
+            pane.stats_label.setText(self.format_summary(summary))
+        self.complete(pane)
+
+    @pyqtSlot(int, int, str)
+    def fail(self, run, index, error):
+        pane = self.pane(run, index)
+        if pane is None:
+            return
+        pane.stats_label.setText(f"Failed: {error}")
+        pane.stats_label.setStyleSheet("color: #e74c3c;")
+        self.complete(pane)
+
+    def format_summary(self, summary):
+        parts = []
+        if summary["ttft_seconds"] is not None:
+            parts.append(f"TTFT {summary['ttft_seconds']:.2f}s")
+        parts.append(f"total {summary['total_seconds']:.2f}s")
+        if summary["tokens_per_second"] is not None:
+            parts.append(f"{summary['tokens_per_second']:.0f} tok/s")
+        if summary.get("prompt_tokens"):
+            parts.append(format_prompt_usage(summary))
+        if summary["status"] != "ok":
+            parts.append(summary["status"])
+        return ", ".join(parts)
+
+    def complete(self, pane):
+        pane.done = True
+        pane.flush()
+        if all(pane.done for pane in self.panes):
+            self.flush_timer.stop()
+            lines = [f"{pane.model}: {pane.stats_label.text()}" for pane in self.panes]
+            self.comparison_finished.emit(f"{self.label} finished:\n" + "\n".join(lines))
+
+    def flush(self):
+        for pane in self.panes:
+            pane.flush()
 
 class VisualizationWidget(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, settings=None, parent=None):
         super().__init__(parent)
+        settings = settings or {}
+        self.history = max(settings.get('chart_history', 200), 2)
+        self.incoming = deque()
+        self.samples = {}
+        self.series = {}
+        self.sequence = 0
         self.init_ui()
 
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(settings.get('chart_refresh_ms', 500))
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start()
+
     def init_ui(self):
         layout = QVBoxLayout(self)
 
-        self.chart = QChart()
-        self.chart.setAnimationOptions(QChart.SeriesAnimations)
-        self.chart.setTheme(QChart.ChartThemeDark)
+        self.chart_tabs = QTabWidget()
+        self.ttft_chart, self.ttft_axes = self.create_chart("Time to First Token", "Seconds")
+        self.rate_chart, self.rate_axes = self.create_chart("Output Speed", "Tokens/s")
+        layout.addWidget(self.chart_tabs)
+
+        self.stats_label = QLabel("No responses yet")
+        self.stats_label.setStyleSheet("color: #e0e0e0;")
+        self.stats_label.setWordWrap(True)
+        layout.addWidget(self.stats_label)
 
-        self.chart_view = QChartView(self.chart)
-        self.chart_view.setRenderHint(QPainter.Antialiasing)
+    def create_chart(self, title, unit):
+        chart = QChart()
+        chart.setAnimationOptions(QChart.NoAnimation)
+        chart.setTheme(QChart.ChartThemeDark)
+        chart.setTitle(title)
 
-        layout.addWidget(self.chart_view)
+        axis_x = QValueAxis()
+        axis_x.setLabelFormat("%d")
+        axis_x.setTitleText("Request")
+        axis_y = QValueAxis()
+        axis_y.setTitleText(unit)
+        chart.addAxis(axis_x, Qt.AlignBottom)
+        chart.addAxis(axis_y, Qt.AlignLeft)
 
-    def update_chart(self, data):
-        QMetaObject.invokeMethod(self, "update_chart_internal", Qt.QueuedConnection, Q_ARG(dict, data))
+        chart_view = QChartView(chart)
+        chart_view.setRenderHint(QPainter.Antialiasing)
+        self.chart_tabs.addTab(chart_view, title)
+        return chart, (axis_x, axis_y)
 
-    @pyqtSlot(dict)
-    def update_chart_internal(self, data):
-        self.chart.removeAllSeries()
-        for axis in self.chart.axes():
-            self.chart.removeAxis(axis)
+    def add_series(self, chart, axes, model):
+        series = QLineSeries()
+        series.setName(model)
+        chart.addSeries(series)
+        series.attachAxis(axes[0])
+        series.attachAxis(axes[1])
+        return series
 
-        bar_series = QBarSeries()
-        line_series = {}
+    # Called from streaming threads via the telemetry listener; the GUI thread picks the
+    # samples up on the next refresh tick, so a burst of responses costs one redraw.
+    def record(self, summary):
+        if summary["status"] == "ok" and summary["ttft_seconds"] is not None:
+            self.incoming.append(summary)
 
-        for model, times in data.items():
-            bar_set = QBarSet(model)
-            bar_set.append(sum(times))
-            bar_series.append(bar_set)
+    def refresh(self):
+        if not self.incoming:
+            return
 
-            line = QLineSeries()
-            line.setName(f"{model} (per round)")
-            for i, time in enumerate(times):
-                line.append(i, time)
-            line_series[model] = line
+        while self.incoming:
+            summary = self.incoming.popleft()
+            model = summary["model"]
+            self.sequence += 1
+            if model not in self.samples:
+                self.samples[model] = deque(maxlen=self.history)
+                self.series[model] = (self.add_series(self.ttft_chart, self.ttft_axes, model),
+                                      self.add_series(self.rate_chart, self.rate_axes, model))
+            self.samples[model].append((self.sequence, summary["ttft_seconds"], summary["tokens_per_second"]))
 
-        self.chart.addSeries(bar_series)
-        for line in line_series.values():
-            self.chart.addSeries(line)
+            ttft_series, rate_series = self.series[model]
+            ttft_series.append(self.sequence, summary["ttft_seconds"])
+            if summary["tokens_per_second"] is not None:
+                rate_series.append(self.sequence, summary["tokens_per_second"])
+            for series in (ttft_series, rate_series):
+                if series.count() > self.history:
+                    series.removePoints(0, series.count() - self.history)
 
-        axis_x = QBarCategoryAxis()
-        axis_x.append(list(data.keys()))
-        self.chart.addAxis(axis_x, Qt.AlignBottom)
-        bar_series.attachAxis(axis_x)
+        self.update_axes()
+        self.update_stats()
 
-        axis_y = QValueAxis()
-        axis_y.setTitleText("Response Time (s)")
-        self.chart.addAxis(axis_y, Qt.AlignLeft)
-        bar_series.attachAxis(axis_y)
+    def update_axes(self):
+        first = min(samples[0][0] for samples in self.samples.values())
+        for index, axes in ((1, self.ttft_axes), (2, self.rate_axes)):
+            values = [sample[index] for samples in self.samples.values() for sample in samples
+                      if sample[index] is not None]
+            axes[0].setRange(first, max(self.sequence, first + 1))
+            axes[1].setRange(0, max(values) * 1.1 if values else 1)
 
-        for line in line_series.values():
-            line.attachAxis(axis_x)
-            line.attachAxis(axis_y)
+    def update_stats(self):
+        lines = []
+        for model, samples in self.samples.items():
+            ttft = [sample[1] for sample in samples]
+            rates = [sample[2] for sample in samples if sample[2] is not None]
+            line = f"{model}: TTFT p50 {percentile(ttft, 0.5):.2f}s, p90 {percentile(ttft, 0.9):.2f}s"
+            if rates:
+                line += f" | {percentile(rates, 0.5):.0f} tok/s p50, {percentile(rates, 0.1):.0f} tok/s p10"
+            lines.append(line)
+        self.stats_label.setText("\n".join(lines))
 
-        self.chart.setTitle("Model Response Times")
-        self.chart_view.setChart(self.chart)
\ No newline at end of file
+    def clear(self):
+        self.incoming.clear()
+        self.samples.clear()
+        for ttft_series, rate_series in self.series.values():
+            self.ttft_chart.removeSeries(ttft_series)
+            self.rate_chart.removeSeries(rate_series)
+        self.series.clear()
+        self.sequence = 0
+        self.stats_label.setText("No responses yet")
\ No newline at end of file
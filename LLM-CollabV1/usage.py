@@ -0,0 +1,28 @@
+import threading
+
+USAGE_FIELDS = ("prompt_tokens", "cached_tokens", "cache_write_tokens", "output_tokens")
+
+# Fields stay None until the provider reports them, so a provider that reports nothing is
+# never mistaken for one that used no tokens.
+def empty_usage():
+    return dict.fromkeys(USAGE_FIELDS)
+
+class UsageTracker:
+    def __init__(self):
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def record(self, model, usage):
+        with self.lock:
+            totals = self.totals.setdefault(model, dict(dict.fromkeys(USAGE_FIELDS, 0), requests=0))
+            totals["requests"] += 1
+            for field in USAGE_FIELDS:
+                totals[field] += usage.get(field) or 0
+
+    def stats(self):
+        with self.lock:
+            stats = {model: dict(totals) for model, totals in self.totals.items()}
+        for totals in stats.values():
+            prompt_tokens = totals["prompt_tokens"]
+            totals["cache_hit_ratio"] = totals["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+        return stats